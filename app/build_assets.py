@@ -0,0 +1,100 @@
+# Offline asset pipeline: resized WebP/AVIF variants of the images and a subsetted woff2 of the title font.
+# Outputs go to app/static/build/ together with manifest.json, which index.html reads (through http_caching)
+# to emit srcset / image-set() / preload tags. Without a manifest the page falls back to the original files.
+#
+# Runs fully offline. Build-time only dependencies (not needed to serve the app): pillow, fonttools, brotli
+# Usage: python -m app.build_assets
+
+import json
+import os
+
+from PIL import Image, features
+from fontTools import subset
+
+from app.http_caching import ASSET_BUILD_DIR, ASSET_MANIFEST_PATH
+
+# Source image (under app/static) -> widths to generate. Widths above the original size are skipped.
+IMAGE_WIDTHS = {
+    "background1.jpg": [640, 1280, 1920],
+    "ocarina_link_nobg.png": [250, 500],
+}
+
+# Encoder settings per output format
+IMAGE_FORMATS = {
+    "avif": {"quality": 55},
+    "webp": {"quality": 80, "method": 6},
+}
+
+# Source font (under fonts/) -> output name of its subset
+FONTS = {
+    "HyliaSerifBeta-Regular.woff": "HyliaSerifBeta-Regular.subset.woff2",
+}
+
+# The title font is only used for headings and buttons: printable ASCII, Latin-1 letters and typographic quotes
+FONT_UNICODES = list(range(0x20, 0x7F)) + list(range(0xA0, 0x100)) + [0x2018, 0x2019, 0x201C, 0x201D, 0x2026]
+
+
+def build_image(name: str, widths: list[int]) -> dict:
+    source_path = os.path.join("app/static", name)
+    stem = os.path.splitext(name)[0]
+    entry = {"width": None, "variants": {}}
+
+    with Image.open(source_path) as image:
+        entry["width"] = image.width
+        # Keep transparency for PNGs, everything else is encoded as RGB
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+
+        for image_format, options in IMAGE_FORMATS.items():
+            if image_format == "avif" and not features.check("avif"):
+                print(f"Skipping AVIF for {name}: this Pillow build has no AVIF encoder")
+                continue
+
+            variants = []
+            for width in widths:
+                if width > image.width:
+                    continue
+                height = round(image.height * width / image.width)
+                resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+                output_name = f"{stem}-{width}.{image_format}"
+                resized.save(os.path.join(ASSET_BUILD_DIR, output_name), format=image_format.upper(), **options)
+                variants.append({"url": f"/static/build/{output_name}", "width": width})
+                print(f"{output_name}: {os.path.getsize(os.path.join(ASSET_BUILD_DIR, output_name))} bytes")
+            entry["variants"][image_format] = variants
+
+    print(f"{name}: {os.path.getsize(source_path)} bytes originally")
+    return entry
+
+
+def build_font(name: str, output_name: str) -> str:
+    options = subset.Options()
+    options.flavor = "woff2"
+    options.layout_features = ["kern", "liga"]
+    options.desubroutinize = True
+
+    font = subset.load_font(os.path.join("fonts", name), options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=FONT_UNICODES)
+    subsetter.subset(font)
+    subset.save_font(font, os.path.join(ASSET_BUILD_DIR, output_name), options)
+
+    print(f"{output_name}: {os.path.getsize(os.path.join(ASSET_BUILD_DIR, output_name))} bytes (from {os.path.getsize(os.path.join('fonts', name))})")
+    return f"/static/build/{output_name}"
+
+
+def build_assets() -> dict:
+    os.makedirs(ASSET_BUILD_DIR, exist_ok=True)
+    manifest = {"images": {}, "fonts": {}}
+
+    for name, widths in IMAGE_WIDTHS.items():
+        manifest["images"][f"/static/{name}"] = build_image(name, widths)
+    for name, output_name in FONTS.items():
+        manifest["fonts"][f"/fonts/{name}"] = build_font(name, output_name)
+
+    with open(ASSET_MANIFEST_PATH, "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Wrote {ASSET_MANIFEST_PATH}")
+    return manifest
+
+
+if __name__ == "__main__":
+    build_assets()
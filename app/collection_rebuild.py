@@ -0,0 +1,199 @@
+# Zero-downtime collection rebuild (blue/green).
+# A new versioned collection is built next to the live one while the live one keeps serving query_db.
+# When the copy is complete the alias pointer is switched atomically; the previous collection is kept for rollback.
+# By default the new version is partitioned into per-game shards (see database.shard_keys).
+#
+# Usage:
+#   python -m app.collection_rebuild rebuild --batch-size 100 --concurrency 4 [--layout sharded|single]
+#   python -m app.collection_rebuild rollback
+#   python -m app.collection_rebuild status
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.database import (
+    chroma_client, get_collection, read_alias, write_alias, embed_documents,
+    shard_name, shard_keys, version_collections,
+)
+from app.near_duplicates import fingerprint_fields
+from app.post_chunks import chunk_records, is_chunk
+from app.config import CHUNK_EMBEDDINGS, CHUNK_WORDS, CHUNK_TOP_COMMENTS
+
+
+# Posts stored before near-duplicate detection get their fingerprint on the way to the new version
+def with_fingerprint(metadata: dict) -> dict:
+    if metadata is None or "simhash" in metadata:
+        return metadata
+    return {**metadata, **fingerprint_fields(metadata.get("original_title", ""), metadata.get("content", ""))}
+
+
+# Chunk records for posts stored before chunk embeddings were enabled, built from the stored content and comments
+# (the stored content is the first 1000 characters of the post)
+def missing_chunk_records(records: list[dict]) -> list[dict]:
+    chunked = {record["metadata"]["chunk_of"] for record in records if is_chunk(record["metadata"])}
+    added = []
+    for record in records:
+        metadata = record["metadata"]
+        if not metadata or is_chunk(metadata) or record["id"] in chunked:
+            continue
+        comments = metadata["comments"].split(" | ") if metadata.get("comments") else []
+        added += [
+            {"id": chunk_id, "document": document, "metadata": chunk_metadata}
+            for chunk_id, document, chunk_metadata in chunk_records(
+                record["id"], record["document"], metadata, metadata.get("content", ""), comments, CHUNK_WORDS, CHUNK_TOP_COMMENTS)
+        ]
+    return added
+
+
+# Read every record of a version (all of its shards) page by page.
+# Documents + metadatas only: embeddings are recomputed, or reused from the embedding store.
+def read_all_records(version: str, page_size: int = 500) -> list[dict]:
+    records = []
+    for collection in version_collections(version):
+        offset = 0
+        while True:
+            page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                break
+            for i, record_id in enumerate(page["ids"]):
+                records.append({
+                    "id": record_id,
+                    "document": page["documents"][i],
+                    "metadata": with_fingerprint(page["metadatas"][i]),
+                })
+            offset += len(page["ids"])
+    return records
+
+
+# Collection a record belongs to in the target version
+def target_collection(target_name: str, record: dict, sharded: bool):
+    if not sharded:
+        return get_collection(target_name)
+    game = record["metadata"].get("game") if record["metadata"] else None
+    return get_collection(shard_name(target_name, game if game in shard_keys() else None))
+
+
+# Embed and add one batch of records to the target version
+def copy_batch(target_name: str, batch: list[dict], sharded: bool) -> int:
+    embeddings = embed_documents([record["document"] for record in batch])  # Served from the embedding store when the text was embedded before
+
+    # Group the batch by destination collection (one group unless sharded)
+    groups = {}
+    for record, embedding in zip(batch, embeddings):
+        collection = target_collection(target_name, record, sharded)
+        groups.setdefault(collection.name, (collection, []))[1].append((record, embedding))
+
+    for collection, items in groups.values():
+        collection.add(
+            ids=[record["id"] for record, _ in items],
+            documents=[record["document"] for record, _ in items],
+            embeddings=[embedding for _, embedding in items],
+            metadatas=[record["metadata"] for record, _ in items],
+        )
+    return len(batch)
+
+
+# Copy records into the target version in batches, with up to `concurrency` batches in flight
+def copy_records(target_name: str, records: list[dict], batch_size: int, concurrency: int, sharded: bool) -> int:
+    batches = [records[i:i + batch_size] for i in range(0, len(records), batch_size)]
+    copied = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for count in executor.map(lambda batch: copy_batch(target_name, batch, sharded), batches):
+            copied += count
+            print(f"Copied {copied}/{len(records)} posts")
+    return copied
+
+
+def version_count(version: str) -> int:
+    return sum(collection.count() for collection in version_collections(version))
+
+
+# Seconds to wait after the alias swap before the last catch-up, for writes to the old version still in flight
+SWAP_GRACE_SECONDS = 2.0
+
+
+# Copy the records of the source version that are not in the target yet (ids in copied_ids). Returns how many.
+def catch_up(source_name: str, target_name: str, copied_ids: set, batch_size: int, concurrency: int, sharded: bool) -> int:
+    late_records = [record for record in read_all_records(source_name) if record["id"] not in copied_ids]
+    if CHUNK_EMBEDDINGS:
+        late_records += missing_chunk_records(late_records)
+    if late_records:
+        print(f"Catching up on {len(late_records)} posts added during the rebuild")
+        copy_records(target_name, late_records, batch_size, concurrency, sharded)
+        copied_ids.update(record["id"] for record in late_records)
+    return len(late_records)
+
+
+# Build a new versioned collection from the live one and swap the alias to it
+def rebuild(batch_size: int = 100, concurrency: int = 4, layout: str = "sharded") -> str:
+    alias = read_alias()
+    source_name = alias["active"]
+    target_name = f"posts_v{time.strftime('%Y%m%d%H%M%S')}"
+    sharded = layout == "sharded"
+
+    print(f"Rebuilding '{source_name}' into '{target_name}' ({layout} layout, batch size {batch_size}, concurrency {concurrency})")
+    start = time.time()
+    records = read_all_records(source_name)
+    if CHUNK_EMBEDDINGS:
+        records += missing_chunk_records(records)
+    copy_records(target_name, records, batch_size, concurrency, sharded)
+
+    # Catch up on posts that were ingested into the live collection while the copy was running
+    copied_ids = {record["id"] for record in records}
+    catch_up(source_name, target_name, copied_ids, batch_size, concurrency, sharded)
+
+    # Register the layout before counting, so the target's shards are the ones counted
+    sharded_versions = alias["sharded"] + ([target_name] if sharded else [])
+    write_alias(source_name, previous=alias.get("previous"), sharded=sharded_versions)
+
+    if version_count(target_name) < version_count(source_name):
+        raise RuntimeError(f"Rebuild incomplete: '{target_name}' has {version_count(target_name)} posts, '{source_name}' has {version_count(source_name)}")
+
+    write_alias(target_name, previous=source_name)
+
+    # Posts stored into the old version between the catch-up and the swap (or by writers that looked up the
+    # alias just before it) are copied over once those writes have landed
+    time.sleep(SWAP_GRACE_SECONDS)
+    catch_up(source_name, target_name, copied_ids, batch_size, concurrency, sharded)
+    print(f"Rebuild finished in {time.time() - start:.1f}s")
+    return target_name
+
+
+# Point the alias back at the previous collection (and remember the current one, so rollback can be undone)
+def rollback() -> str:
+    alias = read_alias()
+    if not alias.get("previous"):
+        raise RuntimeError("No previous collection recorded, nothing to roll back to")
+    write_alias(alias["previous"], previous=alias["active"])
+    return alias["previous"]
+
+
+def status() -> None:
+    alias = read_alias()
+    print(f"Active: {alias['active']}")
+    print(f"Previous: {alias.get('previous')}")
+    for collection in chroma_client.list_collections():
+        print(f"  {collection.name}: {collection.count()} posts")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Blue/green rebuild of the posts collection")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    rebuild_parser = subparsers.add_parser("rebuild", help="Build a new versioned collection and switch the alias to it")
+    rebuild_parser.add_argument("--batch-size", type=int, default=100, help="Posts embedded and added per batch")
+    rebuild_parser.add_argument("--concurrency", type=int, default=4, help="Batches processed in parallel")
+    rebuild_parser.add_argument("--layout", choices=["sharded", "single"], default="sharded",
+                                help="Per-game shards, or one mixed collection filtered by game")
+
+    subparsers.add_parser("rollback", help="Switch the alias back to the previous collection")
+    subparsers.add_parser("status", help="Show the alias pointer and the stored collections")
+
+    args = parser.parse_args()
+    if args.command == "rebuild":
+        rebuild(batch_size=args.batch_size, concurrency=args.concurrency, layout=args.layout)
+    elif args.command == "rollback":
+        rollback()
+    else:
+        status()
@@ -8,6 +8,102 @@ REDDIT_CLIENT_ID = os.getenv("REDDIT_CLIENT_ID")
 REDDIT_CLIENT_SECRET = os.getenv("REDDIT_CLIENT_SECRET")
 REDDIT_USER_AGENT = os.getenv("REDDIT_USER_AGENT")
 
+# Reddit endpoints (point both at a local stand-in server for tests: python -m app.reddit_standin)
+REDDIT_OAUTH_URL = os.getenv("REDDIT_OAUTH_URL", "https://oauth.reddit.com")
+REDDIT_URL = os.getenv("REDDIT_URL", "https://www.reddit.com")
+
+# "lean": one request per post returning only its top comments (bounded by limit and depth), parsed from the raw JSON.
+# "full": load the whole PRAW comment forest and sort it in Python (previous behaviour).
+REDDIT_COMMENT_MODE = os.getenv("REDDIT_COMMENT_MODE", "lean")
+REDDIT_COMMENT_DEPTH = int(os.getenv("REDDIT_COMMENT_DEPTH", "1"))
+
 # OpenAI API keys
 OPENAI_KEY = os.getenv("OPENAI_KEY")
-OPENAI_KEY_DB = os.getenv("OPENAI_KEY_DB")
\ No newline at end of file
+OPENAI_KEY_DB = os.getenv("OPENAI_KEY_DB")
+
+# OpenAI-compatible endpoint (unset: api.openai.com). Load tests point it at the fake backends: python -m app.fake_backends
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+
+# Web search used to find Reddit post ids: DuckDuckGo (DDGS) when unset, otherwise a JSON search endpoint
+# returning {"results": [{"href", "title", "body"}]} (e.g. the fake backends' /search)
+WEB_SEARCH_URL = os.getenv("WEB_SEARCH_URL") or None
+
+# Token budget for the post context packed into the /summary prompt
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET", "3000"))
+
+# Generate a digest for every ingested post in the background (served posts always get one).
+# Off by default: one fetch can store several hundred posts, most of which are never served.
+DIGEST_ON_INGEST = os.getenv("DIGEST_ON_INGEST", "false").lower() == "true"
+
+# Seconds a query is remembered as "fetched recently, nothing useful" (no relevant posts / every source failed)
+NEGATIVE_CACHE_TTL_SECONDS = int(os.getenv("NEGATIVE_CACHE_TTL_SECONDS", "1800"))
+NEGATIVE_CACHE_ERROR_TTL_SECONDS = int(os.getenv("NEGATIVE_CACHE_ERROR_TTL_SECONDS", "120"))
+NEGATIVE_CACHE_MAX_ENTRIES = int(os.getenv("NEGATIVE_CACHE_MAX_ENTRIES", "10000"))   # Oldest entries are dropped beyond this
+
+# Seconds /query waits for DuckDuckGo and Reddit when fetching new posts. Sources that finish later are stored in the background.
+FETCH_BUDGET_SECONDS = float(os.getenv("FETCH_BUDGET_SECONDS", "20"))
+# Seconds after the budget that late sources may keep fetching in the background (their posts are still stored)
+FETCH_BACKGROUND_SECONDS = float(os.getenv("FETCH_BACKGROUND_SECONDS", "120"))
+
+# Fetched posts embedded before /query answers (the best ones by lexical pre-ranking). The rest are embedded
+# in the background afterwards, or dropped when PRERANK_DEFER_REST is false.
+PRERANK_TOP_K = int(os.getenv("PRERANK_TOP_K", "60"))
+PRERANK_DEFER_REST = os.getenv("PRERANK_DEFER_REST", "true").lower() == "true"
+
+# Startup warm-up: popular queries run through retrieval and rendering before /ready reports ready
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_QUERIES_PATH = os.getenv("WARMUP_QUERIES_PATH", "app/data/warmup_queries.json")
+WARMUP_SUMMARIES = os.getenv("WARMUP_SUMMARIES", "false").lower() == "true"   # Also generate and cache their summaries (LLM calls)
+
+# Multi-worker mode (uvicorn --workers N): workers read the vector index through a Chroma server and hand every
+# write to the single ingestion writer (python -m app.ingest_writer) through a SQLite job queue.
+CHROMA_SERVER_URL = os.getenv("CHROMA_SERVER_URL")                   # e.g. http://127.0.0.1:8001 (unset: local persistent client)
+INGEST_MODE = os.getenv("INGEST_MODE", "inline")                     # "inline": this process writes, "queue": the ingestion writer does
+INGEST_WAIT_SECONDS = float(os.getenv("INGEST_WAIT_SECONDS", "30"))  # Max wait for the writer to store a fetched batch
+
+# Session/summary caches and negative cache shared by all worker processes, plus the ingestion job queue
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", "app/data/shared_state.sqlite3")
+
+# Group commit: posts stored by concurrent requests are gathered and written together once a group holds
+# GROUP_COMMIT_MAX_POSTS posts or GROUP_COMMIT_WINDOW_SECONDS have passed since its first submission
+GROUP_COMMIT_MAX_POSTS = int(os.getenv("GROUP_COMMIT_MAX_POSTS", "64"))
+GROUP_COMMIT_WINDOW_SECONDS = float(os.getenv("GROUP_COMMIT_WINDOW_SECONDS", "0.05"))
+
+# Quantized title index: search compact codes (float16, int8 or pq) held in memory instead of Chroma's float32 index,
+# then re-score the best QUANTIZED_RESCORE_CANDIDATES hits with their full-precision vectors (0: no re-scoring).
+# Chroma still loads its own index, so the codes are extra memory (bytes per post: float16 3072, int8 1536, pq PQ_SUBVECTORS).
+# New posts are picked up within QUANTIZED_REFRESH_SECONDS. Compare the modes on the query log first: python -m app.quantization_eval
+QUANTIZED_INDEX = os.getenv("QUANTIZED_INDEX", "none")              # "none", "float16", "int8" or "pq"
+QUANTIZED_RESCORE_CANDIDATES = int(os.getenv("QUANTIZED_RESCORE_CANDIDATES", "50"))
+PQ_SUBVECTORS = int(os.getenv("PQ_SUBVECTORS", "96"))                # Bytes per vector in pq mode (must divide 1536)
+QUANTIZED_REFRESH_SECONDS = float(os.getenv("QUANTIZED_REFRESH_SECONDS", "5"))
+
+# Questions served by /query are appended here (JSON lines) for offline evaluation. Off by default (the file is not
+# rotated): set e.g. QUERY_LOG_PATH=app/data/query_log.jsonl while collecting queries to evaluate.
+QUERY_LOG_PATH = os.getenv("QUERY_LOG_PATH", "")
+
+# Near-duplicate posts (reposts, crossposts): "link" (default) stores them marked with the URL of the original, "skip"
+# does not store them (their own body and comments are lost), "off" disables detection.
+# Search results collapse near-duplicates unless "off", so linked reposts are stored but shown once.
+NEAR_DUPLICATE_MODE = os.getenv("NEAR_DUPLICATE_MODE", "link")
+NEAR_DUPLICATE_MAX_DISTANCE = int(os.getenv("NEAR_DUPLICATE_MAX_DISTANCE", "3"))   # Max differing SimHash bits (of 64)
+
+# On-demand request profiling (see app/request_profiler.py): /query and /summary requests sent with the header
+# X-Profile-Token: <PROFILE_ADMIN_TOKEN>, or sampled at PROFILE_SAMPLE_RATE, are profiled into PROFILE_DIR
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")                 # Empty: the header is ignored
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))         # Fraction of requests profiled at random
+PROFILE_DIR = os.getenv("PROFILE_DIR", "app/data/profiles")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))         # Stack sampling interval
+
+# Queries whose game is recognised locally with at least this confidence (1.0 exact, lower for misspellings) are routed
+# to subreddits without an LLM call (see app/subreddit_router.py and app/data/subreddit_index.json)
+SUBREDDIT_ROUTER_MIN_CONFIDENCE = float(os.getenv("SUBREDDIT_ROUTER_MIN_CONFIDENCE", "0.85"))
+
+# Chunk embeddings (see app/post_chunks.py): besides its title, each post's content (in CHUNK_WORDS-word pieces) and its
+# top CHUNK_TOP_COMMENTS comments are embedded as extra records, so questions answered in a body or comment are found
+# in the database instead of being fetched. Hits are aggregated per post: "max" ranks a post by its closest hit,
+# "sum" by the summed similarity of all its hits. Run a rebuild to add chunks to posts stored before enabling it.
+CHUNK_EMBEDDINGS = os.getenv("CHUNK_EMBEDDINGS", "false").lower() == "true"
+CHUNK_WORDS = int(os.getenv("CHUNK_WORDS", "120"))
+CHUNK_TOP_COMMENTS = int(os.getenv("CHUNK_TOP_COMMENTS", "5"))
+CHUNK_AGGREGATION = os.getenv("CHUNK_AGGREGATION", "max")             # "max" or "sum"
@@ -0,0 +1,145 @@
+import re
+
+# Packs the cached posts into a token budget before they are sent to the summary model.
+# Post content is split into sentences (table rows count as one line each) and comments are kept whole.
+# Every piece is scored by lexical overlap with the query, near-identical comments are dropped,
+# and the highest scoring pieces are kept until the budget is used up. Kept pieces stay in their original order.
+
+# Rough token estimate used for budgeting (OpenAI models average ~4 characters per token for English text)
+CHARS_PER_TOKEN = 4
+
+# Comments sharing at least this fraction of their words with an already kept comment are treated as repeats
+DUPLICATE_THRESHOLD = 0.6
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "do", "does", "for", "from", "how", "i", "if", "in",
+    "is", "it", "its", "me", "my", "of", "on", "or", "so", "that", "the", "there", "this", "to", "was", "what",
+    "when", "where", "which", "who", "why", "with", "you", "your",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+# Lowercased content words of a text (stopwords removed, trailing plural 's' stripped like score_post does)
+def content_words(text: str) -> set[str]:
+    words = set()
+    for word in re.findall(r"\w+", text.lower()):
+        if word in STOPWORDS:
+            continue
+        if word.endswith("s") and len(word) > 3:
+            word = word[:-1]
+        words.add(word)
+    return words
+
+
+# Split post content into sentences. Line breaks also split, so each table row is its own unit.
+def split_sentences(content: str) -> list[str]:
+    pieces = re.split(r"(?<=[.!?])\s+|\n+", content)
+    return [piece.strip() for piece in pieces if piece.strip()]
+
+
+# Fraction of the query's words found in the text, with a small bonus for denser matches
+def relevance(text_words: set[str], query_words: set[str]) -> float:
+    if not query_words or not text_words:
+        return 0.0
+    overlap = len(text_words & query_words)
+    return overlap / len(query_words) + overlap / (len(text_words) + 10)
+
+
+def is_repeat(words: set[str], kept: list[set[str]]) -> bool:
+    for other in kept:
+        union = words | other
+        if union and len(words & other) / len(union) >= DUPLICATE_THRESHOLD:
+            return True
+    return False
+
+
+# Same layout post_summary_generation uses, so token counts before and after packing are comparable
+def format_posts_for_prompt(posts: list[dict]) -> str:
+    blocks = []
+    for i, post in enumerate(posts, 1):
+        block = f"POST {i}:\nTitle: {post.get('title', 'No title')}\n"
+        content = post.get("content", "").strip()
+        block += f"Content: {content}\n" if content else "Content: No content available\n"
+        comments = post.get("comments", [])
+        if comments:
+            block += "Comments:\n"
+            for j, comment in enumerate(comments[:5], 1):
+                block += f"  {j}. {comment.strip()}\n"
+        else:
+            block += "Comments: No comments available\n"
+        blocks.append(block + "\n" + "-" * 50 + "\n\n")
+    return "".join(blocks)
+
+
+# Pack posts into `token_budget` tokens. Returns the packed posts and how many tokens were saved.
+def pack_context(posts: list[dict], query: str, token_budget: int) -> dict:
+    query_words = content_words(query)
+    tokens_before = estimate_tokens(format_posts_for_prompt(posts))
+
+    # Titles are always kept: they are short and tell the model what each post is about
+    used = estimate_tokens(format_posts_for_prompt([{"title": post.get("title", "No title")} for post in posts]))
+
+    # Candidate pieces: (score, post index, kind, position, text, words)
+    candidates = []
+    for post_index, post in enumerate(posts):
+        for position, sentence in enumerate(split_sentences(post.get("content", "") or "")):
+            words = content_words(sentence)
+            candidates.append((relevance(words, query_words), post_index, "content", position, sentence, words))
+        for position, comment in enumerate(post.get("comments", []) or []):
+            if comment.strip():
+                words = content_words(comment)
+                # Comments are already ordered by Reddit score, so earlier ones get a slight edge on ties
+                candidates.append((relevance(words, query_words) + 0.01 / (position + 1), post_index, "comments", position, comment.strip(), words))
+
+    # Equal scores are interleaved across posts (earlier pieces first) so one long post cannot take the whole budget
+    candidates.sort(key=lambda c: (-c[0], c[3], c[1]))
+
+    kept = {}   # (post index, kind) -> list of (position, text)
+    kept_comment_words = []
+    seen_sentences = set()
+    duplicates_dropped = 0
+    for score, post_index, kind, position, text, words in candidates:
+        if kind == "content":
+            normalized = " ".join(text.lower().split())
+            if normalized in seen_sentences:
+                duplicates_dropped += 1
+                continue
+            seen_sentences.add(normalized)
+        else:
+            if is_repeat(words, kept_comment_words):
+                duplicates_dropped += 1
+                continue
+            if len(kept.get((post_index, kind), [])) >= 5:   # The prompt shows at most 5 comments per post
+                continue
+
+        cost = estimate_tokens(text) + 2   # Separator / numbering overhead
+        if used + cost > token_budget:
+            continue
+        used += cost
+        kept.setdefault((post_index, kind), []).append((position, text))
+        if kind == "comments":
+            kept_comment_words.append(words)
+
+    packed_posts = []
+    for post_index, post in enumerate(posts):
+        packed = dict(post)
+        sentences = [text for _, text in sorted(kept.get((post_index, "content"), []))]
+        packed["content"] = "\n".join(sentences)
+        packed["comments"] = [text for _, text in sorted(kept.get((post_index, "comments"), []))]
+        packed_posts.append(packed)
+
+    tokens_after = estimate_tokens(format_posts_for_prompt(packed_posts))
+    print(f"Context packing: {tokens_before} -> {tokens_after} tokens (budget {token_budget}, {duplicates_dropped} repeats dropped)")
+
+    return {
+        "posts": packed_posts,
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "tokens_saved": max(0, tokens_before - tokens_after),
+        "duplicates_dropped": duplicates_dropped,
+    }
@@ -1,141 +1,560 @@
 import chromadb
 import chromadb.utils.embedding_functions as embedding_functions
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 
-from app.config import OPENAI_KEY_DB
+from urllib.parse import urlparse
+
+from app.config import OPENAI_KEY_DB, OPENAI_BASE_URL, DIGEST_ON_INGEST, CHROMA_SERVER_URL, INGEST_MODE, INGEST_WAIT_SECONDS, SHARED_STATE_PATH
+from app.config import GROUP_COMMIT_MAX_POSTS, GROUP_COMMIT_WINDOW_SECONDS
+from app.config import QUANTIZED_INDEX, QUANTIZED_RESCORE_CANDIDATES, PQ_SUBVECTORS, QUANTIZED_REFRESH_SECONDS
+from app.config import NEAR_DUPLICATE_MODE, NEAR_DUPLICATE_MAX_DISTANCE
+from app.config import CHUNK_EMBEDDINGS, CHUNK_WORDS, CHUNK_TOP_COMMENTS, CHUNK_AGGREGATION
+from app.embedding_store import EmbeddingStore
+from app.group_writer import GroupCommitWriter
+from app.ingest_queue import IngestQueue
+from app.post_digests import DigestWorker
+from app.quantized_index import QuantizedIndex
+from app.near_duplicates import BAND_FIELDS, fingerprint_fields, hamming_distance, collapse_near_duplicates
+from app.game_matcher import SUPPORTED_GAMES, matcher as game_matcher
+from app.post_chunks import chunk_records, is_chunk, aggregate_post_hits
 
 # Create the persistent collection object "chroma_client"
-chroma_client = chromadb.PersistentClient("app/data/posts_db")  
+# In multi-worker mode every process goes through one Chroma server instead of opening the files itself
+if CHROMA_SERVER_URL:
+    _server = urlparse(CHROMA_SERVER_URL)
+    chroma_client = chromadb.HttpClient(host=_server.hostname, port=_server.port or 8000, ssl=_server.scheme == "https")
+else:
+    chroma_client = chromadb.PersistentClient("app/data/posts_db")  
+
+# Writes handed to the single ingestion writer when INGEST_MODE is "queue"
+ingest_queue = IngestQueue(SHARED_STATE_PATH)
+
+# Embedding model used for both stored titles and queries
+EMBEDDING_MODEL = "text-embedding-3-small"
 
 # Define the embedding function using OpenAI's embedding model
 openai_ef = embedding_functions.OpenAIEmbeddingFunction(
                 api_key=OPENAI_KEY_DB,
-                model_name="text-embedding-3-small"
+                model_name=EMBEDDING_MODEL,
+                api_base=OPENAI_BASE_URL
             )
 
-# Create the collection using the object
-collection = chroma_client.get_or_create_collection(name="posts", embedding_function=openai_ef)
+# Persistent store of document embeddings keyed by hash(model, text), consulted before calling the API
+embedding_store = EmbeddingStore("app/data/embedding_store.sqlite3")
+
+# Name of the original (unversioned) collection, served when no rebuild has been swapped in yet
+DEFAULT_COLLECTION = "posts"
+
+# Alias pointer: records which versioned collection is live and which one it replaced (for rollback).
+# Rebuilds write a new versioned collection next to the live one and then switch this pointer.
+ALIAS_PATH = "app/data/collection_alias.json"
+
+_alias_lock = threading.Lock()
+_alias_cache = {"mtime": None, "state": None}
+_collections = {}
+
+
+# Read the alias pointer. Re-read only when the file changes, so a swap made by the rebuild command
+# (possibly in another process) is picked up by the next query.
+def read_alias() -> dict:
+    try:
+        mtime = os.stat(ALIAS_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return {"active": DEFAULT_COLLECTION, "previous": None, "sharded": []}
+
+    with _alias_lock:
+        if _alias_cache["mtime"] != mtime:
+            with open(ALIAS_PATH, "r") as f:
+                _alias_cache["state"] = json.load(f)
+            _alias_cache["mtime"] = mtime
+        state = dict(_alias_cache["state"])
+    state.setdefault("sharded", [])
+    return state
+
+
+# Atomically point the alias at a collection (write to a temp file, then rename over the old pointer).
+# `sharded` lists the versions stored as per-game shards rather than one mixed collection.
+def write_alias(active: str, previous: str = None, sharded: list[str] = None) -> None:
+    if sharded is None:
+        sharded = read_alias()["sharded"]
+    tmp_path = f"{ALIAS_PATH}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"active": active, "previous": previous, "sharded": sharded}, f)
+    os.replace(tmp_path, ALIAS_PATH)
+    print(f"Collection alias now points to '{active}' (previous: '{previous}')")
+
+
+# Get a collection by name (defaults to the live one behind the alias). Handles are cached per name.
+def get_collection(name: str = None):
+    if name is None:
+        name = read_alias()["active"]
+    if name not in _collections:
+        _collections[name] = chroma_client.get_or_create_collection(name=name, embedding_function=openai_ef)
+    return _collections[name]
+
+
+# Shard holding posts from subreddits that are not mapped to a game
+OTHER_SHARD = "other"
+
+
+# Games that get their own shard in a sharded layout (plus the "other" shard)
+def shard_keys() -> list[str]:
+    return sorted(SUPPORTED_GAMES) + [OTHER_SHARD]
+
+
+# Name of a game's shard within a versioned layout. Example: posts_v20250101120000__botw
+def shard_name(version: str, game: str = None) -> str:
+    return f"{version}__{(game or OTHER_SHARD).lower()}"
+
+
+def is_sharded(version: str) -> bool:
+    return version in read_alias()["sharded"]
+
+
+# All collections that make up a version: its per-game shards, or the single mixed collection
+def version_collections(version: str = None) -> list:
+    if version is None:
+        version = read_alias()["active"]
+    if is_sharded(version):
+        return [get_collection(shard_name(version, game)) for game in shard_keys()]
+    return [get_collection(version)]
+
+
+# The collection a post for `game` is stored in. Single-collection layouts keep every game together.
+def collection_for_game(game: str = None, version: str = None):
+    if version is None:
+        version = read_alias()["active"]
+    if is_sharded(version):
+        return get_collection(shard_name(version, game if game in shard_keys() else None))
+    return get_collection(version)
+
+
+# Background digest generation; each job looks up its post's collection when it runs (the live version at that time)
+digest_worker = DigestWorker(collection_for_game)
+
 
 # Delete existing collection to start fresh (For refreshing during testing purposes)
-def delete_collection():
+# Prefer the rebuild command (python -m app.collection_rebuild), which keeps the live collection serving.
+def delete_collection(name: str = DEFAULT_COLLECTION):
     try:
-        chroma_client.delete_collection(name="posts")
+        chroma_client.delete_collection(name=name)
+        _collections.pop(name, None)
         print("Deleted existing collection to start fresh with enhanced embedding")
     except Exception as e:
         print("Could not delete the collection:", e)
 
 
-# Embed posts into the database
-def embed_text(posts: list[dict]) -> None:
+# Embed documents, reusing stored vectors for texts that were embedded before (re-ingestion, rebuilds, crossposts)
+def embed_documents(texts: list[str]) -> list[list[float]]:
+    return embedding_store.get_or_compute(EMBEDDING_MODEL, texts, openai_ef)
+
+
+# Game of a post, determined by its subreddit (the abbreviation, or None for subreddits not tied to one supported game)
+def post_game(post: dict) -> str:
+    game = game_matcher.game_for_subreddit(post.get("subreddit", "unknown"))
+    return game if game in SUPPORTED_GAMES else None
+
+
+# Record stored for a post: (collection, document, metadata). Documents are the title, enhanced with the game abbreviation.
+def post_record(post: dict):
+    # Determine game metadata based on subreddit
+    game_metadata = post_game(post)
+
+    # Posts are routed to their game's shard (or the single live collection if it is not sharded)
+    collection = collection_for_game(game_metadata)
+
+    # Get the original title
+    original_title = post["title"]
+
+    # Add abbreviation of game to title if it's from a game-related subreddit and doesn't already contain it
+    # Example: query: "best weapon in botw", title: "best weapon", enhanced title: "best weapon BOTW"
+    title_for_embedding = original_title
+    if game_metadata and not game_matcher.mentions(original_title, game_metadata):
+        title_for_embedding = f"{original_title} {game_metadata}"
+        print(f"Enhanced title: '{original_title}' -> '{title_for_embedding}'")
+
+    content = post.get("content", "")
+    if content and len(content) > 1000:
+        content = content[:1000]  # Truncate to first 1000 chars if post content is too long.
+    post["content"] = content
+
+    # Convert comments list to string for ChromaDB compatibility
+    comments = post.get("comments", [])
+    comments_str = " | ".join(comments) if comments else ""  # Join comments with separator
+
+    metadata = {
+        "url": post["url"],                             # url of post
+        "subreddit": post.get("subreddit", "unknown"),  # subreddit the post comes from
+        "content": post.get("content", ""),             # Content of the post
+        "score": post.get("_score", 0),                 # Score of the post (the distance)
+        "original_title": original_title,               # Title of the post
+        "comments": comments_str,                       # Store comments as string
+        "created_utc": created_timestamp(post),          # Post creation timestamp (numeric, for time-window filters)
+        "game": game_metadata,                          # The game name related to the post
+    }
+    metadata.update(fingerprint_fields(original_title, content))   # SimHash of title + content, for near-duplicate detection
+    return collection, title_for_embedding, {key: value for key, value in metadata.items() if value is not None}  # Chroma rejects None values (e.g. posts from subreddits with no game)
+
+
+# Creation time of a post as a float, so every stored timestamp can be compared in a numeric metadata filter
+def created_timestamp(post: dict) -> float:
+    try:
+        return float(post["created_utc"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+# URLs of the given posts that are already stored (one lookup per collection)
+def stored_urls(posts: list[dict]) -> set[str]:
+    urls_by_collection = {}
     for post in posts:
+        collection = collection_for_game(post_game(post))
+        urls_by_collection.setdefault(collection.name, (collection, []))[1].append(post["url"])
+
+    stored = set()
+    for collection, urls in urls_by_collection.values():
+        stored.update(collection.get(ids=urls, include=[])["ids"])
+    return stored
+
+
+# Near-duplicates among records (post, collection, document, metadata) about to be stored: {record index: original URL}.
+# Candidates are the stored posts sharing a SimHash band with the batch (one lookup per collection) and the earlier records.
+def find_near_duplicates(records: list[tuple]) -> dict[int, str]:
+    indexes_by_collection = {}
+    for i, (_, collection, _, metadata) in enumerate(records):
+        if "simhash" in metadata:
+            indexes_by_collection.setdefault(collection.name, (collection, []))[1].append(i)
+
+    duplicates = {}
+    for collection, indexes in indexes_by_collection.values():
+        where = {"$or": [{field: {"$in": sorted({records[i][3][field] for i in indexes})}} for field in BAND_FIELDS]}
         try:
-            # Check if post already exists based on url (unique identifier)
-            existing = collection.query(
-                query_texts=["dummy"],
-                n_results=1,
-                where={"url": post["url"]}
+            stored = collection.get(where=where, include=["metadatas"])
+        except Exception as e:
+            print(f"Error looking up near-duplicates in {collection.name}: {e}")
+            stored = {"ids": [], "metadatas": []}
+
+        # (URL of the original, fingerprint)
+        candidates = [
+            (metadata.get("duplicate_of") or url, int(metadata["simhash"], 16))
+            for url, metadata in zip(stored["ids"], stored["metadatas"]) if metadata and metadata.get("simhash")
+        ]
+        for i in indexes:
+            fingerprint = int(records[i][3]["simhash"], 16)
+            original = next(
+                (url for url, other in candidates if hamming_distance(fingerprint, other) <= NEAR_DUPLICATE_MAX_DISTANCE), None
             )
-            
-            if len(existing['ids'][0]) == 0:  # Post doesn't exist
-                
-                # Get the original title and subreddit
-                original_title = post["title"]
-                subreddit = post.get("subreddit", "unknown").lower()
-                
-                # Define game mappings: subreddits -> (abbreviation, full_names_to_check)
-                game_mappings = {
-                    # Breath of the Wild
-                    'breath_of_the_wild': ('BOTW', ['botw', 'breath of the wild']),
-                    'botw': ('BOTW', ['BOTW', 'breath of the wild']),
-                    'breathofthewild': ('BOTW', ['botw', 'breath of the wild']),
-                    
-                    # Tears of the Kingdom
-                    'tears_of_the_kingdom': ('TOTK', ['totk', 'tears of the kingdom']),
-                    'totk': ('TOTK', ['TOTK', 'tears of the kingdom']),
-                    'tearsofthekingdom': ('TOTK', ['totk', 'tears of the kingdom']),
-                }
-                
-                # Determine game metadata based on subreddit
-                game_metadata = None
-                if subreddit in game_mappings:
-                    game_metadata = game_mappings[subreddit][0]  # Use the abbreviation as game metadata
-                
-                # Add abbreviation of game to title if it's from a game-related subreddit and doesn't already contain it
-                # Example: query: "best weapon in botw", title: "best weapon", enhanced title: "best weapon BOTW"
-                title_for_embedding = original_title
-                if subreddit in game_mappings:
-                    #abbreviation_full = game_mappings[subreddit][1][1]
-                    abbreviation, terms_to_check = game_mappings[subreddit]
-                    # Check if any of the terms are already in the title (case insensitive)
-                    if not any(term in original_title.lower() for term in terms_to_check):
-                        title_for_embedding = f"{original_title} {abbreviation}"
-                        print(f"Enhanced title: '{original_title}' -> '{title_for_embedding}'")
-
-                content = post.get("content", "")
-                if content and len(content) > 1000:
-                    content = content[:1000]  # Truncate to first 1000 chars if post content is too long.
-                post["content"] = content
-                
-                # Convert comments list to string for ChromaDB compatibility
-                comments = post.get("comments", [])
-                comments_str = " | ".join(comments) if comments else ""  # Join comments with separator
-                
-                collection.add(
-                    documents=[title_for_embedding],    # Use enhanced title for embedding
-                    ids=[post["url"]],                  # Use URL as unique ID
-                    embeddings=[openai_ef([title_for_embedding])[0]],
-                    metadatas=[{
-                        "url": post["url"],                             # url of post
-                        "subreddit": post.get("subreddit", "unknown"),  # subreddit the post comes from
-                        "content": post.get("content", ""),             # Content of the post
-                        "score": post.get("_score", 0),                 # Score of the post (the distance)
-                        "original_title": original_title,               # Title of the post
-                        "comments": comments_str,                       # Store comments as string
-                        "created_utc": post.get("created_utc"),         # Store post creation timestamo
-                        "game": game_metadata,                          # The game name related to the post
-                    }]
-                )
-                    
+            if original:
+                duplicates[i] = original
+            else:
+                candidates.append((records[i][0]["url"], fingerprint))
+    return duplicates
+
+
+# Embed posts into the database in one batch: one existence check per collection, one embedding request, one add per collection.
+# Returns the posts that could not be stored: {url: exception} (their record could not be built, or their collection's
+# add failed). A failed embedding request raises, as no post of the batch is stored then.
+def embed_text(posts: list[dict]) -> dict[str, Exception]:
+    # Check if posts already exist based on url (unique identifier, also used as the id)
+    existing = stored_urls(posts)
+
+    records = []
+    failed = {}
+    full_contents = {}   # url -> content before post_record truncates it (chunked in full)
+    for post in posts:
+        if post["url"] in existing:
+            continue
+        existing.add(post["url"])   # Also skips repeats within the batch
+        try:
+            full_contents[post["url"]] = post.get("content", "")
+            records.append((post,) + post_record(post))
         except Exception as e:
             print(f"Error embedding post {post.get('title', 'unknown')}: {e}")
+            failed[post["url"]] = e
 
-# Query the database for retrieving similar posts to the query
-def query_db(query: str, n_results: int = 10, game_filter: str = None):
+    # Reposts and crossposts of stored posts (or of earlier posts in the batch) are skipped, or linked to the original
+    if NEAR_DUPLICATE_MODE != "off" and records:
+        duplicates = find_near_duplicates(records)
+        if NEAR_DUPLICATE_MODE == "skip":
+            records = [record for i, record in enumerate(records) if i not in duplicates]
+        else:
+            for i, original_url in duplicates.items():
+                records[i][3]["duplicate_of"] = original_url
+        if duplicates:
+            print(f"Near-duplicates: {len(duplicates)} posts {'skipped' if NEAR_DUPLICATE_MODE == 'skip' else 'linked'}")
+    if not records:
+        return failed
 
-    # Normalize query so that mentions of full game names are converted / augmented with
-    # the same abbreviations used when embedding titles (ensures better vector matches).
-    query_lower = query.lower()
-    game_aliases = {
-        'botw': ['botw', 'breath of the wild'],
-        'totk': ['totk', 'tears of the kingdom']
+    # Records to add per collection: (id, document, metadata), each post's title record followed by its chunk records
+    groups = {}
+    for post, collection, document, metadata in records:
+        items = [(post["url"], document, metadata)]
+        if CHUNK_EMBEDDINGS:
+            items += chunk_records(post["url"], document, metadata, full_contents[post["url"]], post.get("comments", []),
+                                   CHUNK_WORDS, CHUNK_TOP_COMMENTS)
+        groups.setdefault(collection.name, (collection, []))[1].extend(items)
+
+    embeddings = iter(embed_documents([document for _, items in groups.values() for _, document, _ in items]))
+
+    for collection, items in groups.values():
+        item_embeddings = [next(embeddings) for _ in items]
+        try:
+            collection.add(
+                ids=[record_id for record_id, _, _ in items],           # Post URL (title record) or URL#chunk<n>
+                documents=[document for _, document, _ in items],       # Enhanced title, or title + chunk text
+                embeddings=item_embeddings,
+                metadatas=[metadata for _, _, metadata in items]
+            )
+        except Exception as e:
+            print(f"Error embedding {len(items)} records into {collection.name}: {e}")
+            failed.update({url: e for url, _, metadata in items if not is_chunk(metadata)})
+            continue
+
+        if DIGEST_ON_INGEST:
+            for url, _, metadata in items:
+                if not is_chunk(metadata):
+                    digest_worker.submit(metadata.get("game"), url)
+    return failed
+
+
+# Every write of fetched posts in this process goes through one group-commit writer, so concurrent requests share writes
+group_writer = GroupCommitWriter(embed_text, max_batch=GROUP_COMMIT_MAX_POSTS, max_wait=GROUP_COMMIT_WINDOW_SECONDS)
+
+
+# Store fetched posts and wait until they are queryable: through the group-commit writer,
+# or in multi-worker mode through the ingestion writer process. Raises if some of the posts could not be stored.
+def store_posts(posts: list[dict]) -> None:
+    if INGEST_MODE != "queue":
+        group_writer.submit(posts).result()
+        return
+    job_id = ingest_queue.submit("posts", posts)
+    if not ingest_queue.wait([job_id], timeout=INGEST_WAIT_SECONDS):
+        print(f"Ingestion writer has not stored job {job_id} after {INGEST_WAIT_SECONDS}s, continuing without it")
+        return
+    error = ingest_queue.error(job_id)
+    if error:
+        raise RuntimeError(f"Ingestion job {job_id} failed: {error}")
+
+
+# Queue background digest generation for served posts that do not have a digest yet
+def queue_missing_digests(posts: list[dict]) -> None:
+    for post in posts:
+        if not post.get("digest"):
+            if INGEST_MODE == "queue":
+                ingest_queue.submit("digest", {"url": post["url"], "game": post.get("game")}, dedup_key=f"digest:{post['url']}")
+            else:
+                digest_worker.submit(post.get("game"), post["url"])
+
+
+# Served posts with the digests generated since they were served (posts cached at /query time may predate them)
+def with_stored_digests(posts: list[dict]) -> list[dict]:
+    missing = {}
+    for post in posts:
+        if not post.get("digest"):
+            collection = collection_for_game(post.get("game"))
+            missing.setdefault(collection.name, (collection, []))[1].append(post["url"])
+
+    digests = {}
+    for collection, urls in missing.values():
+        records = collection.get(ids=urls, include=["metadatas"])
+        digests.update({url: metadata["digest"] for url, metadata in zip(records["ids"], records["metadatas"]) if metadata and metadata.get("digest")})
+    return [{**post, "digest": digests[post["url"]]} if post["url"] in digests else post for post in posts]
+
+
+# Stored record of one post (looked up by its URL, the record id), searching every shard of the live version.
+# Returns (document, metadata), or None if the post is not stored.
+def get_post(url: str):
+    for collection in version_collections():
+        record = collection.get(ids=[url], include=["documents", "metadatas"])
+        if record["ids"]:
+            return record["documents"][0], record["metadatas"][0]
+    return None
+
+
+# Normalize query so that mentions of full game names are converted / augmented with
+# the same abbreviations used when embedding titles (ensures better vector matches).
+# Example: "best bow in tears of the kingdom" -> "best bow in tears of the kingdom TOTK"
+def augment_query_for_embedding(query: str) -> str:
+    query_for_embedding = game_matcher.analyze(query).query_for_embedding
+    if query_for_embedding != query:
+        print(f"Augmented query for embedding with game abbrev: {query_for_embedding[len(query):].strip()}")
+    return query_for_embedding
+
+
+# Time windows of the `metric` parameter of /query, in seconds ("all" and unknown values: no window)
+METRIC_WINDOWS = {
+    "day": 86400,
+    "week": 604800,
+    "month": 2592000,
+    "year": 31536000,
+}
+
+
+# Earliest creation time of the posts a query with this metric may return (None: any time)
+def metric_cutoff(metric: str, now: float = None) -> float:
+    window = METRIC_WINDOWS.get(metric)
+    if window is None:
+        return None
+    return (now if now is not None else time.time()) - window
+
+
+# Metadata filter of a search: the game and/or the time window (None when unrestricted)
+def search_filter(game: str = None, created_after: float = None) -> dict:
+    conditions = []
+    if game:
+        conditions.append({"game": game})
+    if created_after is not None:
+        conditions.append({"created_utc": {"$gte": created_after}})
+    if len(conditions) > 1:
+        return {"$and": conditions}
+    return conditions[0] if conditions else None
+
+
+# Query the database for retrieving similar posts to the query.
+# With created_after (see metric_cutoff), only posts created since then are searched.
+def query_db(query: str, n_results: int = 10, game_filter: str = None, created_after: float = None):
+    return query_db_batch([query], n_results=n_results, game_filter=game_filter, created_after=created_after)[0]
+
+
+# Query the database for several queries about the same game at once: one embedding call for all of them (or the
+# query_embeddings given, see embed_queries), and one vector search (per shard) with multiple query embeddings.
+# Returns (documents, distances, metadatas) per query.
+# Near-duplicate hits are collapsed to the closest one, so twice as many hits are searched to still fill n_results.
+# With chunk embeddings a post can be hit several times (title, content, comments): hits are aggregated per post,
+# and CHUNK_HITS_PER_POST times as many hits are searched.
+def query_db_batch(queries: list[str], n_results: int = 10, game_filter: str = None, created_after: float = None,
+                   query_embeddings: list = None) -> list[tuple]:
+    candidates = n_results if NEAR_DUPLICATE_MODE == "off" else 2 * n_results
+    results = search_db_batch(queries, candidates * (CHUNK_HITS_PER_POST if CHUNK_EMBEDDINGS else 1), game_filter, created_after,
+                              query_embeddings)
+    results = posts_from_hits(results, candidates)
+    if NEAR_DUPLICATE_MODE == "off":
+        return results
+    return [
+        collapse_near_duplicates(documents, distances, metadatas, n_results, NEAR_DUPLICATE_MAX_DISTANCE)
+        for documents, distances, metadatas in results
+    ]
+
+
+# Search hits per post searched for, when posts have chunk records
+CHUNK_HITS_PER_POST = 4
+
+
+# Turn each query's hits into at most n_results posts (documents, distances, metadatas of the title records).
+# Chunk hits are aggregated with their post's other hits (CHUNK_AGGREGATION); posts only hit through a chunk are
+# loaded with one lookup per collection for the whole batch. Results without chunk hits are only truncated.
+def posts_from_hits(results: list[tuple], n_results: int) -> list[tuple]:
+    if not any(is_chunk(metadata) for _, _, metadatas in results for metadata in metadatas):
+        return [(documents[:n_results], distances[:n_results], metadatas[:n_results]) for documents, distances, metadatas in results]
+
+    ranked = [aggregate_post_hits(distances, metadatas, CHUNK_AGGREGATION)[:n_results] for _, distances, metadatas in results]
+    records = {
+        metadata["url"]: (document, metadata)
+        for documents, _, metadatas in results for document, metadata in zip(documents, metadatas)
+        if not is_chunk(metadata) and metadata and metadata.get("url")
     }
+    missing = {url for posts in ranked for url, _ in posts if url not in records}
+    if missing:
+        for collection in version_collections():
+            stored = collection.get(ids=sorted(missing), include=["documents", "metadatas"])
+            records.update({url: (document, metadata) for url, document, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"])})
+
+    merged = []
+    for posts in ranked:
+        posts = [(url, distance) for url, distance in posts if url in records]   # Chunks whose post is gone are dropped
+        merged.append((
+            [records[url][0] for url, _ in posts],
+            [distance for _, distance in posts],
+            [records[url][1] for url, _ in posts],
+        ))
+    return merged
+
+
+# Search embeddings of queries, in one embedding call (questions about different games can share it)
+def embed_queries(queries: list[str]) -> list:
+    return openai_ef([augment_query_for_embedding(query) for query in queries])
+
+
+def search_db_batch(queries: list[str], n_results: int, game_filter: str = None, created_after: float = None,
+                    query_embeddings: list = None) -> list[tuple]:
+
+    # Embed the queries for database search (unless the caller already did)
+    if query_embeddings is None:
+        query_embeddings = embed_queries(queries)
+
+    version = read_alias()["active"]
+
+    # Sharded layout: go straight to the game's shard, or fan out to every shard when no game was detected
+    if is_sharded(version):
+        if game_filter:
+            print(f"Searching shard for game: {game_filter}")
+            shards = [collection_for_game(game_filter, version)]
+        else:
+            shards = version_collections(version)
+        return query_shards(shards, query_embeddings, n_results, created_after)
 
-    # Build a query string for embedding that includes the abbreviation if a game term is present
-    # Enhances the query to improve matching (since post titles are stored with added abbreviations)
-    query_for_embedding = query
-    for abbrev, aliases in game_aliases.items():
-        for alias in aliases:
-            if alias in query_lower:
-                # append uppercase abbreviation if not already present
-                if abbrev.upper() not in query and abbrev not in query_lower:
-                    query_for_embedding = f"{query_for_embedding} {abbrev.upper()}"
-                    print(f"Augmented query for embedding with game abbrev: {abbrev.upper()}")
-                break
-    
-    # Embed the query for database search
-    query_embeddings = openai_ef(query_for_embedding)
-
-    # Build where clause for filtering searches by game (BOTW or TOTK)
-    where_clause = None
     if game_filter:
-        where_clause = {"game": game_filter}
         print(f"Filtering results for game: {game_filter}")
 
-    # Query the database for results
-    results = collection.query(
-        query_embeddings=query_embeddings,
-        n_results=n_results,
-        where=where_clause
-    )
+    # Query the database for results (the live collection behind the alias)
+    return search_collection(get_collection(version), query_embeddings, n_results, game=game_filter, created_after=created_after)
+
+
+# Quantized indexes per collection name, used instead of Chroma's own index when QUANTIZED_INDEX is set
+_quantized_indexes = {}
+_quantized_lock = threading.Lock()
+
+
+def quantized_index_for(collection) -> QuantizedIndex:
+    with _quantized_lock:
+        if collection.name not in _quantized_indexes:
+            _quantized_indexes[collection.name] = QuantizedIndex(QUANTIZED_INDEX, QUANTIZED_RESCORE_CANDIDATES, PQ_SUBVECTORS,
+                                                                 QUANTIZED_REFRESH_SECONDS)
+        return _quantized_indexes[collection.name]
+
+
+# Vector search in one collection, optionally restricted to a game and to posts created since `created_after`:
+# (documents, distances, metadatas) per query. Both restrictions are applied before the similarity search: Chroma
+# resolves the where clause on its metadata index (created_utc is a numeric field) and only searches the matching posts.
+def search_collection(collection, query_embeddings, n_results: int, game: str = None, created_after: float = None) -> list[tuple]:
+    if QUANTIZED_INDEX != "none":
+        return quantized_index_for(collection).search(collection, query_embeddings, n_results, game=game, created_after=created_after)
+
+    # Build where clause for filtering searches by game (BOTW or TOTK) and time window
+    where_clause = search_filter(game, created_after)
+    results = collection.query(query_embeddings=query_embeddings, n_results=n_results, where=where_clause)
+    return [
+        (results["documents"][i], results["distances"][i], results["metadatas"][i])
+        for i in range(len(query_embeddings))
+    ]
+
+
+# Query several shards in parallel and merge each query's hits by distance (closest first)
+def query_shards(shards: list, query_embeddings, n_results: int, created_after: float = None) -> list[tuple]:
+
+    # Hits of one shard: a list of (document, distance, metadata) per query
+    def query_shard(shard):
+        if shard.count() == 0:
+            return [[] for _ in query_embeddings]
+        results = search_collection(shard, query_embeddings, min(n_results, shard.count()), created_after=created_after)
+        return [list(zip(documents, distances, metadatas)) for documents, distances, metadatas in results]
+
+    if len(shards) == 1:
+        shard_hits = [query_shard(shards[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+            shard_hits = list(executor.map(query_shard, shards))
 
-    return results["documents"][0], results["distances"][0], results["metadatas"][0]
+    merged = []
+    for i in range(len(query_embeddings)):
+        hits = sorted((hit for hits in shard_hits for hit in hits[i]), key=lambda hit: hit[1])[:n_results]
+        documents = [hit[0] for hit in hits]
+        distances = [hit[1] for hit in hits]
+        metadatas = [hit[2] for hit in hits]
+        merged.append((documents, distances, metadatas))
+    return merged
@@ -0,0 +1,101 @@
+import hashlib
+import sqlite3
+import threading
+from array import array
+
+# Bounds of one embedding request (the API accepts at most 2048 inputs and 300k tokens per request).
+# Characters stand in for tokens: about 4 per token for English text.
+MAX_TEXTS_PER_REQUEST = 256
+MAX_CHARS_PER_REQUEST = 400000
+
+
+# Split texts into consecutive batches within the bounds of one embedding request
+def request_batches(texts: list[str], max_texts: int = MAX_TEXTS_PER_REQUEST, max_chars: int = MAX_CHARS_PER_REQUEST) -> list[list[str]]:
+    batches, batch, chars = [], [], 0
+    for text in texts:
+        if batch and (len(batch) == max_texts or chars + len(text) > max_chars):
+            batches.append(batch)
+            batch, chars = [], 0
+        batch.append(text)
+        chars += len(text)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+# Persistent, content-addressed store of document embeddings.
+# Vectors are keyed by a hash of (model name, exact text), so re-ingesting a post, rebuilding a collection,
+# or embedding a crosspost with an identical enhanced title reuses the stored vector instead of calling the API again.
+class EmbeddingStore:
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()   # sqlite connections are shared between request threads
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, "
+            "model TEXT NOT NULL, "
+            "dim INTEGER NOT NULL, "
+            "vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    # Key used to address a vector: sha256 of the model name and the exact text that was embedded
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+    # Returns {text: vector} for every text that already has a stored vector for this model
+    def get_many(self, model: str, texts: list[str]) -> dict[str, list[float]]:
+        keys = {self.key(model, text): text for text in texts}
+        found = {}
+        key_list = list(keys)
+
+        with self._lock:
+            # Chunked to stay under sqlite's bound parameter limit
+            for start in range(0, len(key_list), 500):
+                chunk = key_list[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[keys[key]] = vector.tolist()
+        return found
+
+    # Stores vectors as float32 blobs (the same precision Chroma keeps them in)
+    def put_many(self, model: str, items: dict[str, list[float]]) -> None:
+        rows = [
+            (self.key(model, text), model, len(vector), array("f", vector).tobytes())
+            for text, vector in items.items()
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, dim, vector) VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    # Returns one vector per text (in order). Only texts without a stored vector are sent to embed_fn, in as few calls
+    # as the request bounds allow. Each call's vectors are stored as soon as they arrive.
+    def get_or_compute(self, model: str, texts: list[str], embed_fn) -> list[list[float]]:
+        if not texts:
+            return []
+
+        found = self.get_many(model, texts)
+        missing = list(dict.fromkeys(text for text in texts if text not in found))   # Unique, order preserved
+
+        for batch in request_batches(missing):
+            computed = {text: array("f", vector).tolist() for text, vector in zip(batch, embed_fn(batch))}
+            self.put_many(model, computed)
+            found.update(computed)
+
+        print(f"Embedding store: {len(missing)} of {len(texts)} texts needed a new embedding")
+        return [found[text] for text in texts]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
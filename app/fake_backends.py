@@ -0,0 +1,128 @@
+# Fake OpenAI and web search backends with configurable latency, for load tests without network access or API costs
+# (see app/load_test.py). Together with the Reddit stand-in (app/reddit_standin.py) they replace every external service:
+#   POST /v1/embeddings           deterministic bag-of-words vectors: texts sharing words are close, like real embeddings
+#   POST /v1/chat/completions     canned answers for the subreddit finder, digests and summaries
+#   GET  /search                  web search results pointing at Reddit posts (used instead of DDGS when WEB_SEARCH_URL is set)
+#   GET  /stats                   requests served per endpoint
+#
+# Usage:
+#   python -m app.fake_backends --port 8091 --embeddings-latency-ms 150 --chat-latency-ms 2000 --search-latency-ms 400
+#   OPENAI_BASE_URL=http://127.0.0.1:8091/v1 WEB_SEARCH_URL=http://127.0.0.1:8091/search uvicorn app.main:app
+
+import asyncio
+import base64
+import hashlib
+import random
+import re
+import time
+
+import numpy as np
+from fastapi import FastAPI, Request
+
+app = FastAPI(title="Fake OpenAI and web search")
+
+EMBEDDING_DIMENSIONS = 1536
+
+# Latency of each backend: base seconds plus up to `jitter` seconds at random (set from the command line)
+latency = {
+    "embeddings": {"base": 0.0, "jitter": 0.0},
+    "chat": {"base": 0.0, "jitter": 0.0},
+    "search": {"base": 0.0, "jitter": 0.0},
+}
+
+stats = {}   # endpoint -> requests
+
+
+# Delays without blocking the event loop, so concurrent requests overlap like they do on the real services
+async def simulate_latency(endpoint: str) -> None:
+    stats[endpoint] = stats.get(endpoint, 0) + 1
+    delay = latency[endpoint]["base"] + random.random() * latency[endpoint]["jitter"]
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
+def embed(text: str) -> np.ndarray:
+    vector = np.zeros(EMBEDDING_DIMENSIONS, dtype=np.float32)
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % EMBEDDING_DIMENSIONS] += 1
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    await simulate_latency("embeddings")
+
+    data = []
+    for i, text in enumerate(texts):
+        vector = embed(text)
+        # The OpenAI SDK asks for base64 (packed little-endian float32) unless told otherwise
+        encoded = base64.b64encode(vector.astype("<f4").tobytes()).decode() if body.get("encoding_format") == "base64" else vector.tolist()
+        data.append({"object": "embedding", "index": i, "embedding": encoded})
+    return {"object": "list", "data": data, "model": body.get("model"), "usage": {"prompt_tokens": 0, "total_tokens": 0}}
+
+
+# Answer shaped like what each caller parses
+def chat_answer(prompt: str) -> str:
+    if "Return only a Python tuple" in prompt:
+        query = re.search(r"User query: (.*)", prompt).group(1).strip()
+        return repr((["tearsofthekingdom"], query))
+    if "Write a digest" in prompt:
+        return "Fake digest: the post asks a question and the comments agree on one answer."
+    return "**Short summary**\nFake summary of the posts.\n\n**Contents (what's in this reply)**\n- 1. Answer\n\n**1. Answer**\nFake answer."
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    prompt = body["messages"][-1]["content"]
+    await simulate_latency("chat")
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": chat_answer(prompt)}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+@app.get("/search")
+async def search(q: str, max_results: int = 10):
+    await simulate_latency("search")
+    rng = random.Random(q)
+    subreddit = re.search(r"site:reddit\.com/r/(\w+)", q)
+    subreddit = subreddit.group(1) if subreddit else "tearsofthekingdom"
+    results = []
+    for _ in range(min(max_results, 25)):
+        post_id = f"w{rng.randrange(36 ** 6):x}"
+        results.append({
+            "href": f"https://www.reddit.com/r/{subreddit}/comments/{post_id}/fake_result/",
+            "title": q,
+            "body": "",
+        })
+    return {"results": results}
+
+
+@app.get("/stats")
+def get_stats():
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake OpenAI and web search backends")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8091)
+    for endpoint in latency:
+        parser.add_argument(f"--{endpoint}-latency-ms", type=float, default=0, help=f"Base latency of {endpoint} requests")
+        parser.add_argument(f"--{endpoint}-jitter-ms", type=float, default=0, help=f"Extra random latency of {endpoint} requests")
+    args = parser.parse_args()
+    for endpoint in latency:
+        latency[endpoint]["base"] = getattr(args, f"{endpoint}_latency_ms") / 1000
+        latency[endpoint]["jitter"] = getattr(args, f"{endpoint}_jitter_ms") / 1000
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
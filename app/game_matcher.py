@@ -0,0 +1,198 @@
+import json
+import os
+from collections import namedtuple
+from functools import lru_cache
+
+# Game detection in one pass over the text: which games a query or title mentions, by name, alias or abbreviation.
+# Every name and abbreviation of data/subreddit_index.json and data/gaming_abbreviations.json is compiled once into an
+# Aho-Corasick automaton over normalized text (lowercase, punctuation as spaces), so matching costs the same whether
+# one game or 300 are known. Matches must cover whole words ("botw?" and "totk's" match, "totkfan" does not).
+# Terms that are also ordinary words only match as spelled in the data: abbreviations of up to 3 letters ("MM", "LA",
+# "LOL") and one-word names of games outside the index ("INSIDE", "Hades"). Longer abbreviations ("botw", "TotK")
+# match in any case.
+#
+# Used for:
+#   - the relevance check: the app only answers questions about SUPPORTED_GAMES
+#   - the game a query is about (database filter / shard)
+#   - query augmentation: a game named in full gets its abbreviation appended, like post titles
+#   - the game of a subreddit (posts are tagged and sharded by it)
+#   - subreddit routing (app/subreddit_router.py)
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+# Games the app answers questions about. Posts from their subreddits are tagged with the abbreviation.
+SUPPORTED_GAMES = ("BOTW", "TOTK")
+
+# Abbreviations up to this length only match as spelled in the data
+EXACT_ABBREVIATION_LENGTH = 3
+
+# A game mentioned in the text: game abbreviation, "name" or "abbreviation", the matched text and its position
+GameMatch = namedtuple("GameMatch", ["game", "kind", "text", "start", "end"])
+
+# Result of analyze(): every game mentioned (in order), the supported game the query is about (or None),
+# whether the query is about a supported game, and the text to embed for it
+QueryGames = namedtuple("QueryGames", ["games", "game", "related", "query_for_embedding"])
+
+
+# Lowercase words separated by single spaces, and for each character of the result its position in `text`
+def normalize_with_positions(text: str) -> tuple[str, list[int]]:
+    chars, positions = [], []
+    for i, char in enumerate(text):
+        lower = char.lower()
+        if char.isalnum() and len(lower) == 1:
+            chars.append(lower)
+            positions.append(i)
+        elif chars and chars[-1] != " ":
+            chars.append(" ")
+            positions.append(i)
+    if chars and chars[-1] == " ":
+        chars.pop()
+        positions.pop()
+    return "".join(chars), positions
+
+
+def normalize_term(text: str) -> str:
+    return normalize_with_positions(text)[0]
+
+
+class GameMatcher:
+
+    def __init__(self, index_path: str = os.path.join(DATA_DIR, "subreddit_index.json"),
+                 abbreviations_path: str = os.path.join(DATA_DIR, "gaming_abbreviations.json")):
+        with open(index_path, "r") as f:
+            index = json.load(f)
+        with open(abbreviations_path, "r") as f:
+            abbreviations = json.load(f)
+
+        self.games = {}            # abbreviation -> {"abbreviation", "name", "subreddits"}
+        self.subreddit_games = {}  # lowercase subreddit -> abbreviation (subreddits shared by several games are left out)
+        self.terms = {}            # normalized term -> {game: {"kind": "name" or "abbreviation", "spellings": set or None}}
+        by_name = {}               # normalized game name -> abbreviation
+
+        shared = set()
+        for entry in index:
+            game = entry["abbreviation"]
+            self.games[game] = {"abbreviation": game, "name": entry["game"], "subreddits": entry["subreddits"]}
+            by_name[normalize_term(entry["game"])] = game
+            for name in [entry["game"]] + entry.get("aliases", []):
+                # An alias containing the abbreviation ("zelda totk") counts as a mention of the abbreviation
+                self.add_term(name, game, "abbreviation" if normalize_term(game) in normalize_term(name).split() else "name")
+            self.add_abbreviation(game, game)
+            # "other_subreddits": older or smaller subreddits of the game, used to tag posts but not searched
+            for subreddit in entry["subreddits"] + entry.get("other_subreddits", []):
+                subreddit = subreddit.lower()
+                if self.subreddit_games.get(subreddit, game) != game:
+                    shared.add(subreddit)
+                self.subreddit_games[subreddit] = game
+        for subreddit in shared:
+            del self.subreddit_games[subreddit]
+
+        for abbreviation, full_name in abbreviations.items():
+            game = by_name.get(normalize_term(full_name))
+            one_word_name = False
+            if game is None:
+                game = by_name[normalize_term(full_name)] = abbreviation
+                self.games[game] = {"abbreviation": game, "name": full_name, "subreddits": []}
+                one_word_name = len(full_name.split()) == 1
+                self.add_term(full_name, game, "name", exact=one_word_name)
+            # A one-word name used as its own abbreviation ("INSIDE", "HADES") stays exact
+            self.add_abbreviation(abbreviation, game, exact=one_word_name and normalize_term(abbreviation) == normalize_term(full_name))
+
+        self.build_automaton()
+
+    # A term of a game. Exact terms only match as spelled (any of the spellings registered); a term registered both
+    # ways matches in any case. A term that is also an abbreviation of the game counts as one.
+    def add_term(self, text: str, game: str, kind: str, exact: bool = False) -> None:
+        term = normalize_term(text)
+        if not term:
+            return
+        entry = self.terms.setdefault(term, {}).setdefault(game, {"kind": kind, "spellings": set() if exact else None})
+        if kind == "abbreviation":
+            entry["kind"] = kind
+        if not exact:
+            entry["spellings"] = None
+        elif entry["spellings"] is not None:
+            entry["spellings"].add(text)
+
+    def add_abbreviation(self, abbreviation: str, game: str, exact: bool = False) -> None:
+        self.add_term(abbreviation, game, "abbreviation", exact=exact or len(abbreviation) <= EXACT_ABBREVIATION_LENGTH)
+
+    # Trie of the terms with failure links. Terms are stored with a space on each side, and the text is searched with
+    # a space on each side, so a term only matches whole words.
+    def build_automaton(self) -> None:
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]   # State -> terms ending there
+        for term in self.terms:
+            state = 0
+            for char in f" {term} ":
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].append(term)
+
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    # Games mentioned in the text, left to right; overlapping mentions keep the longest ("zelda totk" over "totk")
+    def find(self, text: str) -> list:
+        normalized, positions = normalize_with_positions(text)
+        candidates = []   # (start, end) in normalized text, term
+        state = 0
+        for i, char in enumerate(f" {normalized} "):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for term in self.output[state]:
+                end = i - 1   # End of the term in normalized text (the text was shifted by the leading space)
+                candidates.append((end - len(term), end, term))
+
+        matches = []
+        covered_until = 0
+        for start, end, term in sorted(candidates, key=lambda c: (c[0], c[0] - c[1])):
+            if start < covered_until:
+                continue
+            original = text[positions[start]:positions[end - 1] + 1]
+            for game, entry in self.terms[term].items():
+                if entry["spellings"] is None or original in entry["spellings"]:
+                    matches.append(GameMatch(game, entry["kind"], original, positions[start], positions[end - 1] + 1))
+                    covered_until = end
+                    break
+        return matches
+
+    # Everything the request handlers need to know about the games of a query, from one pass (cached per query)
+    @lru_cache(maxsize=4096)
+    def analyze(self, query: str) -> QueryGames:
+        matches = self.find(query)
+        games = tuple(dict.fromkeys(match.game for match in matches))
+        supported = [game for game in games if game in SUPPORTED_GAMES]
+
+        # Titles of posts from a game's subreddit are embedded with the game's abbreviation (see database.post_record):
+        # a query naming the game in full gets the abbreviation too, so both match
+        query_for_embedding = query
+        for game in supported:
+            kinds = {match.kind for match in matches if match.game == game}
+            if "abbreviation" not in kinds:
+                query_for_embedding = f"{query_for_embedding} {game}"
+
+        return QueryGames(games, supported[0] if supported else None, bool(supported), query_for_embedding)
+
+    # Abbreviation of the game a subreddit is dedicated to (None for general or unknown subreddits)
+    def game_for_subreddit(self, subreddit: str) -> str:
+        return self.subreddit_games.get((subreddit or "").lower())
+
+    def mentions(self, text: str, game: str) -> bool:
+        return any(match.game == game for match in self.find(text))
+
+
+matcher = GameMatcher()
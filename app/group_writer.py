@@ -0,0 +1,80 @@
+import threading
+import time
+from concurrent.futures import Future
+
+
+# Single in-process writer that gathers posts submitted by all concurrent requests and stores them in groups:
+# one existence check, one embedding request and one add per collection for the whole group, instead of one per request.
+# A group is written once it holds max_batch posts, or max_wait seconds after its first submission. A group never takes
+# more than max_batch posts (a single larger submission is written alone); later submissions wait for the next group.
+# submit() returns a Future resolved once the posts are stored (queryable), or failed with the write's exception
+# (the whole group's, or the one of a post of this submission that was not stored).
+class GroupCommitWriter:
+
+    def __init__(self, write_fn, max_batch: int = 64, max_wait: float = 0.05):
+        self.write_fn = write_fn      # Stores a list of posts, returns the ones not stored as {url: exception}
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.groups_written = 0
+        self._pending = []            # (posts, future) waiting for the next group
+        self._pending_posts = 0
+        self._first_pending_at = None
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def submit(self, posts: list[dict]) -> Future:
+        future = Future()
+        if not posts:
+            future.set_result(0)
+            return future
+
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            if not self._pending:
+                self._first_pending_at = time.time()
+            self._pending.append((posts, future))
+            self._pending_posts += len(posts)
+            self._cond.notify()
+        return future
+
+    # Take the next group once it is full or its time window has passed
+    def _next_group(self) -> list[tuple]:
+        with self._cond:
+            while True:
+                if self._pending:
+                    remaining = self._first_pending_at + self.max_wait - time.time()
+                    if self._pending_posts >= self.max_batch or remaining <= 0:
+                        size, posts = 1, len(self._pending[0][0])
+                        while size < len(self._pending) and posts + len(self._pending[size][0]) <= self.max_batch:
+                            posts += len(self._pending[size][0])
+                            size += 1
+                        group, self._pending = self._pending[:size], self._pending[size:]
+                        self._pending_posts -= posts
+                        # Submissions left over were waiting already: they go out in the next group without a new window
+                        return group
+                    self._cond.wait(timeout=remaining)
+                else:
+                    self._cond.wait()
+
+    def _run(self) -> None:
+        while True:
+            group = self._next_group()
+            posts = [post for group_posts, _ in group for post in group_posts]
+            try:
+                failed = self.write_fn(posts) or {}
+            except Exception as e:
+                print(f"Error writing group of {len(posts)} posts: {e}")
+                for _, future in group:
+                    future.set_exception(e)
+                continue
+
+            self.groups_written += 1
+            print(f"Group commit: {len(posts)} posts from {len(group)} submissions" + (f", {len(failed)} not stored" if failed else ""))
+            for group_posts, future in group:
+                error = next((failed[post["url"]] for post in group_posts if post.get("url") in failed), None)
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(len(group_posts))
@@ -0,0 +1,211 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+from functools import lru_cache
+from urllib.parse import parse_qs
+
+import brotli
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse
+
+# HTTP compression and cache validation for the app's responses and static assets.
+
+# URL prefix -> directory of each static mount (used to fingerprint asset URLs)
+STATIC_MOUNTS = {
+    "/static": "app/static",
+    "/fonts": "fonts",
+}
+
+# Fingerprinted URLs (?v=<content hash>) never change content, so browsers may keep them for a year.
+# Anything else is revalidated with its ETag / Last-Modified on every use (cheap 304s).
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "public, no-cache"
+
+# Content types worth compressing (images and woff/woff2 fonts are already compressed)
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "image/svg+xml", "font/ttf", "font/otf")
+
+# Precompressed siblings checked for static files, in order of preference: (encoding, file suffix)
+PRECOMPRESSED_VARIANTS = [("br", ".br"), ("gzip", ".gz")]
+
+# Output of the offline asset pipeline (python -m app.build_assets)
+ASSET_BUILD_DIR = "app/static/build"
+ASSET_MANIFEST_PATH = os.path.join(ASSET_BUILD_DIR, "manifest.json")
+
+
+# Encodings the client accepts (ignores q-values except an explicit q=0)
+def accepted_encodings(accept_encoding: str) -> set[str]:
+    encodings = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if name and params.strip().replace(" ", "") not in ("q=0", "q=0.0"):
+            encodings.add(name.strip().lower())
+    return encodings
+
+
+def is_compressible(content_type: str) -> bool:
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+# Compresses responses with brotli (preferred) or gzip, based on the client's Accept-Encoding.
+# Responses that are already encoded (precompressed static files), not compressible, or tiny are passed through.
+class CompressionMiddleware:
+
+    def __init__(self, app, minimum_size: int = 500, gzip_level: int = 6, brotli_quality: int = 5):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        encoding = "br" if "br" in accepted else "gzip" if "gzip" in accepted else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+        body_parts = []
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if "content-encoding" in headers or not is_compressible(headers.get("content-type", "")):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message   # Held back until the body is known
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body_parts.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(body_parts)
+            if len(body) >= self.minimum_size:
+                if encoding == "br":
+                    body = brotli.compress(body, quality=self.brotli_quality)
+                else:
+                    body = gzip.compress(body, compresslevel=self.gzip_level)
+                headers = MutableHeaders(raw=start_message["headers"])
+                headers["content-encoding"] = encoding
+                headers["content-length"] = str(len(body))
+                headers.add_vary_header("Accept-Encoding")
+                # The encoded bytes differ from the identity representation, so its validator becomes weak
+                if "etag" in headers and not headers["etag"].startswith("W/"):
+                    headers["etag"] = f"W/{headers['etag']}"
+
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+# StaticFiles that serves precompressed .br / .gz siblings when the client accepts them,
+# and sets Cache-Control according to whether the URL is fingerprinted.
+# ETag / Last-Modified and 304 handling come from Starlette's FileResponse / StaticFiles.
+class CachedStaticFiles(StaticFiles):
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+
+        # Media type comes from the original file name, not the .br / .gz variant
+        media_type = mimetypes.guess_type(str(full_path))[0] or "text/plain"
+        encoding = None
+        for variant_encoding, suffix in PRECOMPRESSED_VARIANTS:
+            variant_path = f"{full_path}{suffix}"
+            if variant_encoding in accepted and os.path.isfile(variant_path):
+                full_path, stat_result, encoding = variant_path, os.stat(variant_path), variant_encoding
+                break
+
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, media_type=media_type)
+        if encoding:
+            response.headers["content-encoding"] = encoding
+        response.headers["vary"] = "Accept-Encoding"
+
+        fingerprinted = "v" in parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        response.headers["cache-control"] = IMMUTABLE_CACHE if fingerprinted else REVALIDATE_CACHE
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+@lru_cache(maxsize=256)
+def _file_fingerprint(file_path: str, mtime_ns: int) -> str:
+    with open(file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+
+# Fingerprinted URL of a static asset, for templates: /static/index.css -> /static/index.css?v=3f2a9c0d1b7e
+def asset_url(url_path: str) -> str:
+    for prefix, directory in STATIC_MOUNTS.items():
+        if url_path.startswith(prefix + "/"):
+            file_path = os.path.join(directory, url_path[len(prefix) + 1:])
+            try:
+                return f"{url_path}?v={_file_fingerprint(file_path, os.stat(file_path).st_mtime_ns)}"
+            except OSError:
+                return url_path
+    return url_path
+
+
+@lru_cache(maxsize=4)
+def _read_manifest(mtime_ns: int) -> dict:
+    with open(ASSET_MANIFEST_PATH, "r") as f:
+        return json.load(f)
+
+
+# Manifest written by the asset pipeline, or an empty one if the pipeline has not been run
+def asset_manifest() -> dict:
+    try:
+        return _read_manifest(os.stat(ASSET_MANIFEST_PATH).st_mtime_ns)
+    except OSError:
+        return {"images": {}, "fonts": {}}
+
+
+# Optimized variants of an image in one format, as (fingerprinted url, width) pairs (empty if none were built)
+def image_variants(url_path: str, image_format: str) -> list[tuple[str, int]]:
+    image = asset_manifest()["images"].get(url_path, {})
+    return [(asset_url(variant["url"]), variant["width"]) for variant in image.get("variants", {}).get(image_format, [])]
+
+
+# srcset attribute value for an image's variants in one format. Example: "/static/build/a-640.webp?v=.. 640w, ..."
+def image_srcset(url_path: str, image_format: str) -> str:
+    return ", ".join(f"{url} {width}w" for url, width in image_variants(url_path, image_format))
+
+
+# Subsetted woff2 built for a font, or None
+def optimized_font(url_path: str) -> str:
+    font = asset_manifest()["fonts"].get(url_path)
+    return asset_url(font) if font else None
+
+
+# JSON response carrying a content ETag. A repeat request sending the same ETag in If-None-Match gets an empty 304.
+def etag_json_response(request: Request, payload: dict, cache_control: str = "private, no-cache") -> Response:
+    response = JSONResponse(payload)
+    etag = f'"{hashlib.sha256(response.body).hexdigest()[:32]}"'
+    headers = {"etag": etag, "cache-control": cache_control}
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return response
@@ -0,0 +1,182 @@
+import heapq
+import re
+import threading
+import time
+from app.database import store_posts, stored_urls
+from app.ranking_posts import compile_query, score_posts
+
+# Streaming ingestion of fetched posts with lexical pre-ranking. Scrapers put each post as soon as it is fetched, and a
+# dedup stage drops posts already stored in the database and keeps one copy per URL in this fetch: the one with the
+# higher pre-rank score (score_post), since sources return the same post with more or less content and comments.
+# Accepted posts wait in a heap ordered by their score against the compiled query. While the fetch is still running, an
+# embedding thread stores them in batches of up to batch_size (waiting up to max_wait to fill a batch), best first, so
+# network fetching and embedding overlap. At most `sync_limit` posts are embedded that way.
+# Once the fetchers are done (or the response budget is used up), select() stores the best of what is left, up to
+# `sync_limit` in total, and waits for the batches still in flight. The remaining posts are embedded in the background
+# afterwards, best first, or dropped (defer_rest=False) without any embedding call. Posts put after select() (late
+# sources) are embedded in the background as they arrive.
+#
+#   pipeline = IngestPipeline(query, sync_limit=60)
+#   pipeline.put(post)                    # from any number of producer threads
+#   pipeline.select(defer_rest=True)      # store the best posts left, queue or drop the rest
+#   pipeline.close()                      # no more posts; the embedding thread exits once nothing is left to embed
+
+
+class IngestPipeline:
+
+    def __init__(self, query: str = None, sync_limit: int = None, batch_size: int = 16, max_wait: float = 0.5):
+        self.compiled_query = compile_query(query) if query else None
+        self.sync_limit = sync_limit    # Posts stored before select() returns (None: all of them)
+        self.batch_size = batch_size    # Posts embedded per request by the embedding thread
+        self.max_wait = max_wait        # Seconds a partial batch waits for more posts while the fetch is running
+        self.received = 0               # Unique posts accepted by the dedup stage
+        self.stored = 0                 # Posts that went through store_posts
+        self.duplicates = 0
+        self.known = 0                  # Posts dropped because they are already stored
+        self.dropped = 0
+        self._pending = []              # Heap of (-pre-rank score, order, url)
+        self._pending_posts = {}        # url -> post waiting in the heap
+        self._first_pending_at = None   # When the oldest waiting post arrived
+        self._seen = set()              # Urls put so far (accepted, already stored or duplicates)
+        self._order = 0
+        self._early = 0                 # Posts taken by the embedding thread before select()
+        self._early_in_flight = 0       # Of those, batches not stored yet
+        self._selected = False
+        self._sync_done = False         # select() has stored its posts: background embedding may start
+        self._closed = False
+        self._lock = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def score(self, posts: list[dict]) -> list[float]:
+        return score_posts(posts, self.compiled_query) if self.compiled_query else [0] * len(posts)
+
+    # Dedup stage: runs in the producer's thread, so duplicates and stored posts never reach the heap
+    def put(self, post: dict) -> None:
+        url = post.get("url")
+        if not url:
+            return
+
+        # Extract subreddit if not present
+        if 'subreddit' not in post or not post['subreddit'] or post['subreddit'] == 'unknown':
+            match = re.search(r"reddit.com/r/([a-zA-Z0-9_]+)/", url)
+            post['subreddit'] = match.group(1) if match else 'unknown'
+
+        score = self.score([post])[0]
+        with self._lock:
+            if url in self._seen:
+                self.duplicates += 1
+                waiting = self._pending_posts.get(url)
+                if waiting is not None and score > self.score([waiting])[0]:
+                    self._pending_posts[url] = post
+                return
+            self._seen.add(url)
+
+        try:
+            known = url in stored_urls([post])
+        except Exception as e:
+            print(f"Error checking whether {url} is stored: {e}")
+            known = False
+
+        with self._lock:
+            if known:
+                self.known += 1
+                return
+            self.received += 1
+            self._push(score, post)
+
+    # Caller holds the lock
+    def _push(self, score: float, post: dict) -> None:
+        if not self._pending:
+            self._first_pending_at = time.time()
+        heapq.heappush(self._pending, (-score, self._order, post["url"]))
+        self._pending_posts[post["url"]] = post
+        self._order += 1
+        self._lock.notify_all()
+
+    # Caller holds the lock
+    def _pop(self, count: int) -> list[dict]:
+        batch = []
+        while self._pending and len(batch) < count:
+            _, _, url = heapq.heappop(self._pending)
+            batch.append(self._pending_posts.pop(url))
+        self._first_pending_at = time.time() if self._pending else None
+        return batch
+
+    # Posts the embedding thread may still take before select() (caller holds the lock)
+    def _early_budget(self) -> float:
+        return float("inf") if self.sync_limit is None else self.sync_limit - self._early
+
+    # Store the best waiting posts, up to `sync_limit` together with the ones embedded during the fetch, and wait until
+    # those are stored too. The rest is left to the embedding thread, or dropped when defer_rest is False.
+    def select(self, defer_rest: bool = True) -> None:
+        with self._lock:
+            self._selected = True
+            top = self._pop(self._early_budget())
+            if not defer_rest:
+                self.dropped += len(self._pending)
+                self._pending, self._pending_posts, self._first_pending_at = [], {}, None
+        if self.dropped:
+            print(f"Ingestion pipeline: {self.dropped} low ranked posts dropped without embedding")
+
+        try:
+            if top:
+                store_posts(top)
+        except Exception as e:
+            print(f"Error embedding the {len(top)} best ranked posts left: {e}")
+
+        with self._lock:
+            self.stored += len(top)
+            self._lock.wait_for(lambda: self._early_in_flight == 0)
+            # Background embedding starts after the best posts are stored, so it does not compete with them
+            self._sync_done = True
+            self._lock.notify_all()
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            self._lock.notify_all()
+
+    def join(self) -> None:
+        self._thread.join()
+
+    # Next batch to embed (None once closed and nothing is left). Before select(): the best waiting posts, once a batch
+    # is full or its oldest post has waited max_wait, within the early budget. After select(): whatever is waiting.
+    def _next_batch(self):
+        with self._lock:
+            while True:
+                if self._selected:
+                    if self._sync_done and self._pending:
+                        return self._pop(self.batch_size), False
+                    if self._sync_done and self._closed:
+                        return None, False
+                    self._lock.wait()
+                    continue
+
+                budget = self._early_budget()
+                if self._pending and budget > 0:
+                    remaining = self._first_pending_at + self.max_wait - time.time()
+                    if len(self._pending) >= min(self.batch_size, budget) or remaining <= 0:
+                        batch = self._pop(min(self.batch_size, budget))
+                        self._early += len(batch)
+                        self._early_in_flight += 1
+                        return batch, True
+                    self._lock.wait(timeout=remaining)
+                else:
+                    self._lock.wait()
+
+    # Embedding stage: store the batches handed out by _next_batch, one store_posts call each
+    def _run(self) -> None:
+        while True:
+            batch, early = self._next_batch()
+            if batch is None:
+                break
+            try:
+                store_posts(batch)
+            except Exception as e:
+                print(f"Error embedding batch of {len(batch)} posts: {e}")
+            with self._lock:
+                self.stored += len(batch)
+                if early:
+                    self._early_in_flight -= 1
+                self._lock.notify_all()
@@ -0,0 +1,106 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+# Job queue in a local SQLite file, used in multi-worker mode (INGEST_MODE=queue): the app's worker processes never
+# write to the vector index themselves, they submit jobs here and the single ingestion writer (python -m app.ingest_writer)
+# executes them. Job kinds: "posts" (payload: list of posts to embed and store), "digest" (payload: {"url", "game"}).
+class IngestQueue:
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ingest_jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "kind TEXT NOT NULL, "
+            "payload TEXT NOT NULL, "
+            "dedup_key TEXT, "
+            "status TEXT NOT NULL DEFAULT 'pending', "   # pending -> running -> done / failed
+            "error TEXT, "
+            "created_at REAL NOT NULL, "
+            "finished_at REAL)"
+        )
+        # The same digest is never queued twice while an earlier job for it is still waiting
+        self._conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS ingest_jobs_dedup ON ingest_jobs (dedup_key) "
+            "WHERE dedup_key IS NOT NULL AND status IN ('pending', 'running')"
+        )
+        self._conn.commit()
+
+    # Queue a job and return its id (the id of the waiting job with the same dedup_key, if there is one)
+    def submit(self, kind: str, payload, dedup_key: str = None) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO ingest_jobs (kind, payload, dedup_key, created_at) VALUES (?, ?, ?, ?)",
+                (kind, json.dumps(payload), dedup_key, time.time()),
+            )
+            self._conn.commit()
+            if cursor.rowcount:
+                return cursor.lastrowid
+            row = self._conn.execute(
+                "SELECT id FROM ingest_jobs WHERE dedup_key = ? AND status IN ('pending', 'running')", (dedup_key,)
+            ).fetchone()
+            return row[0] if row else None
+
+    # Wait until the jobs are finished (done or failed). Returns False on timeout.
+    def wait(self, job_ids: list[int], timeout: float = None, poll_interval: float = 0.05) -> bool:
+        deadline = time.time() + timeout if timeout is not None else None
+        job_ids = [job_id for job_id in job_ids if job_id is not None]
+        while job_ids:
+            placeholders = ",".join("?" * len(job_ids))
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT id FROM ingest_jobs WHERE id IN ({placeholders}) AND status IN ('pending', 'running')", job_ids
+                ).fetchall()
+            job_ids = [row[0] for row in rows]
+            if not job_ids:
+                break
+            if deadline is not None and time.time() > deadline:
+                return False
+            time.sleep(poll_interval)
+        return True
+
+    # Error of a failed job (None if it is not failed)
+    def error(self, job_id: int):
+        with self._lock:
+            row = self._conn.execute("SELECT error FROM ingest_jobs WHERE id = ? AND status = 'failed'", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    # Claim the oldest waiting jobs for execution (only the single writer process calls this)
+    def claim(self, limit: int = 1) -> list[tuple]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, kind, payload FROM ingest_jobs WHERE status = 'pending' ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+            if rows:
+                self._conn.executemany("UPDATE ingest_jobs SET status = 'running' WHERE id = ?", [(row[0],) for row in rows])
+                self._conn.commit()
+        return [(job_id, kind, json.loads(payload)) for job_id, kind, payload in rows]
+
+    def finish(self, job_id: int, error: str = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE ingest_jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                ("failed" if error else "done", error, time.time(), job_id),
+            )
+            self._conn.commit()
+
+    # Jobs left running by a writer that stopped are queued again
+    def requeue_running(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute("UPDATE ingest_jobs SET status = 'pending' WHERE status = 'running'")
+            self._conn.commit()
+        return cursor.rowcount
+
+    # Remove finished jobs older than max_age seconds
+    def purge_finished(self, max_age: float = 3600) -> None:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM ingest_jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (time.time() - max_age,)
+            )
+            self._conn.commit()
@@ -0,0 +1,57 @@
+# Single ingestion writer for multi-worker mode (INGEST_MODE=queue).
+# The app's worker processes only read the vector index; every write they need (fetched posts to embed and store,
+# digests to generate) is queued in the shared SQLite job queue and executed here.
+# Posts jobs waiting together (submitted by different workers) are stored as one group commit.
+#
+# Usage: python -m app.ingest_writer [--poll-interval 0.05] [--max-jobs 32]
+
+import argparse
+import time
+
+from app.database import ingest_queue, group_writer, collection_for_game
+from app.post_digests import digest_stored_post
+
+
+def run_digest_job(payload) -> None:
+    digest_stored_post(collection_for_game(payload.get("game")), payload["url"])
+
+
+def run(poll_interval: float = 0.05, max_jobs: int = 32) -> None:
+    requeued = ingest_queue.requeue_running()
+    if requeued:
+        print(f"Requeued {requeued} jobs left running by a previous writer")
+    print("Ingestion writer started")
+
+    last_purge = time.time()
+    while True:
+        jobs = ingest_queue.claim(limit=max_jobs)
+        if not jobs:
+            if time.time() - last_purge > 600:
+                ingest_queue.purge_finished()
+                last_purge = time.time()
+            time.sleep(poll_interval)
+            continue
+
+        # All posts jobs claimed together end up in the same group commit
+        futures = {job_id: group_writer.submit(payload) for job_id, kind, payload in jobs if kind == "posts"}
+
+        for job_id, kind, payload in jobs:
+            try:
+                if kind == "posts":
+                    futures[job_id].result()
+                elif kind == "digest":
+                    run_digest_job(payload)
+                else:
+                    raise ValueError(f"Unknown job kind: {kind}")
+                ingest_queue.finish(job_id)
+            except Exception as e:
+                print(f"Error running {kind} job {job_id}: {e}")
+                ingest_queue.finish(job_id, error=str(e))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Execute the writes queued by the app's worker processes")
+    parser.add_argument("--poll-interval", type=float, default=0.05, help="Seconds between checks of an empty queue")
+    parser.add_argument("--max-jobs", type=int, default=32, help="Jobs claimed (and posts jobs grouped) at a time")
+    args = parser.parse_args()
+    run(poll_interval=args.poll_interval, max_jobs=args.max_jobs)
@@ -0,0 +1,211 @@
+# Concurrency load test of one app instance against fake backends, to find where the sync endpoints saturate.
+# Starts the fake OpenAI/web search backends (app/fake_backends.py) and the Reddit stand-in (app/reddit_standin.py)
+# with the given latencies, then the app under uvicorn in a sandbox directory (its own empty posts store, caches and
+# shared state; the real app/data is never touched). Virtual users each repeat the frontend's sequence
+# /check-fetch-needed -> /query -> /summary. A share of their questions (--hit-ratio) was seeded into the store
+# beforehand and is answered from it, the rest are new and fetched. Each concurrency level runs for --duration
+# seconds and reports, per step: throughput, latency percentiles and error rate.
+#
+# Usage:
+#   python -m app.load_test --concurrency 1,4,16,32 --duration 30 --hit-ratio 0.8 \
+#       --embeddings-latency-ms 150 --chat-latency-ms 2000 --search-latency-ms 400 --reddit-latency-ms 300
+
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+STEPS = ["check-fetch-needed", "query", "summary"]
+
+TOPICS = (
+    "shrine korok seed weapon bow shield armor master sword hylian zonai device battery fuse depths sky island "
+    "cave lynel guardian stamina hearts recipe cooking tower map location farm upgrade boss"
+).split()
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# Directory the app is started from: app/ with every module, template and static file linked in, but a fresh data directory
+def prepare_sandbox() -> str:
+    sandbox = tempfile.mkdtemp(prefix="load_test_")
+    os.makedirs(os.path.join(sandbox, "app", "data"))
+    for entry in os.listdir(APP_DIR):
+        if entry not in ("data", "__pycache__"):
+            os.symlink(os.path.join(APP_DIR, entry), os.path.join(sandbox, "app", entry))
+    for entry in os.listdir(os.path.join(APP_DIR, "data")):
+        if entry.endswith(".json"):   # Static inputs (abbreviations, warm-up list); stores are created fresh
+            os.symlink(os.path.join(APP_DIR, "data", entry), os.path.join(sandbox, "app", "data", entry))
+    fonts = os.path.join(os.path.dirname(APP_DIR), "fonts")
+    os.symlink(fonts, os.path.join(sandbox, "fonts"))
+    return sandbox
+
+
+# The child process writes to its own copy of the log file descriptor, so ours is closed once it is started
+def start_process(args: list[str], cwd: str, env: dict, log_path: str) -> subprocess.Popen:
+    with open(log_path, "w") as log:
+        return subprocess.Popen([sys.executable] + args, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_until_up(url: str, timeout: float = 60) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=2).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def new_question(rng: random.Random) -> str:
+    return f"{' '.join(rng.sample(TOPICS, 3))} totk {rng.randrange(10 ** 6)}"
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+# One question through the three steps, like the frontend. Each result: (step, seconds, ok)
+def run_session(client: httpx.Client, base_url: str, question: str) -> list[tuple]:
+    results = []
+
+    def call(step: str, path: str, params: dict):
+        start = time.perf_counter()
+        try:
+            response = client.get(f"{base_url}{path}", params=params)
+            body = response.json()
+            ok = response.status_code == 200 and not body.get("error")
+        except (httpx.HTTPError, ValueError):
+            body, ok = None, False
+        results.append((step, time.perf_counter() - start, ok))
+        return body if ok else None
+
+    call("check-fetch-needed", "/check-fetch-needed", {"q": question})
+    answer = call("query", "/query", {"q": question})
+    if answer:
+        call("summary", "/summary", {"q": answer.get("query", question)})
+    return results
+
+
+# Run `concurrency` virtual users for `duration` seconds. Returns {step: [(seconds, ok), ...]} and the wall time.
+def run_level(base_url: str, concurrency: int, duration: float, hit_ratio: float, seeded: list[str], timeout: float) -> tuple:
+    results = {step: [] for step in STEPS}
+    lock = threading.Lock()
+    stop_at = time.time() + duration
+
+    def user(index: int):
+        rng = random.Random(f"{concurrency}:{index}")
+        with httpx.Client(timeout=timeout) as client:
+            while time.time() < stop_at:
+                question = rng.choice(seeded) if seeded and rng.random() < hit_ratio else new_question(rng)
+                for step, seconds, ok in run_session(client, base_url, question):
+                    with lock:
+                        results[step].append((seconds, ok))
+
+    start = time.time()
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.time() - start
+
+
+def print_level(concurrency: int, results: dict, wall: float) -> None:
+    print(f"\nConcurrency {concurrency} ({wall:.1f}s)")
+    print(f"{'step':<20}{'requests':>9}{'req/s':>8}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}{'errors':>8}")
+    for step in STEPS:
+        samples = results[step]
+        latencies = [seconds * 1000 for seconds, _ in samples]
+        errors = sum(1 for _, ok in samples if not ok)
+        error_rate = f"{100 * errors / len(samples):.1f}%" if samples else "-"
+        print(f"{step:<20}{len(samples):>9}{len(samples) / wall:>8.1f}{percentile(latencies, 0.5):>9.0f}"
+              f"{percentile(latencies, 0.9):>9.0f}{percentile(latencies, 0.99):>9.0f}{max(latencies, default=0):>9.0f}{error_rate:>8}")
+
+
+def main(args) -> None:
+    sandbox = prepare_sandbox()
+    backends_url = f"http://127.0.0.1:{args.backends_port}"
+    reddit_url = f"http://127.0.0.1:{args.reddit_port}"
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    env = dict(os.environ)
+    env.update({
+        "PYTHONUNBUFFERED": "1",
+        "OPENAI_KEY": "fake", "OPENAI_KEY_DB": "fake",
+        "OPENAI_BASE_URL": f"{backends_url}/v1",
+        "WEB_SEARCH_URL": f"{backends_url}/search",
+        "REDDIT_CLIENT_ID": "fake", "REDDIT_CLIENT_SECRET": "fake", "REDDIT_USER_AGENT": "load-test",
+        "REDDIT_OAUTH_URL": reddit_url, "REDDIT_URL": reddit_url,
+        "WARMUP_ENABLED": "false",
+        "QUERY_LOG_PATH": "",
+    })
+
+    backend_args = ["-m", "app.fake_backends", "--port", str(args.backends_port)]
+    for endpoint in ("embeddings", "chat", "search"):
+        backend_args += [f"--{endpoint}-latency-ms", str(getattr(args, f"{endpoint}_latency_ms")),
+                         f"--{endpoint}-jitter-ms", str(args.jitter_ms)]
+    processes = [
+        start_process(backend_args, sandbox, env, os.path.join(sandbox, "fake_backends.log")),
+        start_process(["-m", "app.reddit_standin", "--port", str(args.reddit_port), "--latency-ms", str(args.reddit_latency_ms)],
+                      sandbox, env, os.path.join(sandbox, "reddit_standin.log")),
+        start_process(["-m", "uvicorn", "app.main:app", "--port", str(args.port)],
+                      sandbox, env, os.path.join(sandbox, "app.log")),
+    ]
+    try:
+        wait_until_up(f"{backends_url}/stats")
+        wait_until_up(f"{reddit_url}/stats")
+        wait_until_up(f"{base_url}/ready", timeout=120)
+
+        # Questions answered from the store during the run: fetched and stored once beforehand
+        rng = random.Random(0)
+        seeded = [new_question(rng) for _ in range(args.seed_questions)] if args.hit_ratio > 0 else []
+        print(f"Seeding {len(seeded)} questions into the store...")
+        with httpx.Client(timeout=args.timeout) as client, ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda question: client.get(f"{base_url}/query", params={"q": question}), seeded))
+
+        print(f"Sandbox and logs: {sandbox}")
+        print(f"Hit ratio {args.hit_ratio}, {args.duration}s per level")
+        for concurrency in args.concurrency:
+            results, wall = run_level(base_url, concurrency, args.duration, args.hit_ratio, seeded, args.timeout)
+            print_level(concurrency, results, wall)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+        if not args.keep_sandbox:
+            shutil.rmtree(sandbox, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test one app instance with fake OpenAI, Reddit and web search backends")
+    parser.add_argument("--concurrency", default="1,4,16,32", help="Comma-separated numbers of concurrent users, run in order")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds per concurrency level")
+    parser.add_argument("--hit-ratio", type=float, default=0.8, help="Share of questions already in the store")
+    parser.add_argument("--seed-questions", type=int, default=20, help="Distinct stored questions the hits are drawn from")
+    parser.add_argument("--embeddings-latency-ms", type=float, default=150)
+    parser.add_argument("--chat-latency-ms", type=float, default=2000)
+    parser.add_argument("--search-latency-ms", type=float, default=400)
+    parser.add_argument("--reddit-latency-ms", type=float, default=300)
+    parser.add_argument("--jitter-ms", type=float, default=50, help="Random extra latency of the fake OpenAI and search calls")
+    parser.add_argument("--timeout", type=float, default=120, help="Client timeout per request")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--backends-port", type=int, default=8091)
+    parser.add_argument("--reddit-port", type=int, default=8081)
+    parser.add_argument("--keep-sandbox", action="store_true", help="Keep the sandbox directory and process logs")
+    args = parser.parse_args()
+    args.concurrency = [int(value) for value in args.concurrency.split(",")]
+    main(args)
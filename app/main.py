@@ -1,34 +1,269 @@
 from fastapi import FastAPI, Query, Request
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from app.reddit_scraper import search_reddit
-from app.reddit_websearch_scraper import reddit_query_via_ddg
+from app.reddit_scraper import iter_search_reddit
+from app.reddit_websearch_scraper import get_reddit_post_ids_from_ai, iter_posts_by_ids
 from datetime import datetime
-from app.ranking_posts import ai_rank_posts, score_post, format_post_content
+from app.ranking_posts import ai_rank_posts, format_post_content
 # from app.pushshift_scraper import search_pushshift
-from app.database import embed_text, query_db, delete_collection
+from app.database import query_db, query_db_batch, embed_queries, delete_collection, queue_missing_digests, with_stored_digests, get_post, metric_cutoff
 import threading
 from app.utilities import enhance_post_content_for_html, question_statement_classification, post_summary_generation, detect_game_from_query
-import re
 from app.security import sanitize_input, validate_query_length, log_suspicious_query
-import string
-
-
-app = FastAPI(title="3D Zelda games advisor")
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
-app.mount("/fonts", StaticFiles(directory="fonts"), name="fonts")
+from app.context_packer import pack_context, estimate_tokens, format_posts_for_prompt
+from app.post_digests import format_digests_for_prompt
+from app.config import SHARED_STATE_PATH, WARMUP_ENABLED, WARMUP_QUERIES_PATH, WARMUP_SUMMARIES, SUMMARY_TOKEN_BUDGET, FETCH_BUDGET_SECONDS, FETCH_BACKGROUND_SECONDS, PRERANK_TOP_K, PRERANK_DEFER_REST, NEGATIVE_CACHE_TTL_SECONDS, NEGATIVE_CACHE_ERROR_TTL_SECONDS, NEGATIVE_CACHE_MAX_ENTRIES
+from app.negative_cache import NegativeCache, NO_RESULTS, FETCH_FAILED
+from app.shared_state import SharedState
+from app.query_log import log_query
+from app.game_matcher import matcher as game_matcher
+from app.request_profiler import ProfileMiddleware, profiled, stage
+from app.ingest_pipeline import IngestPipeline
+from app.http_caching import CompressionMiddleware, CachedStaticFiles, asset_url, etag_json_response, image_variants, image_srcset, optimized_font
+import time
+import base64
+from pydantic import BaseModel
+from contextlib import asynccontextmanager
+import json
+import hashlib
+
+
+# Warm-up runs in the background at startup; /ready reports when it is done
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_warmup()
+    yield
+
+
+app = FastAPI(title="3D Zelda games advisor", lifespan=lifespan)
+app.add_middleware(CompressionMiddleware)    # brotli/gzip for JSON and HTML responses
+app.add_middleware(ProfileMiddleware)       # Profiles /query and /summary on demand (admin header or sampling)
+app.mount("/static", CachedStaticFiles(directory="app/static"), name="static")   # Serves precompressed variants + cache headers
+app.mount("/fonts", CachedStaticFiles(directory="fonts"), name="fonts")
 app.mount("/templates", StaticFiles(directory="app/templates"), name="templates")
 templates = Jinja2Templates(directory="app/templates")
+templates.env.globals["asset_url"] = asset_url   # Fingerprinted static URLs (?v=<hash>) get long-lived caching
+templates.env.globals.update(image_variants=image_variants, image_srcset=image_srcset, optimized_font=optimized_font)  # Optimized assets from app/static/build/manifest.json
+
+# State shared between endpoints and worker processes (SQLite): posts served per query, generated summaries, negative cache
+shared_state = SharedState(SHARED_STATE_PATH)
 
-# Global variables for caching posts between endpoints
-cached_posts = []
-cached_query = ""
+# Seconds the posts served for a query stay available to /summary, and generated summaries stay cached
+SESSION_TTL_SECONDS = 3600
+SUMMARY_CACHE_TTL_SECONDS = 86400
+
+# Progress of the startup warm-up (see warm_up)
+warmup_state = {"done": False, "queries": 0, "failed": 0, "seconds": None}
 
 # Production flag: set to True to disable fetching new posts
 # Purpose: Disable embedding new posts into the database in production (This project is just for demonstration purposes, so the database is prefilled and does not need to be updated)
 DISABLE_FETCHING = False
 
+# Queries whose fetch recently failed or found nothing relevant (see app/negative_cache.py)
+negative_cache = NegativeCache(shared_state, {NO_RESULTS: NEGATIVE_CACHE_TTL_SECONDS, FETCH_FAILED: NEGATIVE_CACHE_ERROR_TTL_SECONDS},
+                               max_entries=NEGATIVE_CACHE_MAX_ENTRIES)
+
+# Check if query is related to BOTW or TOTK only (the supported games, see app/game_matcher.py)
+def is_related_query(q: str) -> bool:
+    return game_matcher.analyze(q).related
+
+
+# Build post objects from query_db results (shared by every path that serves posts from the database)
+def posts_from_db_results(db_documents, db_distances, db_metadatas) -> list[dict]:
+    posts = []
+    for i, doc in enumerate(db_documents):
+        posts.append({
+            "title": db_metadatas[i].get("original_title", doc),  # Use original title if available, fallback to doc
+            "url": db_metadatas[i]["url"],
+            "content": db_metadatas[i].get("content", ""),
+            "comments": db_metadatas[i].get("comments", "").split(" | ") if db_metadatas[i].get("comments") else [],  # Convert string back to list
+            "subreddit": db_metadatas[i].get("subreddit", "database"),
+            "_score": 1.0 - db_distances[i],  # Convert distance to score (database similarity score)
+            "created_utc": db_metadatas[i].get("created_utc"),
+            "game": db_metadatas[i].get("game"),  # Include game name
+            "digest": db_metadatas[i].get("digest")  # Precomputed digest used by /summary (if generated yet)
+        })
+    return posts
+
+
+# Fetch posts for a query from DuckDuckGo and Reddit (PRAW) in parallel, streaming them into the ingestion pipeline
+# (deduplicated by URL and against stored posts, and embedded best first in batches while the fetch is still running).
+# The response waits at most `budget` seconds for the fetchers. Sources still running then keep feeding the pipeline in the
+# background, until their own deadline FETCH_BACKGROUND_SECONDS later.
+# Returns (cleaned query, status of each source: "ok", "failed" or "late") once the top PRERANK_TOP_K posts fetched in time are stored.
+def fetch_new_posts(q: str, metric: str, subreddit: str = None, budget: float = FETCH_BUDGET_SECONDS):
+    shared = {} # Dictionaries are mutable --> Shared between threads
+    fetched = {'ddg': 0, 'reddit': 0}
+    failed_sources = []
+    deadline = time.time() + budget                        # Response budget: how long the fetchers are waited for
+    fetch_deadline = deadline + FETCH_BACKGROUND_SECONDS   # When the fetchers themselves stop
+    pipeline = IngestPipeline(q, sync_limit=PRERANK_TOP_K)   # Pre-ranks the fetched posts so only the best ones are embedded before answering
+
+    # Fetch posts through duckduckgo
+    def fetch_ddg():
+        try:
+            post_ids, clean_query = get_reddit_post_ids_from_ai(q, max_results=200, metric=metric, subreddit=subreddit, deadline=fetch_deadline) # Metric input is removed as it will always default to "all time" in the projects context.
+            shared['clean_query'] = clean_query # Cleaned query is saved here to the common dictionary. It is the query without the part that tells the game (Example: best weapon in botw --> best weapon)
+            for post in iter_posts_by_ids(post_ids, max_comments=5, deadline=fetch_deadline):
+                pipeline.put(post)
+                fetched['ddg'] += 1
+        except Exception as e:
+            print(f"Error in fetch_ddg: {e}")
+            failed_sources.append('ddg')
+
+    # Fetch posts through reddit's API (PRAW)   
+    def fetch_reddit():
+        try:
+            for post in iter_search_reddit(q, limit=200, metric=metric, subreddit=subreddit, deadline=fetch_deadline):
+                pipeline.put(post)
+                fetched['reddit'] += 1
+        except Exception as e:
+            print(f"Error in fetch_reddit: {e}")
+            failed_sources.append('reddit')
+
+    # Multithreading during fetching using duckduckgo and praw (reddit) for time efficiency.
+    threads = {
+        'ddg': threading.Thread(target=fetch_ddg, daemon=True),
+        'reddit': threading.Thread(target=fetch_reddit, daemon=True),
+    }
+    for thread in threads.values():
+        thread.start()
+    for thread in threads.values():
+        thread.join(timeout=max(0, deadline - time.time()))
+
+    late_threads = {name: thread for name, thread in threads.items() if thread.is_alive()}
+    sources = {name: "late" if name in late_threads else "failed" if name in failed_sources else "ok" for name in threads}
+    print("Fetched per source: ", dict(fetched), "duplicates dropped: ", pipeline.duplicates, "already stored: ", pipeline.known) # For analysis purposes, should be > 0, > 0
+
+    if late_threads:
+        print(f"Fetch budget of {budget}s used up, serving without: {', '.join(late_threads)}")
+
+    # Store the best posts fetched in time that were not embedded during the fetch, up to PRERANK_TOP_K in total,
+    # before answering. The rest is embedded in the background (or dropped when PRERANK_DEFER_REST is false).
+    pipeline.select(defer_rest=PRERANK_DEFER_REST)
+
+    if late_threads:
+        # The late sources' posts are stored as they arrive, so the next query for this topic finds them
+        def finish_late_sources():
+            for thread in late_threads.values():
+                thread.join()
+            pipeline.close()
+            print(f"Late sources finished: {', '.join(late_threads)}")
+
+        threading.Thread(target=finish_late_sources, daemon=True).start()
+    else:
+        pipeline.close()
+
+    clean_query = shared.get('clean_query', q)  # Use cleaned query if available
+    print("Cleaned query main: ", clean_query)
+    return clean_query, sources
+
+
+# Fetch, embed and store new posts for a query, then serve the closest stored posts.
+# Repeats of a fetch that failed or found nothing relevant are remembered in the negative cache.
+# Returns (posts, cleaned query, status of each source).
+def fetch_and_store(q: str, metric: str, detected_game: str, subreddit: str = None):
+    clean_query, sources = fetch_new_posts(q, metric, subreddit=subreddit)
+    statuses = set(sources.values())
+
+    if statuses == {"failed"}:
+        negative_cache.record(q, detected_game, FETCH_FAILED, metric)
+
+    print("Embedded all posts. Now querying database for results...")
+
+    # Query the database to get the newly embedded posts (within the metric's time window)
+    db_documents, db_distances, db_metadatas = query_db(clean_query, n_results=10, game_filter=detected_game, created_after=metric_cutoff(metric))
+    print("Database query results:", len(db_documents), "documents found")
+
+    # Late sources may still bring relevant posts, so only complete fetches are cached as negative
+    if "ok" in statuses and "late" not in statuses and not any(distance < 0.7 for distance in db_distances):
+        negative_cache.record(q, detected_game, NO_RESULTS, metric)
+
+    # Create post objects from database results for consistent formatting
+    return posts_from_db_results(db_documents, db_distances, db_metadatas), clean_query, sources
+
+
+# Response for a query answered from the negative cache (a recent fetch for it failed or found nothing relevant)
+def negative_cache_response(q: str, negative: dict) -> dict:
+    if negative["reason"] == FETCH_FAILED:
+        error = "Reddit could not be reached for this question a moment ago. Please try again shortly."
+    else:
+        error = "No relevant posts were found for this question recently. Please try rephrasing it."
+    return {
+        "query": q,
+        "results": [],
+        "has_summary": False,
+        "database_status": "Recently fetched, no relevant posts",
+        "error": error,
+        "retry_after": negative["retry_after"]
+    }
+
+
+# Length of the plain-text preview sent with each result (the full content is served by /post/{post_id})
+SNIPPET_LENGTH = 200
+
+
+# Post ids used by /post/{post_id}: the post URL (the database record id) in URL-safe base64, so no lookup table is needed
+def post_id_from_url(url: str) -> str:
+    return base64.urlsafe_b64encode(url.encode()).decode().rstrip("=")
+
+
+def url_from_post_id(post_id: str) -> str:
+    return base64.urlsafe_b64decode(post_id + "=" * (-len(post_id) % 4)).decode()
+
+
+# Lightweight result list sent by /query: content and comments are only rendered when a post is opened (/post/{post_id}).
+def format_results(posts: list[dict]) -> list[dict]:
+    summarized_results = []
+    for post in posts:
+        post_time = post.get("created_utc")
+        if post_time:
+            date_str = datetime.utcfromtimestamp(post_time).strftime('%Y-%m-%d')
+        else:
+            date_str = "Unknown date"
+
+        content = " ".join((post.get("content") or "").split())
+        snippet = content[:SNIPPET_LENGTH] + "..." if len(content) > SNIPPET_LENGTH else content
+
+        summarized_results.append({
+            "id": post_id_from_url(post["url"]),
+            "title": post["title"],
+            "date": date_str,
+            "url": post["url"],
+            "subreddit": post.get('subreddit', 'unknown'),
+            "score": round(post.get("_score", 0.0), 3),
+            "snippet": snippet,
+            "has_content": bool(content),
+            "has_comments": any(comment.strip() for comment in post.get("comments", [])),
+            "created_utc": post_time,
+            "summary": ""  # No summary if ranking by title only
+        })
+    return summarized_results
+
+
+# Content and comments of one post formatted as HTML (served by /post/{post_id}).
+def render_post(post: dict) -> dict:
+    # Format post content
+    raw_content = format_post_content(post.get("content", ""))
+
+    # Formats the output into an HTML processable string for better display.
+    post_content = enhance_post_content_for_html(raw_content) if raw_content else ""
+
+    # Format comments for display
+    comments = post.get("comments", [])
+    formatted_comments = ""
+    if comments:
+        # Wraps every non-empty comment into a div and joins them into an HTML stirng separated by <br>
+        formatted_comments = "<br>".join([f"<div style='background:#f9f9f9;padding:10px;margin:5px 0;border-left:3px solid #185a9d;border-radius:4px;'>{comment}</div>" for comment in comments if comment.strip()])
+
+    return {
+        "title": post["title"],
+        "url": post["url"],
+        "content": post_content,
+        "comments": formatted_comments
+    }
+
 # Root endpoint to serve the HTML template
 @app.get("/", response_class=HTMLResponse)
 def root(request: Request):
@@ -36,7 +271,8 @@ def root(request: Request):
 
 
 @app.get("/query")
-def query(q: str = Query(..., max_length=512, description="3D Zelda related question"), metric: str = Query("all", description="Time filter for Reddit search")):
+@profiled("query")
+def query(request: Request, q: str = Query(..., max_length=512, description="3D Zelda related question"), metric: str = Query("all", description="Time filter: all, year, month, week or day")):
     
     #delete_collection()  # For easily removing a collection in case of a database refresh.
 
@@ -66,19 +302,8 @@ def query(q: str = Query(..., max_length=512, description="3D Zelda related ques
         }
 
     
-    # Check if query is related to BOTW or TOTK only (For the next 5 code snippets)
-    query_lower = q.lower()
-
-    # Remove common punctuation to handle cases like "botw?" or "totk!"
-    query_cleaned = query_lower.translate(str.maketrans('', '', string.punctuation))
-    
-    # Define allowed game terms (BOTW and TOTK only). If these are detected in the query, the game discussed will be decided.
-    allowed_terms = ['botw', 'breath of the wild', 'totk', 'tears of the kingdom']
-    
-    is_related_query = any(term in query_cleaned for term in allowed_terms)
-
-    # If query is unrelated to the system's purpose, return an error message
-    if not is_related_query:
+    # If query is unrelated to the system's purpose (not about BOTW or TOTK), return an error message
+    if not is_related_query(q):
         return {
             "query": q,
             "results": [],
@@ -89,10 +314,15 @@ def query(q: str = Query(..., max_length=512, description="3D Zelda related ques
     
     # Detect which game the query is about
     detected_game = detect_game_from_query(q)
+    log_query(q, detected_game)
     
+    fetch_sources = None   # Status of each source when new posts are fetched
+
     # First, check if relevant posts exist in the database
     try:
-        db_documents, db_distances, db_metadatas = query_db(q, n_results=10, game_filter=detected_game)
+        # Only posts created within the metric's time window ("all": any time) are searched
+        with stage("query_db"):
+            db_documents, db_distances, db_metadatas = query_db(q, n_results=10, game_filter=detected_game, created_after=metric_cutoff(metric))
         
         # Check if we have good matches (distance < 0.7)
         good_matches = [doc for i, doc in enumerate(db_documents) if db_distances[i] < 0.7]
@@ -103,22 +333,8 @@ def query(q: str = Query(..., max_length=512, description="3D Zelda related ques
         if  good_matches and len(good_matches) >= 5:  # If we have at least 5 good matches
             print("Found relevant posts in database!")
             
-            all_posts = []
-
             # For all documents (top 10), the posts are as follows:
-            for i, doc in enumerate(db_documents[:10]): 
-                
-                post = {
-                    "title": db_metadatas[i].get("original_title", doc),  # Use original title if available, fallback to doc
-                    "url": db_metadatas[i]["url"],
-                    "content": db_metadatas[i].get("content", ""),
-                    "comments": db_metadatas[i].get("comments", "").split(" | ") if db_metadatas[i].get("comments") else [],  # Convert string back to list
-                    "subreddit": db_metadatas[i].get("subreddit", "database"),
-                    "_score": 1.0 - db_distances[i],  
-                    "created_utc": db_metadatas[i].get("created_utc"),
-                    "game": db_metadatas[i].get("game") 
-                }
-                all_posts.append(post)
+            all_posts = posts_from_db_results(db_documents[:10], db_distances[:10], db_metadatas[:10])
             
             database_message = "Found in the database"
             
@@ -133,101 +349,21 @@ def query(q: str = Query(..., max_length=512, description="3D Zelda related ques
                 "error": "This version does not allow fetching new posts, please try one of the provided queries."
             }
             
+        # If the same question was fetched recently without finding anything useful, answer right away
+        elif negative := negative_cache.lookup(q, detected_game, metric):
+            print(f"Negative cache hit ({negative['reason']}), skipping fetch")
+            return negative_cache_response(q, negative)
+
         # If no relevant posts are found in the db, fetch new ones.
         else:
             print("Relevant posts not found in database. Fetching new posts...")
-            database_message = "Relevant posts not found in database"
             
-            results = {}
-            shared = {} # Dictionaries are mutable --> Shared between threads
-
-            # Fetch posts through duckduckgo
-            def fetch_ddg():
-                subreddit = None # For manual fetching using a hardcoded subreddit
-                
-                try:
-                    posts, clean_query = reddit_query_via_ddg(q, max_posts=200, metric=metric, subreddit=subreddit) # Metric input is removed as it will always default to "all time" in the projects context.
-                    results['ddg'] = posts
-                    shared['clean_query'] = clean_query # Cleaned query is saved here to the common dictionary. It is the query without the part that tells the game (Example: best weapon in botw --> best weapon)
-                except Exception as e:
-                    print(f"Error in fetch_ddg: {e}")
-                    results['ddg'] = []
-
-            # Fetch posts through reddit's API (PRAW)   
-            def fetch_reddit():
-                subreddit = None
-                try:
-                    posts, clean_query = search_reddit(q, limit=200, metric=metric, subreddit=subreddit)
-                    results['reddit'] = posts
-                    shared['clean_query'] = clean_query
-                except Exception as e:
-                    print(f"Error in fetch_reddit: {e}")
-                    results['reddit'] = []
-
-            # Multithreading during fetching using duckduckgo and praw (reddit) for time efficiency.
-            # Writing to shared being a potential race condition is not importnat as either case works fine (Both the clean and original queries work if either returns a different cleaned query)
-            ddg_thread = threading.Thread(target=fetch_ddg)
-            reddit_thread = threading.Thread(target=fetch_reddit)
-            ddg_thread.start()
-            reddit_thread.start()
-            ddg_thread.join()
-            reddit_thread.join()
-
-            clean_query = shared.get('clean_query', q)  # Use cleaned query if available
-            q = clean_query # For easy changes
-            
-            print("Cleaned query main: ", clean_query)
-
-            ddg_posts = results['ddg']  # is a dict
-            reddit_posts = results['reddit'] # is a list
-
-            # Combine and deduplicate posts by URL 
-            all_posts_dict = {}
-
-            print("Num ddg: ",len(ddg_posts), "Num reddit: ",len(reddit_posts)) # For analysis purposes, should be > 0, > 0
-
-            for post in ddg_posts + reddit_posts: # + pushshift_posts: # pushift API use was deprecated as it was too unreliable (due to problems of pushshift API)
-                url = post["url"]
-
-                # Extract subreddit if not present
-                if 'subreddit' not in post or not post['subreddit'] or post['subreddit'] == 'unknown':
-                    match = re.search(r"reddit.com/r/([a-zA-Z0-9_]+)/", url)
-                    if match:
-                        post['subreddit'] = match.group(1)
-                    else:
-                        post['subreddit'] = 'unknown'
-                if url not in all_posts_dict or score_post(post, q) > score_post(all_posts_dict[url], q):
-                    all_posts_dict[url] = post  # Overwrites duplicates, keeps highest scored occurrence.
-            
-            all_posts = list(all_posts_dict.values())   # A list of all unique posts
-
-            # Embed all posts into the chroma collection
-            embed_text(all_posts)
-            print("Embedded all posts. Now querying database for results...")
-            
-            # Query the database to get the newly embedded posts
-            db_documents, db_distances, db_metadatas = query_db(clean_query, n_results=10, game_filter=detected_game)
-            print("Database query results:", len(db_documents), "documents found")
-            
-            # Create post objects from database results for consistent formatting
-            all_posts = []
-            for i, doc in enumerate(db_documents):
-                post = {
-                    "title": db_metadatas[i].get("original_title", doc),  # Use original title if available, fallback to doc
-                    "url": db_metadatas[i]["url"],
-                    "content": db_metadatas[i].get("content", ""),
-                    "comments": db_metadatas[i].get("comments", "").split(" | ") if db_metadatas[i].get("comments") else [],  # Convert string back to list
-                    "subreddit": db_metadatas[i].get("subreddit", "database"),
-                    "_score": 1.0 - db_distances[i],  # Convert distance to score (database similarity score)
-                    "created_utc": db_metadatas[i].get("created_utc"),
-                    "game": db_metadatas[i].get("game")  # Include game name
-                }
-                all_posts.append(post)
+            with stage("fetch_and_store"):
+                all_posts, q, fetch_sources = fetch_and_store(q, metric, detected_game)
             
             database_message = "Found in the database (newly added)"
             
-    # If a problem occurs while querying the database
-    # Duplicate code and logic with the else statement above, could be functionized to be more efficient
+    # If a problem occurs while querying the database, fetch new posts from the default subreddit
     except Exception as e:
         print(f"Error querying database: {e}")
         
@@ -241,83 +377,20 @@ def query(q: str = Query(..., max_length=512, description="3D Zelda related ques
                 "error": "This version does not allow fetching new posts, please try one of the provided queries."
             }
         
-        database_message = "Database query failed, fetching new posts"
-        
-        results = {}
-        shared = {}
-
-        def fetch_ddg():
-            subreddit = "tearsofthekingdom"
-            try:
-                posts, clean_query = reddit_query_via_ddg(q, max_posts=200, metric=metric, subreddit=subreddit)
-                results['ddg'] = posts
-                shared['clean_query'] = clean_query
-            except Exception as e:
-                print(f"Error in fetch_ddg: {e}")
-                results['ddg'] = []
-                
-        def fetch_reddit():
-            subreddit = "tearsofthekingdom"
-            try:
-                posts, clean_query = search_reddit(q, limit=200, metric=metric, subreddit=subreddit)
-                results['reddit'] = posts
-                shared['clean_query'] = clean_query
-            except Exception as e:
-                print(f"Error in fetch_reddit: {e}")
-                results['reddit'] = []
-
-        ddg_thread = threading.Thread(target=fetch_ddg)
-        reddit_thread = threading.Thread(target=fetch_reddit)
-        ddg_thread.start()
-        reddit_thread.start()
-        ddg_thread.join()
-        reddit_thread.join()
-
-        clean_query = shared.get('clean_query', q)
-        q = clean_query
-
-        ddg_posts = results['ddg']
-        reddit_posts = results['reddit']
-        all_posts_dict = {}
-
-        for post in ddg_posts + reddit_posts:
-            url = post["url"]
-            if 'subreddit' not in post or not post['subreddit'] or post['subreddit'] == 'unknown':
-                match = re.search(r"reddit.com/r/([a-zA-Z0-9_]+)/", url)
-                if match:
-                    post['subreddit'] = match.group(1)
-                else:
-                    post['subreddit'] = 'unknown'
-            if url not in all_posts_dict or score_post(post, q) > score_post(all_posts_dict[url], q):
-                all_posts_dict[url] = post
-        all_posts = list(all_posts_dict.values())
-        
-        embed_text(all_posts)
-        print("Embedded all posts. Now querying database for results...")
-        
-        db_documents, db_distances, db_metadatas = query_db(clean_query, n_results=10, game_filter=detected_game)
-        print("Database query results:", len(db_documents), "documents found")
-        
-        all_posts = []
-        for i, doc in enumerate(db_documents):
-            post = {
-                "title": db_metadatas[i].get("original_title", doc),  # Use original title if available, fallback to doc
-                "url": db_metadatas[i]["url"],
-                "content": db_metadatas[i].get("content", ""),
-                "comments": db_metadatas[i].get("comments", "").split(" | ") if db_metadatas[i].get("comments") else [],  # Convert string back to list
-                "subreddit": db_metadatas[i].get("subreddit", "database"),
-                "_score": 1.0 - db_distances[i],  # Convert distance to score (database similarity score)
-                "created_utc": db_metadatas[i].get("created_utc"),
-                "game": db_metadatas[i].get("game")  # Include game metadata
-            }
-            all_posts.append(post)
+        if negative := negative_cache.lookup(q, detected_game, metric):
+            return negative_cache_response(q, negative)
+
+        with stage("fetch_and_store"):
+            all_posts, q, fetch_sources = fetch_and_store(q, metric, detected_game, subreddit="tearsofthekingdom")
         
         database_message = "Found in the database (newly added)"
 
-    # Store posts in a global variable for the summary endpoint
-    global cached_posts, cached_query
-    cached_posts = all_posts
-    cached_query = q
+    with stage("session_state"):
+        # Store posts in a global variable for the summary endpoint
+        shared_state.set("posts", q, all_posts, ttl=SESSION_TTL_SECONDS)
+
+        # Digests for these posts are generated in the background, so later /summary calls can answer from them
+        queue_missing_digests(all_posts)
 
     print(f"\nProcessing with message: {database_message}")
 
@@ -365,53 +438,202 @@ def query(q: str = Query(..., max_length=512, description="3D Zelda related ques
 
     final_posts = ai_ranked_posts
 
-    summarized_results = []
-    for i, post in enumerate(final_posts):
-        post_time = post.get("created_utc")
-        if post_time:
-            date_str = datetime.utcfromtimestamp(post_time).strftime('%Y-%m-%d')
-        else:
-            date_str = "Unknown date"
+    with stage("format_results"):
+        summarized_results = format_results(final_posts)
 
-        # Format post content for every post
-        raw_content = format_post_content(post.get("content", ""))
-
-        # Formats the output into an HTML processable string for better display.
-        post_content = enhance_post_content_for_html(raw_content) if raw_content else ""
-        
-        # Format comments for display
-        comments = post.get("comments", [])
-        formatted_comments = ""
-        if comments:
-            # Wraps every non-empty comment into a div and joins them into an HTML stirng separated by <br>
-            formatted_comments = "<br>".join([f"<div style='background:#f9f9f9;padding:10px;margin:5px 0;border-left:3px solid #185a9d;border-radius:4px;'>{comment}</div>" for comment in comments if comment.strip()])
-        
-        subreddit = post.get('subreddit', 'unknown')
-        
-        # Output format for data for other endpoints to check.
-        summarized_results.append({
-            "title": f"{post['title']} [Date: {date_str}]", 
-            "url": post["url"],
-            "summary": "",  # No summary if ranking by title only
-            "content": post_content,  # Formatted post content for all posts
-            "comments": formatted_comments,  # Formatted comments for display
-            "created_utc": post_time,
-            "subreddit": subreddit
-        })
-
-
-    return {
+    response = {
         "query": q,
         "results": summarized_results,
         "has_summary": True,  # Indicates summary is available via separate endpoint
         "database_status": database_message  # Send database status to frontend
     }
+    if fetch_sources:
+        response["sources"] = fetch_sources   # Which sources made it into this response ("ok", "failed" or "late")
+
+    # Sent with an ETag, so a repeat request for unchanged results gets an empty 304
+    with stage("response"):
+        return etag_json_response(request, response)
+
 
 
+# Rendered content and comments of one result, requested when the user opens it.
+# Stored posts do not change, so responses may be cached for an hour and revalidated with their ETag afterwards.
+# A post that could not be stored is served from the posts cached for the requesting query (`q`, as returned by
+# /query) only, and never cached by shared caches.
+@app.get("/post/{post_id}")
+def post_detail(request: Request, post_id: str, q: str = Query(None, max_length=512, description="Query the post was served for")):
+    try:
+        url = url_from_post_id(post_id)
+    except Exception:
+        return JSONResponse({"error": "Invalid post id"}, status_code=400)
+
+    stored = get_post(url)
+    if stored:
+        post = posts_from_db_results([stored[0]], [0.0], [stored[1]])[0]
+        return etag_json_response(request, render_post(post), cache_control="public, max-age=3600")
+
+    q = sanitize_input(q) if q else None
+    post = next((post for post in (shared_state.get("posts", q) if q else None) or [] if post["url"] == url), None)
+    if post is None:
+        return JSONResponse({"error": "Post not found"}, status_code=404)
+    return etag_json_response(request, render_post(post), cache_control="private, no-store")
+
+
+# Body of /query/batch: several questions answered in one request
+class BatchQueryRequest(BaseModel):
+    questions: list[str]
+    metric: str = "all"
+
+
+# Maximum questions accepted by /query/batch
+MAX_BATCH_QUESTIONS = 50
+
+
+# Batch version of /query, answered from the database only (no fetching, no summary).
+# All questions are embedded with one OpenAI call, then grouped by detected game: each group is searched with one vector query.
+# Every question gets a result in the same shape as /query, in the order the questions were sent.
+@app.post("/query/batch")
+def query_batch(batch: BatchQueryRequest):
+
+    if len(batch.questions) > MAX_BATCH_QUESTIONS:
+        return {"error": f"Too many questions. Please send at most {MAX_BATCH_QUESTIONS} per batch.", "responses": []}
+
+    responses = [None] * len(batch.questions)
+    groups = {}   # detected game -> [(position, sanitized question)]
+
+    # Same validation as /query, per question
+    for position, q in enumerate(batch.questions):
+        if not validate_query_length(q, 512):
+            log_suspicious_query(q, "Query exceeds maximum length")
+            responses[position] = {
+                "query": q[:100] + "..." if len(q) > 100 else q,
+                "results": [],
+                "has_summary": False,
+                "database_status": "Invalid query",
+                "error": "Query is too long. Please keep your question under 512 characters."
+            }
+            continue
+
+        original_query = q
+        q = sanitize_input(q)
+        if not q or len(q.strip()) < 3:
+            log_suspicious_query(original_query, "Query too short or empty after sanitization")
+            responses[position] = {
+                "query": original_query,
+                "results": [],
+                "has_summary": False,
+                "database_status": "Invalid query",
+                "error": "Please enter a valid question (at least 3 characters)."
+            }
+            continue
+
+        if not is_related_query(q):
+            responses[position] = {
+                "query": q,
+                "results": [],
+                "has_summary": False,
+                "database_status": "Unrelated query",
+                "error": "This service only supports queries related to Breath of the Wild (BOTW) or Tears of the Kingdom (TOTK). Please ask a question about one of these games."
+            }
+            continue
+
+        groups.setdefault(detect_game_from_query(q), []).append((position, q))
+
+    # One embedding call for every valid question of the batch, whatever its game; each game group searches with its slice
+    all_questions = [q for questions in groups.values() for _, q in questions]
+    try:
+        all_embeddings = embed_queries(all_questions) if all_questions else []
+    except Exception as e:
+        print(f"Error embedding batch questions: {e}")
+        all_embeddings = None
+
+    offset = 0
+    for detected_game, questions in groups.items():
+        group_embeddings = None if all_embeddings is None else all_embeddings[offset:offset + len(questions)]
+        offset += len(questions)
+        try:
+            if group_embeddings is None:
+                raise RuntimeError("questions could not be embedded")
+            group_results = query_db_batch([q for _, q in questions], n_results=10, game_filter=detected_game,
+                                           created_after=metric_cutoff(batch.metric), query_embeddings=group_embeddings)
+        except Exception as e:
+            print(f"Error querying database for batch: {e}")
+            for position, q in questions:
+                responses[position] = {
+                    "query": q,
+                    "results": [],
+                    "has_summary": False,
+                    "database_status": "Database error",
+                    "error": "Database query failed, please try again."
+                }
+            continue
+
+        for (position, q), (db_documents, db_distances, db_metadatas) in zip(questions, group_results):
+            good_matches = [doc for i, doc in enumerate(db_documents) if db_distances[i] < 0.7]
+            posts = sorted(
+                posts_from_db_results(db_documents[:10], db_distances[:10], db_metadatas[:10]),
+                key=lambda post: (post["_score"], post.get("created_utc") or 0),
+                reverse=True
+            )
+            responses[position] = {
+                "query": q,
+                "results": format_results(posts),
+                "has_summary": False,   # Summaries are generated per query through /query + /summary
+                "database_status": "Found in the database" if len(good_matches) >= 5 else "Relevant posts not found in database"
+            }
+
+    print(f"Batch query: {len(batch.questions)} questions in {len(groups)} game groups")
+    return {"responses": responses}
+
+
+# Summary of posts for a query, with the number of context tokens sent and saved. Cached per query and set of posts.
+def summarize_posts(posts: list[dict], q: str) -> dict:
+    cache_key = hashlib.sha256(json.dumps([q] + [post["url"] for post in posts]).encode()).hexdigest()
+    cached = shared_state.get("summaries", cache_key)
+    if cached:
+        print("Summary served from cache")
+        return cached
+
+    print(f"Generating summary for {len(posts)} posts...")
+
+    # Digests queued when the posts were served are usually ready by now
+    try:
+        posts = with_stored_digests(posts)
+    except Exception as e:
+        print(f"Error reading stored digests: {e}")
+
+    # Answer from the precomputed per-post digests when every post has one
+    if all(post.get("digest") for post in posts):
+        with stage("llm"):
+            ai_summary = post_summary_generation(posts, q, use_digests=True)
+        context_tokens = estimate_tokens(format_digests_for_prompt(posts))
+        tokens_saved = max(0, estimate_tokens(format_posts_for_prompt(posts)) - context_tokens)
+        print("Summary generated from post digests")
+    else:
+        # Keep only the sentences and comments most relevant to the query, within the token budget
+        with stage("pack_context"):
+            packed = pack_context(posts, q, SUMMARY_TOKEN_BUDGET)
+        with stage("llm"):
+            ai_summary = post_summary_generation(packed["posts"], q)   # Generate a summary accross all displayed posts and comments.
+        context_tokens = packed["tokens_after"]
+        tokens_saved = packed["tokens_saved"]
+    print("Summary generated successfully")
+
+    summary = {
+        "ai_summary": ai_summary,
+        "post_count": len(posts),
+        "context_tokens": context_tokens,
+        "tokens_saved": tokens_saved
+    }
+    if ai_summary != "Error generating summary.":   # Failed generations are retried on the next request
+        shared_state.set("summaries", cache_key, summary, ttl=SUMMARY_CACHE_TTL_SECONDS)
+    return summary
+
 
 # New endpoint for AI summary generation.
 # Provides Generate AI summary for the cached posts from the previous query
 @app.get("/summary")
+@profiled("summary")
 def get_summary(q: str = Query(..., max_length=512, description="Original query for summary generation")):
     """"""
     try:
@@ -423,29 +645,69 @@ def get_summary(q: str = Query(..., max_length=512, description="Original query
         if not q:
             return {"error": "Invalid query"}
         
-        # Access cached posts (Currently the top 10 retrieved by the db)
-        global cached_posts, cached_query
+        # Access cached posts (Currently the top 10 retrieved by the db), stored by whichever worker served /query
+        with stage("load_posts"):
+            cached_posts = shared_state.get("posts", q)
         
-        if not cached_posts or cached_query != q:
+        if not cached_posts:
             return {"error": "No cached posts found for this query. Please run /query first."}
         
-        print(f"Generating summary for {len(cached_posts)} posts...")
-        ai_summary = post_summary_generation(cached_posts, q)   # Generate a summary accross all displayed posts and comments.
-        print("Summary generated successfully")
-        
-        return {
-            "query": q,
-            "ai_summary": ai_summary,
-            "post_count": len(cached_posts)
-        }
+        return {"query": q, **summarize_posts(cached_posts, q)}
         
     except Exception as e:
         print(f"Error generating summary: {e}")
         return {"error": f"Failed to generate summary: {str(e)}"}
 
+# Run popular queries through retrieval and rendering (and optionally summaries) so the first users do not pay
+# the cold costs: index page-in, first embedding requests, first renders.
+def warm_up(queries: list[str], with_summaries: bool = False) -> None:
+    start = time.time()
+    for q in queries:
+        try:
+            detected_game = detect_game_from_query(q)
+            db_documents, db_distances, db_metadatas = query_db(q, n_results=10, game_filter=detected_game)
+            posts = posts_from_db_results(db_documents, db_distances, db_metadatas)
+            format_results(posts)
+            for post in posts:
+                render_post(post)
+            if with_summaries and posts:
+                summarize_posts(posts, q)
+            warmup_state["queries"] += 1
+        except Exception as e:
+            print(f"Warm-up failed for '{q}': {e}")
+            warmup_state["failed"] += 1
+    warmup_state["seconds"] = round(time.time() - start, 2)
+    warmup_state["done"] = True
+    print(f"Warm-up finished: {warmup_state['queries']} queries in {warmup_state['seconds']}s ({warmup_state['failed']} failed)")
+
+
+def load_warmup_queries(path: str = WARMUP_QUERIES_PATH) -> list[str]:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"No warm-up queries loaded from {path}: {e}")
+        return []
+
+
+def start_warmup() -> None:
+    if not WARMUP_ENABLED:
+        warmup_state["done"] = True
+        return
+    threading.Thread(target=warm_up, args=(load_warmup_queries(), WARMUP_SUMMARIES), daemon=True).start()
+
+
+# Readiness probe: 503 until the startup warm-up has finished
+@app.get("/ready")
+def ready():
+    if not warmup_state["done"]:
+        return JSONResponse({"ready": False, **warmup_state}, status_code=503)
+    return {"ready": True, **warmup_state}
+
+
 # Quick endpoint to check if posts need to be fetched (To display the "wait a moment" message).
 @app.get("/check-fetch-needed")
-def check_fetch_needed(q: str = Query(..., max_length=512, description="Query to check in database")):
+def check_fetch_needed(q: str = Query(..., max_length=512, description="Query to check in database"), metric: str = Query("all", description="Time filter, as for /query")):
     # Duplicate logic with /query but necessary
     
     try:
@@ -460,23 +722,21 @@ def check_fetch_needed(q: str = Query(..., max_length=512, description="Query to
             return {"fetch_needed": False, "message": "Invalid query"}
         
         # Check if query is related to BOTW or TOTK only
-        query_lower = q.lower()
-        query_cleaned = query_lower.translate(str.maketrans('', '', string.punctuation))
-        allowed_terms = ['botw', 'breath of the wild', 'totk', 'tears of the kingdom']
-        is_related_query = any(term in query_cleaned for term in allowed_terms)
-        
-        if not is_related_query:
+        if not is_related_query(q):
             return {"fetch_needed": False, "message": "Unrelated query"}
         
         # Detect which game the query is about and check database
         detected_game = detect_game_from_query(q)
-        db_documents, db_distances, db_metadatas = query_db(q, n_results=10, game_filter=detected_game)
+        db_documents, db_distances, db_metadatas = query_db(q, n_results=10, game_filter=detected_game, created_after=metric_cutoff(metric))
         good_matches = [doc for i, doc in enumerate(db_documents) if db_distances[i] < 0.7]
         
         # If we don't have enough good matches, fetching will be needed
         if not good_matches or len(good_matches) < 7:
             if DISABLE_FETCHING:
                 return {"fetch_needed": False, "message": "Fetching disabled in production"}
+            negative = negative_cache.lookup(q, detected_game, metric)
+            if negative and len(good_matches) < 5:   # /query will answer from the negative cache instead of fetching
+                return {"fetch_needed": False, "message": "Fetched recently, no relevant posts found", "retry_after": negative["retry_after"]}
             else:
                 return {"fetch_needed": True, "message": "Will need to fetch new posts"}
         else:
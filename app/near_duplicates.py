@@ -0,0 +1,95 @@
+import hashlib
+import re
+
+import numpy as np
+
+# Near-duplicate detection for reposts and crossposts (same post under a different URL).
+# Each post gets a 64-bit SimHash of its normalized title and content: near-identical texts get fingerprints that differ
+# in only a few bits. Fingerprints are stored in the post metadata as a hex string, plus four 16-bit bands: two
+# fingerprints within 3 bits of each other share at least one band exactly, so candidates can be looked up with a
+# metadata filter on the bands before comparing full fingerprints.
+
+FINGERPRINT_BITS = 64
+BAND_COUNT = 4
+BAND_BITS = FINGERPRINT_BITS // BAND_COUNT
+BAND_FIELDS = [f"simhash_band{band}" for band in range(BAND_COUNT)]
+
+# Texts shorter than this (e.g. a one-word title with an image) are too generic to call duplicates and get no fingerprint
+MIN_WORDS = 4
+
+URL_PATTERN = re.compile(r"https?://\S+")
+NON_WORD_PATTERN = re.compile(r"[^a-z0-9]+")
+
+
+# Lowercase, without links and punctuation (crossposts often differ only in those)
+def normalize_text(text: str) -> list[str]:
+    return NON_WORD_PATTERN.sub(" ", URL_PATTERN.sub(" ", (text or "").lower())).split()
+
+
+def feature_hash(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+# SimHash over words and word pairs: each feature votes on every bit with its hash, the fingerprint keeps the majority.
+# The votes of all features are counted at once: one row of bits per feature hash, summed per bit.
+def simhash(words: list[str]) -> int:
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    if not features:
+        return 0
+    hashes = np.array([feature_hash(feature) for feature in features], dtype=">u8")
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(len(features), 8), axis=1)   # Most significant bit first
+    votes = 2 * bits.sum(axis=0, dtype=np.int64) - len(features)
+    return int.from_bytes(np.packbits(votes > 0).tobytes(), "big")
+
+
+def post_fingerprint(title: str, content: str = ""):
+    words = normalize_text(f"{title} {content}")
+    return simhash(words) if len(words) >= MIN_WORDS else None
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def bands(fingerprint: int) -> list[int]:
+    mask = (1 << BAND_BITS) - 1
+    return [fingerprint >> (band * BAND_BITS) & mask for band in range(BAND_COUNT)]
+
+
+# Metadata fields stored with a post: {"simhash": hex fingerprint, "simhash_band0": ..., ...} (none for short texts)
+def fingerprint_fields(title: str, content: str = "") -> dict:
+    fingerprint = post_fingerprint(title, content)
+    if fingerprint is None:
+        return {}
+    fields = {"simhash": f"{fingerprint:016x}"}
+    fields.update(zip(BAND_FIELDS, bands(fingerprint)))
+    return fields
+
+
+# Stored fingerprint of a post (None for short texts, and for posts stored before fingerprints existed: they are not
+# fingerprinted at query time, a collection rebuild adds their fingerprint once)
+def metadata_fingerprint(metadata: dict):
+    return int(metadata["simhash"], 16) if metadata.get("simhash") else None
+
+
+# Keep the first (closest) hit of every group of near-duplicates, up to n_results hits.
+# Hits are near-duplicates when their stored fingerprints are within max_distance bits, or when one is linked to the other.
+def collapse_near_duplicates(documents: list, distances: list, metadatas: list, n_results: int, max_distance: int = 3) -> tuple:
+    kept = []   # (index, fingerprint, url, duplicate_of)
+    for i, metadata in enumerate(metadatas):
+        if len(kept) == n_results:
+            break
+        metadata = metadata or {}
+        fingerprint = metadata_fingerprint(metadata)
+        url, duplicate_of = metadata.get("url"), metadata.get("duplicate_of")
+        if any(
+            (fingerprint is not None and kept_fingerprint is not None and hamming_distance(fingerprint, kept_fingerprint) <= max_distance)
+            or (duplicate_of and duplicate_of in (kept_url, kept_duplicate_of))
+            or (url and url == kept_duplicate_of)
+            for _, kept_fingerprint, kept_url, kept_duplicate_of in kept
+        ):
+            continue
+        kept.append((i, fingerprint, url, duplicate_of))
+
+    indexes = [i for i, _, _, _ in kept]
+    return [documents[i] for i in indexes], [distances[i] for i in indexes], [metadatas[i] for i in indexes]
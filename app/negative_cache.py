@@ -0,0 +1,50 @@
+import string
+import time
+
+# Negative-result cache: remembers queries whose fetch recently came back with nothing useful, or failed,
+# so repeats are answered right away instead of redoing the subreddit resolution and all the outbound scraping.
+# Entries are keyed by normalized query + detected game + time window (metric: a query with no recent posts may still
+# have relevant older ones, so a "week" entry must not answer the same query with "all") and expire after a TTL that depends on the failure reason.
+# At most max_entries are kept: expired entries, then the ones closest to expiring, are dropped first.
+
+# Failure reasons
+NO_RESULTS = "no_results"       # Fetched, but nothing relevant was found
+FETCH_FAILED = "fetch_failed"   # Every source errored (DDG / Reddit down or rate limited)
+
+
+# Lowercase, punctuation removed, whitespace collapsed: "Best bow in BOTW?" and "best bow in botw" share an entry
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().translate(str.maketrans('', '', string.punctuation)).split())
+
+
+class NegativeCache:
+
+    NAMESPACE = "negative"
+
+    # Entries are trimmed back to max_entries every this many records
+    TRIM_EVERY = 100
+
+    def __init__(self, store, ttl_seconds: dict, max_entries: int = 10000):
+        self.store = store               # SharedState, so every worker process sees the same entries
+        self.ttl_seconds = ttl_seconds   # reason -> seconds an entry stays valid
+        self.max_entries = max_entries
+        self._records = 0
+
+    @staticmethod
+    def key(query: str, game: str, metric: str = "all") -> str:
+        return f"{game}|{metric or 'all'}|{normalize_query(query)}"
+
+    def record(self, query: str, game: str, reason: str, metric: str = "all") -> None:
+        ttl = self.ttl_seconds[reason]
+        self.store.set(self.NAMESPACE, self.key(query, game, metric), {"reason": reason, "expires_at": time.time() + ttl}, ttl=ttl)
+        self._records += 1
+        if self._records % self.TRIM_EVERY == 0:
+            self.store.trim(self.NAMESPACE, self.max_entries)
+        print(f"Negative cache: '{query}' ({game}, {metric or 'all'}) recorded as {reason} for {ttl}s")
+
+    # Entry for a query as {"reason", "retry_after"} (seconds until it expires), or None if there is no valid entry
+    def lookup(self, query: str, game: str, metric: str = "all"):
+        entry = self.store.get(self.NAMESPACE, self.key(query, game, metric))
+        if entry is None:
+            return None
+        return {"reason": entry["reason"], "retry_after": int(entry["expires_at"] - time.time()) + 1}
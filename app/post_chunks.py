@@ -0,0 +1,79 @@
+import re
+
+# Chunk embeddings: a post's content and top comments, embedded as extra records next to its title, so a question
+# answered in the body or a comment still finds the post in the database.
+# Chunk records live in the same collection (and shard) as their post, with the id "<post url>#chunk<n>" and the
+# metadata "chunk_of" (the post URL) plus the post's game, subreddit and created_utc, so game and time filters apply
+# to them too. Search hits on chunks are aggregated back to their posts (see aggregate_post_hits).
+
+CHUNK_ID_SEPARATOR = "#chunk"
+
+# Words shared by consecutive content chunks, so a sentence cut at a boundary is whole in one of them
+CHUNK_OVERLAP_WORDS = 20
+
+# Content pieces and comments shorter than this are not embedded on their own
+MIN_CHUNK_WORDS = 8
+
+# Parent metadata copied to every chunk (used by search filters and shard routing)
+INHERITED_FIELDS = ("game", "subreddit", "created_utc")
+
+WORD_PATTERN = re.compile(r"\S+")
+
+
+def split_words(text: str, chunk_words: int, overlap: int = CHUNK_OVERLAP_WORDS) -> list[str]:
+    words = WORD_PATTERN.findall(text or "")
+    step = max(1, chunk_words - overlap)
+    chunks = []
+    for start in range(0, len(words), step):
+        piece = words[start:start + chunk_words]
+        if len(piece) >= MIN_CHUNK_WORDS:
+            chunks.append(" ".join(piece))
+        if start + chunk_words >= len(words):
+            break
+    return chunks
+
+
+# Texts to embed for a post besides its title: [(kind, text)], content pieces first, then one per top comment
+def chunk_texts(content: str, comments: list[str], chunk_words: int = 120, top_comments: int = 5) -> list[tuple[str, str]]:
+    chunks = [("content", text) for text in split_words(content, chunk_words)]
+    for comment in (comments or [])[:top_comments]:
+        chunks += [("comment", text) for text in split_words(comment, chunk_words)[:1]]
+    return chunks
+
+
+# Chunk records of a post: [(id, document, metadata)]. Each document starts with the post's (enhanced) title,
+# so a chunk is embedded in the context of the question it answers.
+def chunk_records(url: str, title_for_embedding: str, metadata: dict, content: str, comments: list[str],
+                  chunk_words: int = 120, top_comments: int = 5) -> list[tuple]:
+    inherited = {field: metadata[field] for field in INHERITED_FIELDS if field in metadata}
+    return [
+        (f"{url}{CHUNK_ID_SEPARATOR}{i}", f"{title_for_embedding}\n{text}", {"chunk_of": url, "chunk_kind": kind, **inherited})
+        for i, (kind, text) in enumerate(chunk_texts(content, comments, chunk_words, top_comments))
+    ]
+
+
+def is_chunk(metadata: dict) -> bool:
+    return bool(metadata and metadata.get("chunk_of"))
+
+
+# URL of the post a search hit belongs to (the hit's own URL for title records)
+def hit_post_url(metadata: dict) -> str:
+    metadata = metadata or {}
+    return metadata.get("chunk_of") or metadata.get("url")
+
+
+# Group one query's hits (closest first) by post: [(url, best distance)], best post first.
+# Distances are squared L2 between unit vectors, so 1 - distance / 2 is the cosine similarity of a hit.
+#   "max": posts ranked by their closest hit (title or chunk)
+#   "sum": posts ranked by the summed similarity of all their hits, so a post matched by its title and several
+#          comments outranks one matched by a single chunk. The distance reported is still the closest hit's.
+def aggregate_post_hits(distances: list[float], metadatas: list[dict], mode: str = "max") -> list[tuple]:
+    best, scores = {}, {}
+    for distance, metadata in zip(distances, metadatas):
+        url = hit_post_url(metadata)
+        if url is None:
+            continue
+        similarity = 1 - distance / 2
+        best[url] = min(best.get(url, distance), distance)
+        scores[url] = scores.get(url, 0) + similarity if mode == "sum" else max(scores.get(url, similarity), similarity)
+    return sorted(best.items(), key=lambda item: (-scores[item[0]], item[1]))
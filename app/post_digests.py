@@ -0,0 +1,130 @@
+# Per-post digests: a short summary of a post and its top comments, generated once and stored in the post's metadata.
+# /summary answers from the 10 stored digests instead of re-reading the raw posts on every request (map step done ahead of time,
+# only the reduce step runs per request).
+#
+# Digests are generated by a background worker for every ingested post (unless DIGEST_ON_INGEST is turned off), and for
+# served posts that still have none.
+# Posts already in the database can be backfilled with: python -m app.post_digests --concurrency 4
+
+import queue
+import threading
+from openai import OpenAI
+from app.config import OPENAI_KEY, OPENAI_BASE_URL
+
+client = OpenAI(api_key=OPENAI_KEY, base_url=OPENAI_BASE_URL)
+
+# Upper bound on digest length requested from the model
+DIGEST_WORDS = 80
+
+
+# Rebuild the post fields a digest is generated from, out of stored metadata
+def post_from_metadata(metadata: dict) -> dict:
+    return {
+        "title": metadata.get("original_title", ""),
+        "content": metadata.get("content", ""),
+        "comments": metadata.get("comments", "").split(" | ") if metadata.get("comments") else [],
+    }
+
+
+# Generate the digest of a single post with OpenAI
+def generate_digest(post: dict) -> str:
+    prompt = f"Title: {post.get('title', '')}\n"
+    prompt += f"Content: {post.get('content', '') or 'No content'}\n"
+    for i, comment in enumerate(post.get("comments", [])[:5], 1):
+        prompt += f"Comment {i}: {comment.strip()}\n"
+    prompt += f"\nWrite a digest of this Reddit post and its comments in at most {DIGEST_WORDS} words. "
+    prompt += "Keep only concrete facts, advice, names, numbers and locations. Mention disagreements between comments if any. "
+    prompt += "Plain text only, no markdown, no introduction."
+
+    response = client.chat.completions.create(
+        model="gpt-5-mini",
+        messages=[{"role": "user", "content": prompt}],
+    )
+    return response.choices[0].message.content.strip()
+
+
+# Generate and store the digest for one stored post. Returns the digest (or the existing one).
+def digest_stored_post(collection, url: str) -> str:
+    record = collection.get(ids=[url], include=["metadatas"])
+    if not record["ids"]:
+        return None
+    metadata = record["metadatas"][0]
+    if metadata.get("digest"):
+        return metadata["digest"]
+
+    digest = generate_digest(post_from_metadata(metadata))
+    collection.update(ids=[url], metadatas=[{**metadata, "digest": digest}])
+    return digest
+
+
+# Background worker generating digests one post at a time, so requests never wait on them.
+# Jobs hold the post's game, not a collection: the collection is resolved (through the alias) when the job runs,
+# so a job queued before a rebuild swap writes to the new version.
+class DigestWorker:
+
+    def __init__(self, resolve_collection):
+        self.resolve_collection = resolve_collection   # game -> collection the post is stored in
+        self._queue = queue.Queue()
+        self._pending = set()   # urls queued or in progress, to avoid generating the same digest twice
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, game: str, url: str) -> None:
+        with self._lock:
+            if url in self._pending:
+                return
+            self._pending.add(url)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        self._queue.put((game, url))
+
+    def _run(self) -> None:
+        while True:
+            game, url = self._queue.get()
+            try:
+                digest_stored_post(self.resolve_collection(game), url)
+            except Exception as e:
+                print(f"Error generating digest for {url}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(url)
+
+
+
+# Digests laid out for the summary prompt (replaces the raw title/content/comments blocks)
+def format_digests_for_prompt(posts: list[dict]) -> str:
+    blocks = []
+    for i, post in enumerate(posts, 1):
+        blocks.append(f"POST {i}:\nTitle: {post.get('title', 'No title')}\nDigest: {post['digest']}\n\n" + "-" * 50 + "\n\n")
+    return "".join(blocks)
+
+
+if __name__ == "__main__":
+    import argparse
+    from concurrent.futures import ThreadPoolExecutor
+    from app.database import version_collections
+
+    parser = argparse.ArgumentParser(description="Generate digests for stored posts that do not have one")
+    parser.add_argument("--concurrency", type=int, default=4, help="Digests generated in parallel")
+    args = parser.parse_args()
+
+    jobs = []
+    for collection in version_collections():
+        stored = collection.get(include=["metadatas"])
+        jobs += [
+            (collection, url) for url, metadata in zip(stored["ids"], stored["metadatas"])
+            if not metadata.get("digest") and not metadata.get("chunk_of")   # Chunk records belong to a post and get no digest
+        ]
+
+    def backfill(job):
+        try:
+            digest_stored_post(*job)
+        except Exception as e:
+            print(f"Error generating digest for {job[1]}: {e}")
+
+    print(f"Generating digests for {len(jobs)} posts")
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for i, _ in enumerate(executor.map(backfill, jobs), 1):
+            if i % 50 == 0:
+                print(f"{i}/{len(jobs)} digests generated")
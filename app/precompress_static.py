@@ -0,0 +1,54 @@
+# Writes brotli (.br) and gzip (.gz) copies of the compressible static assets next to the originals.
+# CachedStaticFiles serves these variants directly, so compression costs nothing per request.
+#
+# Usage: python -m app.precompress_static   (run after changing any static asset; the Docker build runs it)
+
+import gzip
+import mimetypes
+import os
+
+import brotli
+
+from app.http_caching import STATIC_MOUNTS, PRECOMPRESSED_VARIANTS, is_compressible
+
+# Variants are only written when they are at least this much smaller than the original
+MIN_SAVING = 0.1
+
+
+def precompress_file(path: str) -> list[str]:
+    with open(path, "rb") as f:
+        data = f.read()
+
+    written = []
+    for encoding, suffix in PRECOMPRESSED_VARIANTS:
+        if encoding == "br":
+            compressed = brotli.compress(data, quality=11)
+        else:
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+
+        variant_path = path + suffix
+        if len(compressed) <= len(data) * (1 - MIN_SAVING):
+            with open(variant_path, "wb") as f:
+                f.write(compressed)
+            written.append(variant_path)
+        elif os.path.exists(variant_path):
+            os.remove(variant_path)   # Stale variant of a file that no longer compresses well
+    return written
+
+
+def precompress_directory(directory: str) -> None:
+    suffixes = tuple(suffix for _, suffix in PRECOMPRESSED_VARIANTS)
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith(suffixes):
+                continue
+            media_type = mimetypes.guess_type(name)[0] or ""
+            if is_compressible(media_type):
+                path = os.path.join(root, name)
+                for variant_path in precompress_file(path):
+                    print(f"{variant_path}: {os.path.getsize(variant_path)} bytes (from {os.path.getsize(path)})")
+
+
+if __name__ == "__main__":
+    for directory in STATIC_MOUNTS.values():
+        precompress_directory(directory)
@@ -0,0 +1,150 @@
+# Measure what each quantized index mode costs in retrieval quality, on the real query log.
+# For every logged question (embedded like /query does, and restricted to the game logged with it, like /query's game
+# filter), the exact float32 top 10 posts over the live posts store are the reference. Recall is counted on posts:
+# chunk records ("<url>#chunk<n>") count as hits on their post, like /query aggregates them.
+# Each mode reports recall@10 against it, with and without full-precision re-scoring of a shortlist, next to the
+# memory its codes take. That memory comes on top of Chroma's own (HNSW, float32) index, reported as the baseline.
+#
+# Usage: python -m app.quantization_eval [--queries 500] [--modes float16,int8,pq] [--rescore 0,50,200]
+
+import argparse
+import time
+
+import numpy as np
+
+from app.config import QUERY_LOG_PATH, PQ_SUBVECTORS
+from app.database import openai_ef, augment_query_for_embedding, version_collections, collection_for_game, search_filter
+from app.database import CHUNK_HITS_PER_POST
+from app.post_chunks import hit_post_url
+from app.query_log import read_queries
+from app.quantized_index import make_codec, squared_l2, top_candidates, QUANTIZATION_MODES
+
+K = 10
+
+# Records searched per query, so K distinct posts remain when several records (title, chunks) hit the same post
+DEPTH = K * CHUNK_HITS_PER_POST
+
+
+# Every stored record of the live version (all shards): post URL (the record's own, or its post's for chunks),
+# game and float32 embedding
+def load_vectors() -> tuple[list[str], np.ndarray, np.ndarray]:
+    posts, games, embeddings = [], [], []
+    for collection in version_collections():
+        total = collection.count()
+        for offset in range(0, total, 1000):
+            records = collection.get(include=["embeddings", "metadatas"], limit=1000, offset=offset)
+            for record_id, metadata in zip(records["ids"], records["metadatas"]):
+                posts.append(hit_post_url(metadata) or record_id)
+                games.append((metadata or {}).get("game"))
+            embeddings.extend(records["embeddings"])
+    return posts, np.array(games, dtype=object), np.asarray(embeddings, dtype=np.float32)
+
+
+# Distances with the records of other games than each query's logged game excluded (inf)
+def filter_games(distances: np.ndarray, games: np.ndarray, query_games: list) -> np.ndarray:
+    for row, game in zip(distances, query_games):
+        if game:
+            row[games != game] = np.inf
+    return distances
+
+
+# Chroma's own top K posts for a query embedding: the game's collection filtered like /query, or every shard merged
+def chroma_top_posts(query: list[float], game: str = None) -> set:
+    collections = [collection_for_game(game)] if game else version_collections()
+    hits = []
+    for collection in collections:
+        count = collection.count()
+        if count:
+            results = collection.query(query_embeddings=[query], n_results=min(DEPTH, count), where=search_filter(game, None))
+            hits += zip(results["distances"][0], results["metadatas"][0])
+    urls = [hit_post_url(metadata) for _, metadata in sorted(hits, key=lambda hit: hit[0])[:DEPTH]]
+    return set(list(dict.fromkeys(url for url in urls if url))[:K])
+
+
+# The first K distinct posts of a ranked list of records
+def top_posts(records, posts: list[str]) -> set:
+    return set(list(dict.fromkeys(posts[i] for i in records))[:K])
+
+
+def embed_queries(queries: list[str]) -> np.ndarray:
+    embeddings = []
+    for start in range(0, len(queries), 100):
+        embeddings.extend(openai_ef([augment_query_for_embedding(q) for q in queries[start:start + 100]]))
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def recall(found: list[set], expected: list[set]) -> float:
+    return float(np.mean([len(f & e) / len(e) for f, e in zip(found, expected) if e]))
+
+
+def evaluate(mode: str, vectors: np.ndarray, posts: list[str], games: np.ndarray, queries: np.ndarray, query_games: list,
+             exact: list[set], rescore_options: list[int]) -> list[dict]:
+    codec = make_codec(mode, PQ_SUBVECTORS)
+    start = time.time()
+    codec.train(vectors)
+    codes = codec.encode(vectors)
+    build_seconds = time.time() - start
+
+    start = time.time()
+    approximate = filter_games(codec.distances(codes, queries), games, query_games)
+    search_ms = (time.time() - start) * 1000 / len(queries)
+
+    rows = []
+    for rescore in rescore_options:
+        found = []
+        for query, candidates in zip(queries, top_candidates(approximate, max(DEPTH, rescore))):
+            if rescore:
+                candidates = candidates[np.argsort(squared_l2(query[None, :], vectors[candidates])[0])]
+            found.append(top_posts(candidates[:DEPTH], posts))
+        rows.append({
+            "mode": mode,
+            "rescore": rescore,
+            "recall": recall(found, exact),
+            "bytes_per_vector": codes.nbytes // len(codes),
+            "memory_mb": codes.nbytes / 1e6,
+            "build_s": build_seconds,
+            "search_ms": search_ms,
+        })
+    return rows
+
+
+def main(max_queries: int, modes: list[str], rescore_options: list[int]) -> None:
+    if not QUERY_LOG_PATH:
+        print("The query log is disabled: set QUERY_LOG_PATH and serve some queries first")
+        return
+    entries = read_queries(QUERY_LOG_PATH, limit=max_queries)
+    if not entries:
+        print(f"No queries in {QUERY_LOG_PATH}")
+        return
+    posts, games, vectors = load_vectors()
+    if len(set(posts)) < K:
+        print(f"Only {len(set(posts))} stored posts, need at least {K}")
+        return
+
+    queries = embed_queries([entry["query"] for entry in entries])
+    query_games = [entry.get("game") for entry in entries]
+    print(f"{len(queries)} logged queries against {len(set(posts))} stored posts ({len(posts)} records, {vectors.nbytes / 1e6:.1f} MB as float32)")
+
+    # Reference: exact float32 nearest posts within the logged game
+    exact_distances = filter_games(squared_l2(queries, vectors), games, query_games)
+    exact = [top_posts(candidates, posts) for candidates in top_candidates(exact_distances, DEPTH)]
+
+    # Baseline: Chroma's HNSW index over the same records, with /query's game filter
+    chroma_found = [chroma_top_posts(query, game) for query, game in zip(queries.tolist(), query_games)]
+
+    print("Memory of the quantized modes is extra: Chroma keeps its float32 index loaded as well")
+    print(f"\n{'mode':<16}{'rescore':>8}{'recall@10':>11}{'bytes/vec':>11}{'memory MB':>11}{'build s':>9}{'search ms/q':>13}")
+    print(f"{'chroma float32':<16}{'-':>8}{recall(chroma_found, exact):>11.3f}{vectors.shape[1] * 4:>11}{vectors.nbytes / 1e6:>11.1f}{'-':>9}{'-':>13}")
+    for mode in modes:
+        for row in evaluate(mode, vectors, posts, games, queries, query_games, exact, rescore_options):
+            print(f"{row['mode']:<16}{row['rescore']:>8}{row['recall']:>11.3f}{row['bytes_per_vector']:>11}"
+                  f"{row['memory_mb']:>11.1f}{row['build_s']:>9.1f}{row['search_ms']:>13.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall@10 of the quantized index modes on the query log")
+    parser.add_argument("--queries", type=int, default=500, help="Most recent distinct logged queries to evaluate")
+    parser.add_argument("--modes", default=",".join(QUANTIZATION_MODES), help="Comma-separated modes to compare")
+    parser.add_argument("--rescore", default="0,50", help="Comma-separated re-scoring shortlist sizes (0: none)")
+    args = parser.parse_args()
+    main(args.queries, args.modes.split(","), [int(value) for value in args.rescore.split(",")])
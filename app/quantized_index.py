@@ -0,0 +1,287 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+
+# Compact in-memory representations of the stored title embeddings (text-embedding-3-small: 1536 float32 = 6 KB each).
+# Every codec scores queries against its codes with the same metric as Chroma (squared L2), so distances stay
+# comparable with the thresholds used by /query. Bytes per 1536-dim vector: float16 3072, int8 1536, pq 96 (default).
+# The codes are an extra cost: Chroma keeps its own float32 vectors and HNSW index loaded next to them, and the codes
+# are scanned brute force. The quantized index does not reduce the app's memory use.
+
+# Rows decoded at a time when scoring, so decoding never materializes the whole index in float32
+DECODE_CHUNK = 4096
+
+
+def squared_l2(queries: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    distances = (queries ** 2).sum(axis=1)[:, None] - 2 * queries @ vectors.T + (vectors ** 2).sum(axis=1)[None, :]
+    return np.maximum(distances, 0)
+
+
+# Codecs that decode codes back to approximate vectors and score them exactly
+class DecodingCodec(ABC):
+
+    def train(self, vectors: np.ndarray) -> None:
+        pass
+
+    @abstractmethod
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        ...
+
+    @abstractmethod
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        ...
+
+    def distances(self, codes: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        if len(codes) == 0:
+            return np.zeros((len(queries), 0), dtype=np.float32)
+        return np.concatenate(
+            [squared_l2(queries, self.decode(codes[start:start + DECODE_CHUNK])) for start in range(0, len(codes), DECODE_CHUNK)],
+            axis=1,
+        )
+
+
+# Half precision: 2 bytes per dimension, no training
+class Float16Codec(DecodingCodec):
+    name = "float16"
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return vectors.astype(np.float16)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return codes.astype(np.float32)
+
+
+# Symmetric scalar quantization: 1 byte per dimension, one scale per dimension (its largest absolute value / 127)
+class Int8Codec(DecodingCodec):
+    name = "int8"
+
+    def __init__(self):
+        self.scale = None
+
+    def train(self, vectors: np.ndarray) -> None:
+        self.scale = np.maximum(np.abs(vectors).max(axis=0), 1e-8).astype(np.float32) / 127
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint(vectors / self.scale), -127, 127).astype(np.int8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return codes.astype(np.float32) * self.scale
+
+
+# Product quantization: the vector is split into `subvectors` parts, each replaced by the id (1 byte) of its nearest
+# centroid among up to 256 learned by k-means for that part. Queries are scored with one distance table per part.
+class PQCodec:
+    name = "pq"
+
+    def __init__(self, subvectors: int = 96, centroids: int = 256, iterations: int = 12, sample_size: int = 20000):
+        self.subvectors = subvectors
+        self.centroids = centroids
+        self.iterations = iterations
+        self.sample_size = sample_size
+        self.codebooks = None   # (subvectors, centroids, sub_dim)
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        return vectors.reshape(len(vectors), self.subvectors, -1)
+
+    def train(self, vectors: np.ndarray) -> None:
+        if vectors.shape[1] % self.subvectors:
+            raise ValueError(f"Dimension {vectors.shape[1]} is not divisible into {self.subvectors} subvectors")
+
+        rng = np.random.default_rng(0)
+        if len(vectors) > self.sample_size:
+            vectors = vectors[rng.choice(len(vectors), self.sample_size, replace=False)]
+        parts = self._split(vectors)
+        k = min(self.centroids, len(vectors))
+
+        codebooks = []
+        for part in range(self.subvectors):
+            points = parts[:, part, :]
+            centers = points[rng.choice(len(points), k, replace=False)].copy()
+            for _ in range(self.iterations):
+                assignment = squared_l2(points, centers).argmin(axis=1)
+                counts = np.bincount(assignment, minlength=k)
+                sums = np.zeros_like(centers)
+                np.add.at(sums, assignment, points)
+                filled = counts > 0   # Empty clusters keep their previous center
+                centers[filled] = sums[filled] / counts[filled, None]
+            codebooks.append(centers)
+        self.codebooks = np.stack(codebooks).astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        parts = self._split(vectors)
+        codes = np.empty((len(vectors), self.subvectors), dtype=np.uint8)
+        for part in range(self.subvectors):
+            codes[:, part] = squared_l2(parts[:, part, :], self.codebooks[part]).argmin(axis=1)
+        return codes
+
+    def distances(self, codes: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        query_parts = self._split(queries)
+        rows = np.arange(self.subvectors)[None, :]
+        distances = np.empty((len(queries), len(codes)), dtype=np.float32)
+        for i, query in enumerate(query_parts):
+            # Distance from each query part to every centroid of that part: (subvectors, centroids)
+            tables = ((query[:, None, :] - self.codebooks) ** 2).sum(axis=2)
+            distances[i] = tables[rows, codes].sum(axis=1)
+        return distances
+
+
+QUANTIZATION_MODES = ("float16", "int8", "pq")
+
+
+def make_codec(mode: str, pq_subvectors: int = 96):
+    if mode == "float16":
+        return Float16Codec()
+    if mode == "int8":
+        return Int8Codec()
+    if mode == "pq":
+        return PQCodec(subvectors=pq_subvectors)
+    raise ValueError(f"Unknown quantization mode: {mode} (expected one of {', '.join(QUANTIZATION_MODES)})")
+
+
+# Nearest candidates per query from approximate distances (rows of inf are excluded): list of index arrays, closest first
+def top_candidates(distances: np.ndarray, k: int) -> list[np.ndarray]:
+    candidates = []
+    for row in distances:
+        finite = np.flatnonzero(np.isfinite(row))
+        if len(finite) > k:
+            finite = finite[np.argpartition(row[finite], k - 1)[:k]]
+        candidates.append(finite[np.argsort(row[finite])])
+    return candidates
+
+
+# Quantized copy of one Chroma collection's title embeddings, searched in place of the collection's float32 HNSW index.
+# Ids, games, creation times and codes are held in memory next to Chroma's own index (which Chroma still loads to
+# store posts), so this is extra memory, not a saving. The best `rescore_candidates` approximate hits per query are
+# re-scored with their full-precision vectors read back from Chroma (0 disables re-scoring and returns approximate distances).
+# The index follows the collection as posts are added: at most every `refresh_seconds` the collection count is checked,
+# and the records added since (the tail of the collection, in insertion order) are encoded. The codec is retrained
+# (full rebuild) once the collection has doubled since training, or if it shrank.
+# Creation times are kept sorted (a sorted timestamp index), so a time-windowed search only scores the posts in the window.
+class QuantizedIndex:
+
+    PAGE_SIZE = 1000
+
+    def __init__(self, mode: str, rescore_candidates: int = 50, pq_subvectors: int = 96, refresh_seconds: float = 5.0):
+        self.mode = mode
+        self.rescore_candidates = rescore_candidates
+        self.pq_subvectors = pq_subvectors
+        self.refresh_seconds = refresh_seconds
+        self.codec = None
+        self.ids = []
+        self.games = np.array([], dtype=object)
+        self.created = np.array([], dtype=np.float64)   # created_utc per vector (-inf when unknown)
+        self.by_time = np.array([], dtype=np.int64)     # Vector rows ordered by creation time
+        self.sorted_created = np.array([], dtype=np.float64)
+        self.codes = None
+        self._trained_size = 0
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def _fetch(self, collection, ids: list[str]):
+        embeddings, games, created = [], [], []
+        for start in range(0, len(ids), self.PAGE_SIZE):
+            records = collection.get(ids=ids[start:start + self.PAGE_SIZE], include=["embeddings", "metadatas"])
+            order = {record_id: i for i, record_id in enumerate(records["ids"])}
+            for record_id in ids[start:start + self.PAGE_SIZE]:
+                i = order[record_id]
+                embeddings.append(records["embeddings"][i])
+                metadata = records["metadatas"][i] or {}
+                games.append(metadata.get("game"))
+                created.append(metadata.get("created_utc", -np.inf))
+        return np.asarray(embeddings, dtype=np.float32), games, np.asarray(created, dtype=np.float64)
+
+    # Bring the index up to date with the collection (skipped within refresh_seconds of the last check unless forced)
+    def refresh(self, collection, force: bool = False) -> None:
+        with self._lock:
+            now = time.time()
+            if not force and self._checked_at is not None and now - self._checked_at < self.refresh_seconds:
+                return
+            self._checked_at = now
+            count = collection.count()
+            if count == len(self.ids):
+                return
+
+            rebuild = self.codec is None or count < len(self.ids) or count >= 2 * self._trained_size
+            if rebuild:
+                new_ids = collection.get(include=[])["ids"]
+            else:
+                # Chroma returns records in insertion order, so the new ones are the tail
+                new_ids = collection.get(include=[], offset=len(self.ids), limit=count - len(self.ids))["ids"]
+            vectors, games, created = self._fetch(collection, new_ids)
+
+            if rebuild:
+                self.codec = make_codec(self.mode, self.pq_subvectors)
+                if len(vectors):
+                    self.codec.train(vectors)
+                self._trained_size = len(vectors)
+                self.ids = list(new_ids)
+                self.games = np.array(games, dtype=object)
+                self.created = created
+                self.codes = self.codec.encode(vectors) if len(vectors) else None
+            elif new_ids:
+                self.ids.extend(new_ids)
+                self.games = np.concatenate([self.games, np.array(games, dtype=object)])
+                self.created = np.concatenate([self.created, created])
+                self.codes = np.concatenate([self.codes, self.codec.encode(vectors)])
+            self.by_time = np.argsort(self.created, kind="stable")
+            self.sorted_created = self.created[self.by_time]
+
+            print(f"Quantized index ({self.mode}) for {collection.name}: {len(self.ids)} vectors, {self.memory_bytes()} bytes of codes")
+
+    def memory_bytes(self) -> int:
+        return 0 if self.codes is None else self.codes.nbytes
+
+    # Search like collection.query: a list of (documents, distances, metadatas) per query, closest first
+    # Restricted to posts created at or after `created_after` (a timestamp) when given.
+    def search(self, collection, query_embeddings, n_results: int, game: str = None, created_after: float = None) -> list[tuple]:
+        self.refresh(collection)
+        with self._lock:
+            ids, codes, games, codec = self.ids, self.codes, self.games, self.codec
+            by_time, sorted_created = self.by_time, self.sorted_created
+
+        if codes is None:
+            return [([], [], []) for _ in query_embeddings]
+
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if created_after is not None:
+            # Only the rows in the time window (and of the game) are scored
+            rows = by_time[np.searchsorted(sorted_created, created_after, side="left"):]
+            if game:
+                rows = rows[games[rows] == game]
+            if not len(rows):
+                return [([], [], []) for _ in query_embeddings]
+            approximate = codec.distances(codes[rows], queries)
+            ids = [ids[i] for i in rows]
+        else:
+            approximate = codec.distances(codes, queries)
+            if game:
+                approximate[:, games != game] = np.inf
+
+        candidates = top_candidates(approximate, max(n_results, self.rescore_candidates))
+        shortlists = [[ids[i] for i in indexes] for indexes in candidates]
+        approximate_by_id = [dict(zip(shortlist, row[indexes])) for shortlist, row, indexes in zip(shortlists, approximate, candidates)]
+
+        wanted = list(dict.fromkeys(record_id for shortlist in shortlists for record_id in shortlist))
+        include = ["documents", "metadatas"] + (["embeddings"] if self.rescore_candidates else [])
+        records = collection.get(ids=wanted, include=include) if wanted else {"ids": []}
+        by_id = {record_id: i for i, record_id in enumerate(records["ids"])}
+
+        results = []
+        for query, shortlist, approximate_distances in zip(queries, shortlists, approximate_by_id):
+            shortlist = [record_id for record_id in shortlist if record_id in by_id]
+            if self.rescore_candidates and shortlist:
+                vectors = np.asarray([records["embeddings"][by_id[record_id]] for record_id in shortlist], dtype=np.float32)
+                distances = squared_l2(query[None, :], vectors)[0]
+            else:
+                distances = np.array([approximate_distances[record_id] for record_id in shortlist], dtype=np.float32)
+
+            order = np.argsort(distances)[:n_results]
+            results.append((
+                [records["documents"][by_id[shortlist[i]]] for i in order],
+                [float(distances[i]) for i in order],
+                [records["metadatas"][by_id[shortlist[i]]] for i in order],
+            ))
+        return results
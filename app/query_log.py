@@ -0,0 +1,37 @@
+import json
+import threading
+import time
+
+from app.config import QUERY_LOG_PATH
+
+_lock = threading.Lock()
+
+
+# Append a served question to the query log (JSON lines), used offline to evaluate retrieval changes
+# against real traffic (e.g. python -m app.quantization_eval). Disabled when QUERY_LOG_PATH is empty.
+def log_query(query: str, game: str = None) -> None:
+    if not QUERY_LOG_PATH:
+        return
+    line = json.dumps({"ts": time.time(), "query": query, "game": game}) + "\n"
+    try:
+        with _lock, open(QUERY_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(line)
+    except OSError as e:
+        print(f"Error writing query log: {e}")
+
+
+# Logged queries, most recent first and without repeats (at most `limit` of them)
+def read_queries(path: str = QUERY_LOG_PATH, limit: int = None) -> list[dict]:
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+
+    unique = {}
+    for entry in reversed(entries):
+        unique.setdefault(entry["query"].strip().lower(), entry)
+    queries = list(unique.values())
+    return queries[:limit] if limit else queries
@@ -1,55 +1,58 @@
 from datetime import datetime
 from openai import OpenAI
-from app.config import OPENAI_KEY
+from app.config import OPENAI_KEY, OPENAI_BASE_URL
 import re
 
-client = OpenAI(api_key=OPENAI_KEY)
+client = OpenAI(api_key=OPENAI_KEY, base_url=OPENAI_BASE_URL)
 
-# Used for deciding which post to include if duplicate posts are received. (Not necessary anymore but exists)
-def score_post(post: dict, query: str) -> float:
-    score = 0
-    title = post.get("title", "").lower()
-    query = query.lower()
-    title_words = re.findall(r'\w+', title)
-    query_words = re.findall(r'\w+', query)
-
-    # Normalize title and query for full phrase and word match (lowercase and singular)
-    def normalize_word(word):
-        w = word.lower()
-        if w.endswith('s') and len(w) > 3:
-            w = w[:-1]
-        return w
-
-    title_words_norm = [normalize_word(w) for w in re.findall(r'\w+', title)]
-    query_words_norm = [normalize_word(w) for w in re.findall(r'\w+', query)]
-    norm_title = ' '.join(title_words_norm)
-    norm_query = ' '.join(query_words_norm)
+WORD_PATTERN = re.compile(r'\w+')
 
-    
-    # Full phrase match: normalized query phrase is substring of normalized title
-    if norm_query in norm_title:
-        score += 2
-
-    # Partial word matches
-    partial_match_count = 0
-    for qw in query_words_norm:
-        for tw in title_words_norm:
-            if qw == tw:
-                partial_match_count += 1
-                break
-    if partial_match_count > 0 and score < 2:
-        score += 1
-
-    # Penalty for extra words in the title (use normalized word count only)
-    """
-    extra_words = max(0, len(title_words_norm) - partial_match_count)
-    score -= extra_words * 0.05  # Subtract 0.05 for each extra word
-    """
-
-    # Small bonus for upvotes and comments
-    score += post.get("score", 0) / 5000
-    score += len(post.get("comments", [])) * 0.001
-    return score
+
+# Normalize title and query words for full phrase and word match (lowercase and singular)
+def normalize_word(word):
+    w = word.lower()
+    if w.endswith('s') and len(w) > 3:
+        w = w[:-1]
+    return w
+
+
+# Query features used by score_posts, computed once per query instead of once per scored post
+def compile_query(query: str) -> dict:
+    query_words_norm = [normalize_word(w) for w in WORD_PATTERN.findall(query.lower())]
+    return {
+        "phrase": ' '.join(query_words_norm),
+        "words": set(query_words_norm),
+    }
+
+
+# Lexical relevance of many posts to one compiled query, in a single pass over the candidates.
+# Used to pre-rank fetched posts (only the best ones are embedded right away) and to pick between duplicate posts.
+def score_posts(posts: list[dict], compiled_query: dict) -> list[float]:
+    phrase = compiled_query["phrase"]
+    query_words = compiled_query["words"]
+    scores = []
+    for post in posts:
+        title_words_norm = [normalize_word(w) for w in WORD_PATTERN.findall(post.get("title", "").lower())]
+
+        # Full phrase match: normalized query phrase is substring of normalized title
+        # Otherwise, partial word matches
+        if phrase in ' '.join(title_words_norm):
+            score = 2
+        elif query_words.intersection(title_words_norm):
+            score = 1
+        else:
+            score = 0
+
+        # Small bonus for upvotes and comments
+        score += post.get("score", 0) / 5000
+        score += len(post.get("comments", [])) * 0.001
+        scores.append(score)
+    return scores
+
+
+# Lexical relevance of one post to a query (the ingestion pipeline uses score_posts with a query compiled once)
+def score_post(post: dict, query: str) -> float:
+    return score_posts([post], compile_query(query))[0]
 
 
 # AI based ranking of posts before displaying to user.
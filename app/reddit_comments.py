@@ -0,0 +1,44 @@
+# Lean comment retrieval: instead of loading a post's whole comment forest through PRAW, calling replace_more and sorting
+# every comment in Python, Reddit is asked for the top-sorted comments only (bounded by limit and depth), and only the
+# fields that are stored are read from the raw JSON. One request returns both the post and its top comments.
+
+from app.config import REDDIT_COMMENT_DEPTH
+
+
+# Raw JSON of a post and its top comments (the /comments/{id} endpoint returns [post listing, comment listing])
+def request_post_with_top_comments(reddit, post_id: str, comment_limit: int, depth: int = REDDIT_COMMENT_DEPTH):
+    return reddit.request(
+        method="GET",
+        path=f"comments/{post_id}/",
+        params={"sort": "top", "limit": comment_limit, "depth": depth, "raw_json": 1},
+    )
+
+
+# Post fields and comments (body, score, stickied) from the raw /comments/{id} response. "more" placeholders are skipped.
+def parse_post_with_comments(listings) -> dict:
+    post_data = listings[0]["data"]["children"][0]["data"]
+    comments = [
+        {"body": child["data"].get("body", ""), "score": child["data"].get("score", 0), "stickied": child["data"].get("stickied", False)}
+        for child in listings[1]["data"]["children"] if child.get("kind") == "t1"
+    ]
+    return {
+        "title": post_data.get("title", ""),
+        "url": f"https://www.reddit.com{post_data.get('permalink', '')}",
+        "score": post_data.get("score", 0),
+        "created_utc": post_data.get("created_utc"),
+        "content": post_data.get("selftext", ""),  # Post content
+        "is_video": post_data.get("is_video", False),
+        "comments": comments,
+    }
+
+
+# A post and the bodies of its top comments, already in Reddit's top order.
+# Stickied (moderator) comments and comments shorter than min_length are left out.
+def fetch_post_with_top_comments(reddit, post_id: str, max_comments: int, min_length: int = 0) -> dict:
+    # Ask for a few extra comments, as some are filtered out below
+    post = parse_post_with_comments(request_post_with_top_comments(reddit, post_id, comment_limit=max_comments * 2 + 2))
+    post["comments"] = [
+        comment["body"] for comment in post["comments"]
+        if len(comment["body"]) > min_length and not comment["stickied"]
+    ][:max_comments]
+    return post
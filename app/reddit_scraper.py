@@ -2,21 +2,32 @@
 # psaw: A wrapper for pushlift API (Unofficial/External reddit search, better but unstable)
 
 import praw
-from app.config import REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT
+from app.config import REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT, REDDIT_OAUTH_URL, REDDIT_URL, REDDIT_COMMENT_MODE
+from app.reddit_comments import fetch_post_with_top_comments
 from app.subreddit_finder import get_relevant_subreddits_from_ai
 import re
+import time
 
 
 # Initialize Reddit API
 reddit = praw.Reddit(
     client_id=REDDIT_CLIENT_ID,
     client_secret=REDDIT_CLIENT_SECRET,
-    user_agent=REDDIT_USER_AGENT
+    user_agent=REDDIT_USER_AGENT,
+    oauth_url=REDDIT_OAUTH_URL,
+    reddit_url=REDDIT_URL
 )
 
 # Scrape Reddit through its official API using PRAW
-def search_reddit(query: str, limit: int = 50, metric: str = "all", subreddit: str = None): 
-    results = []
+# deadline: time.time() value after which no more posts are fetched (posts gathered so far are returned)
+def search_reddit(query: str, limit: int = 50, metric: str = "all", subreddit: str = None, deadline: float = None): 
+    results = list(iter_search_reddit(query, limit=limit, metric=metric, subreddit=subreddit, deadline=deadline))
+    return results, query  # Return cleaned query for further processing
+
+
+# Same search as search_reddit, yielding each post as soon as it (and its comments) has been fetched
+def iter_search_reddit(query: str, limit: int = 50, metric: str = "all", subreddit: str = None, deadline: float = None):
+    fetched = 0
 
     if not subreddit:
         subreddits, cleaned_query = get_relevant_subreddits_from_ai(query, max_subreddits=3)
@@ -70,21 +81,29 @@ def search_reddit(query: str, limit: int = 50, metric: str = "all", subreddit: s
         try:
             for submission in reddit.subreddit(subreddit).search(query, sort="relevance", time_filter=time_filter, limit=fetch_limit):
                 
+                # Out of time: return what was fetched so far
+                if deadline and time.time() > deadline:
+                    print(f"Reddit fetch deadline reached after {fetched} posts")
+                    return
+
                 # Skip video posts (they were littering the data with no useful content)
                 if submission.is_video:
                     continue
                 
-                submission.comments.replace_more(limit=0) # Blocks processing addtional comments (comments to comments)
-                top_comments = [c.body for c in submission.comments[:3]]    # Store the top 3 comments as a list
-                results.append({
+                if REDDIT_COMMENT_MODE == "lean":
+                    # Only the top 3 top-level comments are requested (the post itself already came with the search results)
+                    top_comments = fetch_post_with_top_comments(reddit, submission.id, max_comments=3)["comments"]
+                else:
+                    submission.comments.replace_more(limit=0) # Blocks processing addtional comments (comments to comments)
+                    top_comments = [c.body for c in submission.comments[:3]]    # Store the top 3 comments as a list
+                fetched += 1
+                yield {
                     "title": submission.title,
                     "url": f"https://www.reddit.com{submission.permalink}",
                     "score": submission.score,
                     "created_utc": getattr(submission, "created_utc", None),
                     "content": submission.selftext,  # Post content
                     "comments": top_comments
-                })
+                }
         except Exception as e:
             print(f"Error fetching from subreddit {subreddit}: {e}")
-
-    return results, query  # Return cleaned query for further processing
@@ -0,0 +1,150 @@
+# Local stand-in for the Reddit API, for tests and benchmarks without network access or credentials.
+# Serves deterministic generated posts and comment trees for the endpoints the scrapers use:
+#   POST /api/v1/access_token         app-only OAuth token (any credentials are accepted)
+#   GET  /r/{subreddit}/search        search listing (honours limit); titles contain the searched words
+#   GET  /comments/{post_id}          post + comment tree (honours sort=top, limit and depth like Reddit)
+#   GET  /stats                       requests and response bytes served per endpoint, to compare comment modes
+#
+# Usage:
+#   python -m app.reddit_standin --port 8081 [--latency-ms 300]
+#   REDDIT_OAUTH_URL=http://127.0.0.1:8081 REDDIT_URL=http://127.0.0.1:8081 uvicorn app.main:app
+
+import asyncio
+import json
+import random
+
+from fastapi import FastAPI
+from fastapi.responses import Response
+
+app = FastAPI(title="Reddit stand-in")
+
+# Shape of the generated comment trees
+TOP_LEVEL_COMMENTS = 150
+REPLIES_PER_COMMENT = 3
+REPLY_DEPTH = 3
+
+# Reddit's default number of comments when no limit is given
+DEFAULT_COMMENT_LIMIT = 200
+
+# Seconds every request takes, like the network round trip to Reddit (set with --latency-ms)
+LATENCY_SECONDS = 0.0
+
+stats = {}   # endpoint -> {"requests", "bytes"}
+
+WORDS = (
+    "shrine korok seed weapon bow shield armor master sword hylian zonai device battery fuse depths sky island "
+    "cave lynel guardian stamina hearts recipe cooking divine beast tower map location farm upgrade boss"
+).split()
+
+
+# Waits without blocking the event loop, so concurrent requests each see the latency once
+async def json_response(endpoint: str, payload) -> Response:
+    if LATENCY_SECONDS:
+        await asyncio.sleep(LATENCY_SECONDS)
+    body = json.dumps(payload).encode()
+    entry = stats.setdefault(endpoint, {"requests": 0, "bytes": 0})
+    entry["requests"] += 1
+    entry["bytes"] += len(body)
+    return Response(body, media_type="application/json")
+
+
+def sentence(rng: random.Random, min_words: int, max_words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))).capitalize() + "."
+
+
+def post_data(post_id: str, subreddit: str = "tearsofthekingdom", topic: str = "") -> dict:
+    rng = random.Random(post_id)
+    return {
+        "id": post_id,
+        "name": f"t3_{post_id}",
+        "title": f"{topic} {sentence(rng, 2, 6)}" if topic else sentence(rng, 4, 10),
+        "selftext": " ".join(sentence(rng, 6, 18) for _ in range(rng.randint(0, 6))),
+        "permalink": f"/r/{subreddit}/comments/{post_id}/standin_post/",
+        "subreddit": subreddit,
+        "score": rng.randint(0, 5000),
+        "created_utc": 1600000000 + rng.randint(0, 150000000),
+        "is_video": rng.random() < 0.05,
+        "num_comments": TOP_LEVEL_COMMENTS * (1 + REPLIES_PER_COMMENT),
+        "author": "standin_user",
+    }
+
+
+def comment_data(post_id: str, comment_id: str, parent: str, depth: int, max_depth: int) -> dict:
+    rng = random.Random(comment_id)
+    replies = []
+    if depth + 1 < max_depth and depth + 1 < REPLY_DEPTH:
+        replies = [
+            {"kind": "t1", "data": comment_data(post_id, f"{comment_id}r{i}", f"t1_{comment_id}", depth + 1, max_depth)}
+            for i in range(REPLIES_PER_COMMENT)
+        ]
+    return {
+        "id": comment_id,
+        "name": f"t1_{comment_id}",
+        "parent_id": parent,
+        "link_id": f"t3_{post_id}",
+        "body": " ".join(sentence(rng, 3, 25) for _ in range(rng.randint(1, 4))),
+        "score": rng.randint(-20, 3000),
+        "stickied": comment_id.endswith("c0") and rng.random() < 0.5,
+        "author": "standin_commenter",
+        "depth": depth,
+        "replies": {"kind": "Listing", "data": {"children": replies, "after": None, "before": None}} if replies else "",
+    }
+
+
+def listing(children: list) -> dict:
+    return {"kind": "Listing", "data": {"children": children, "after": None, "before": None, "dist": len(children)}}
+
+
+@app.post("/api/v1/access_token")
+async def access_token():
+    return {"access_token": "standin-token", "token_type": "bearer", "expires_in": 86400, "scope": "*"}
+
+
+@app.get("/r/{subreddit}/search")
+async def search(subreddit: str, q: str = "", limit: int = 25):
+    rng = random.Random(f"{subreddit}:{q}")
+    children = [{"kind": "t3", "data": post_data(f"s{rng.randrange(36 ** 6):x}", subreddit, topic=q)} for _ in range(min(limit, 100))]
+    return await json_response("search", listing(children))
+
+
+@app.get("/comments/{post_id}")
+async def comments(post_id: str, sort: str = "confidence", limit: int = DEFAULT_COMMENT_LIMIT, depth: int = REPLY_DEPTH):
+    top_level = [comment_data(post_id, f"{post_id}c{i}", f"t3_{post_id}", 0, depth) for i in range(TOP_LEVEL_COMMENTS)]
+    if sort == "top":
+        top_level.sort(key=lambda comment: comment["score"], reverse=True)
+
+    children = [{"kind": "t1", "data": comment} for comment in top_level[:limit]]
+    if limit < len(top_level):
+        hidden = [comment["id"] for comment in top_level[limit:]]
+        children.append({"kind": "more", "data": {"count": len(hidden), "children": hidden, "id": hidden[0], "name": f"t1_{hidden[0]}", "parent_id": f"t3_{post_id}", "depth": 0}})
+
+    return await json_response("comments", [listing([{"kind": "t3", "data": post_data(post_id)}]), listing(children)])
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+# Accept the trailing slash PRAW adds to paths
+@app.get("/comments/{post_id}/")
+async def comments_slash(post_id: str, sort: str = "confidence", limit: int = DEFAULT_COMMENT_LIMIT, depth: int = REPLY_DEPTH):
+    return await comments(post_id, sort=sort, limit=limit, depth=depth)
+
+
+@app.get("/r/{subreddit}/search/")
+async def search_slash(subreddit: str, q: str = "", limit: int = 25):
+    return await search(subreddit, q=q, limit=limit)
+
+
+if __name__ == "__main__":
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local stand-in for the Reddit API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Added to every response")
+    args = parser.parse_args()
+    LATENCY_SECONDS = args.latency_ms / 1000
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -3,21 +3,49 @@ from ddgs import DDGS
 import praw
 from typing import List, Dict
 from app.subreddit_finder import get_relevant_subreddits_from_ai
-from app.config import REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT
+from app.config import REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT, REDDIT_OAUTH_URL, REDDIT_URL, REDDIT_COMMENT_MODE, WEB_SEARCH_URL
+from app.reddit_comments import fetch_post_with_top_comments
 import datetime
+import time
+import httpx
 
 reddit = praw.Reddit(
     client_id=REDDIT_CLIENT_ID,
     client_secret=REDDIT_CLIENT_SECRET,
-    user_agent=REDDIT_USER_AGENT
+    user_agent=REDDIT_USER_AGENT,
+    oauth_url=REDDIT_OAUTH_URL,
+    reddit_url=REDDIT_URL
 )
-# Fetch reddit posts from reddit by their IDs
-def fetch_posts_by_ids(post_ids: List[str], max_comments: int = 50) -> List[Dict]:
-    posts = []
-    for pid in post_ids:
+# Web search results ({"href", "title", "body"}): DuckDuckGo, or the search endpoint configured in WEB_SEARCH_URL
+def web_search(query: str, max_results: int) -> List[Dict]:
+    if WEB_SEARCH_URL:
+        response = httpx.get(WEB_SEARCH_URL, params={"q": query, "max_results": max_results}, timeout=30)
+        response.raise_for_status()
+        return response.json()["results"]
+    with DDGS() as ddgs:
+        return ddgs.text(query, max_results=max_results)
+
+# Fetch reddit posts from reddit by their IDs (stops early once the optional deadline, a time.time() value, has passed)
+def fetch_posts_by_ids(post_ids: List[str], max_comments: int = 50, deadline: float = None) -> List[Dict]:
+    return list(iter_posts_by_ids(post_ids, max_comments=max_comments, deadline=deadline))
+
+
+# Same as fetch_posts_by_ids, yielding each post as soon as it (and its comments) has been fetched
+def iter_posts_by_ids(post_ids: List[str], max_comments: int = 50, deadline: float = None):
+    for fetched, pid in enumerate(post_ids):
+        if deadline and time.time() > deadline:
+            print(f"DDG fetch deadline reached after {fetched} of {len(post_ids)} posts")
+            return
         submission = None
         comments = []
         try:
+            # Lean mode: one request for the post and its top comments only
+            if REDDIT_COMMENT_MODE == "lean":
+                post = fetch_post_with_top_comments(reddit, pid, max_comments=max_comments, min_length=30)
+                if not post.pop("is_video"):  # Skip video posts
+                    yield post
+                continue
+
             submission = reddit.submission(id=pid)
 
             # Skip video posts
@@ -33,32 +61,31 @@ def fetch_posts_by_ids(post_ids: List[str], max_comments: int = 50) -> List[Dict
             submission = None
             comments = []
         if submission:
-            posts.append({
+            yield {
                 "title": submission.title,
                 "url": f"https://www.reddit.com{submission.permalink}",
                 "score": submission.score,
                 "created_utc": getattr(submission, "created_utc", None),
                 "content": submission.selftext,  # Post content
                 "comments": comments
-            })
+            }
         else:
-            posts.append({
+            yield {
                 "title": "Unknown",
                 "url": "",
                 "score": 0,
                 "created_utc": None,
                 "comments": []
-            })
-    return posts
+            }
 
 # Search Reddit posts via DuckDuckGo, with optional time filter bias (metric: 'all', 'year', 'month').
-def reddit_query_via_ddg(query: str, max_posts: int = 50, max_comments: int = 5, metric: str = "all", subreddit: str = None) -> List[Dict]:
-    post_ids, cleaned_query = get_reddit_post_ids_from_ai(query, max_results=max_posts, metric=metric, subreddit=subreddit)
-    posts = fetch_posts_by_ids(post_ids, max_comments=max_comments)
+def reddit_query_via_ddg(query: str, max_posts: int = 50, max_comments: int = 5, metric: str = "all", subreddit: str = None, deadline: float = None) -> List[Dict]:
+    post_ids, cleaned_query = get_reddit_post_ids_from_ai(query, max_results=max_posts, metric=metric, subreddit=subreddit, deadline=deadline)
+    posts = fetch_posts_by_ids(post_ids, max_comments=max_comments, deadline=deadline)
     return posts, cleaned_query
  
 # Uses AI to determine subreddits, then uses DuckDuckGo to find relevant Reddit post IDs
-def get_reddit_post_ids_from_ai(query: str, max_results: int = 50, metric: str = "all", subreddit: str = None) -> List[str]:
+def get_reddit_post_ids_from_ai(query: str, max_results: int = 50, metric: str = "all", subreddit: str = None, deadline: float = None) -> List[str]:
     
     if not subreddit:
         subreddits, cleaned_query = get_relevant_subreddits_from_ai(query, max_subreddits=3)
@@ -98,6 +125,9 @@ def get_reddit_post_ids_from_ai(query: str, max_results: int = 50, metric: str =
     
     # For each post id clean the query to pass into DDG
     for idx, subreddit in enumerate(subreddits):
+        # Out of time: skip the remaining subreddits
+        if deadline and time.time() > deadline:
+            break
         fetch_limit = limits[idx]
         if subreddit.startswith("r/"):
             subreddit = subreddit[2:]   # eliminate the leading 'r/' if present
@@ -106,16 +136,15 @@ def get_reddit_post_ids_from_ai(query: str, max_results: int = 50, metric: str =
             ddg_query += f" {time_keywords}"
         
         # Search DuckDuckGo for Reddit posts in the specified subreddit
-        with DDGS() as ddgs:
-            results = ddgs.text(ddg_query, max_results=fetch_limit)
-            for r in results:
-                # More flexible regex that handles various Reddit URL formats
-                match = re.search(r"reddit\.com/r/[^/]+/comments/([a-zA-Z0-9_-]{5,})", r["href"])
-                if match:
-                    post_ids.append(match.group(1))
-                else:
-                    # Try alternative patterns for edge cases
-                    alt_match = re.search(r"reddit\.com/(?:r/[^/]+/)?comments/([a-zA-Z0-9_-]{5,})", r["href"])
-                    if alt_match:
-                        post_ids.append(alt_match.group(1))
+        results = web_search(ddg_query, max_results=fetch_limit)
+        for r in results:
+            # More flexible regex that handles various Reddit URL formats
+            match = re.search(r"reddit\.com/r/[^/]+/comments/([a-zA-Z0-9_-]{5,})", r["href"])
+            if match:
+                post_ids.append(match.group(1))
+            else:
+                # Try alternative patterns for edge cases
+                alt_match = re.search(r"reddit\.com/(?:r/[^/]+/)?comments/([a-zA-Z0-9_-]{5,})", r["href"])
+                if alt_match:
+                    post_ids.append(alt_match.group(1))
     return post_ids, cleaned_query
\ No newline at end of file
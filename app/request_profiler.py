@@ -0,0 +1,189 @@
+import contextvars
+import functools
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.config import PROFILE_ADMIN_TOKEN, PROFILE_SAMPLE_RATE, PROFILE_DIR, PROFILE_INTERVAL_MS
+
+# On-demand profiling of slow requests in production.
+# A request is profiled when it carries the admin header (X-Profile-Token: <PROFILE_ADMIN_TOKEN>), or at random with
+# probability PROFILE_SAMPLE_RATE. The handlers decorated with @profiled then run under a sampling profiler, and each
+# profile is saved to PROFILE_DIR as two files:
+#   <id>.folded   collapsed stacks ("frame;frame;frame count"), ready for flamegraph.pl, speedscope or inferno
+#   <id>.json     endpoint, query, duration, trigger and the time spent in each stage (see stage())
+# The profile id is returned in the X-Profile-Id response header.
+
+PROFILE_HEADER = "x-profile-token"
+PROFILE_ID_HEADER = "x-profile-id"
+
+# Profile of the current request ({"trigger", "path", "query", "id", "stages"}), None when it is not profiled.
+# Set by ProfileMiddleware; sync handlers run in a worker thread with a copy of the request's context, so they see it.
+_current = contextvars.ContextVar("request_profile", default=None)
+
+
+# Samples the stacks of the handler's thread, and of the threads it starts (fetchers, pipeline), at a fixed interval
+class SamplingProfiler:
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._baseline = set(sys._current_frames()) - {thread_id}   # Threads that existed before the handler started
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or thread_id in self._baseline:
+                    continue
+                root = "handler" if thread_id == self.thread_id else names.get(thread_id, f"thread-{thread_id}")
+                self.stacks[";".join([root] + frame_names(frame))] += 1
+            self.samples += 1
+
+
+# Frames of a stack, outermost first: "function (path:first line)"
+def frame_names(frame) -> list[str]:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({short_path(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return names[::-1]
+
+
+# Paths relative to the app, or to site-packages for libraries ("praw/models/reddit/submission.py"); stdlib by file name
+def short_path(filename: str) -> str:
+    if "site-packages" in filename:
+        return filename.split("site-packages" + os.sep, 1)[-1]
+    path = os.path.relpath(filename) if os.path.isabs(filename) else filename
+    return os.path.basename(filename) if path.startswith("..") else path
+
+
+# Time a stage of the current request (added up if the stage runs several times). Does nothing when not profiling.
+@contextmanager
+def stage(name: str):
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile["stages"][name] = profile["stages"].get(name, 0) + time.perf_counter() - start
+
+
+def save_profile(endpoint: str, profile: dict, profiler: SamplingProfiler, duration: float) -> None:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, profile["id"])
+    with open(f"{base}.folded", "w", encoding="utf-8") as f:
+        for stack, count in profiler.stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    with open(f"{base}.json", "w", encoding="utf-8") as f:
+        json.dump({
+            "id": profile["id"],
+            "endpoint": endpoint,
+            "path": profile["path"],
+            "query": profile["query"],
+            "trigger": profile["trigger"],
+            "started_at": profile["started_at"],
+            "duration_seconds": round(duration, 4),
+            "interval_ms": PROFILE_INTERVAL_MS,
+            "samples": profiler.samples,
+            "stages": {name: round(seconds, 4) for name, seconds in profile["stages"].items()},
+            "folded": f"{profile['id']}.folded",
+        }, f, indent=2)
+    print(f"Profile saved: {base}.json ({profiler.samples} samples, {duration:.2f}s)")
+
+
+# Run a (sync) endpoint under the sampling profiler when its request was selected for profiling
+def profiled(endpoint: str):
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            profile = _current.get()
+            if profile is None:
+                return handler(*args, **kwargs)
+
+            profile["id"] = f"{time.strftime('%Y%m%d-%H%M%S')}_{endpoint}_{uuid.uuid4().hex[:8]}"
+            profile["started_at"] = time.time()
+            profiler = SamplingProfiler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000)
+            profiler.start()
+            start = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                duration = time.perf_counter() - start
+                profiler.stop()
+                try:
+                    save_profile(endpoint, profile, profiler, duration)
+                except OSError as e:
+                    print(f"Error saving profile {profile['id']}: {e}")
+        return wrapper
+    return decorator
+
+
+# Selects the requests to profile and reports their profile id in the response headers
+class ProfileMiddleware:
+
+    def __init__(self, app, paths: tuple = ("/query", "/summary")):
+        self.app = app
+        self.paths = paths
+
+    def trigger(self, scope) -> str:
+        token = Headers(scope=scope).get(PROFILE_HEADER)
+        if token and PROFILE_ADMIN_TOKEN and hmac.compare_digest(token, PROFILE_ADMIN_TOKEN):
+            return "header"
+        if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        trigger = self.trigger(scope)
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile = {
+            "trigger": trigger,
+            "path": scope["path"],
+            "query": scope.get("query_string", b"").decode("latin-1"),
+            "id": None,
+            "stages": {},
+        }
+        token = _current.set(profile)
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start" and profile["id"]:
+                MutableHeaders(scope=message)[PROFILE_ID_HEADER] = profile["id"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            _current.reset(token)
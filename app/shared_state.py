@@ -0,0 +1,62 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+# Small key/value store with expiry in a local SQLite file, shared by every worker process of the app
+# (uvicorn --workers N): the posts served per query (read back by /summary), generated summaries and the negative cache.
+# Values are stored as JSON. WAL mode lets the workers read while one of them writes.
+class SharedState:
+
+    # Expired rows are purged every this many writes
+    PURGE_EVERY = 500
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()   # sqlite connections are shared between request threads
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS shared_state ("
+            "namespace TEXT NOT NULL, "
+            "key TEXT NOT NULL, "
+            "value TEXT NOT NULL, "
+            "expires_at REAL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        self._conn.commit()
+
+    # Stored value, or None if missing or expired
+    def get(self, namespace: str, key: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM shared_state WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, key, time.time()),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # Store a value, expiring after ttl seconds (never if ttl is None)
+    def set(self, namespace: str, key: str, value, ttl: float = None) -> None:
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO shared_state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), expires_at),
+            )
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                self._conn.execute("DELETE FROM shared_state WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+            self._conn.commit()
+
+    # Keep at most max_entries rows of a namespace: expired rows go first, then the ones expiring soonest
+    def trim(self, namespace: str, max_entries: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM shared_state WHERE namespace = ? AND key NOT IN ("
+                "SELECT key FROM shared_state WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?) "
+                "ORDER BY expires_at IS NULL DESC, expires_at DESC LIMIT ?)",
+                (namespace, namespace, time.time(), max_entries),
+            )
+            self._conn.commit()
@@ -1,13 +1,14 @@
 from ddgs import DDGS
 import re
 from collections import Counter
-from app.config import OPENAI_KEY
+from app.config import OPENAI_KEY, OPENAI_BASE_URL, SUBREDDIT_ROUTER_MIN_CONFIDENCE
+from app.subreddit_router import router
 from openai import OpenAI
 import ast
 import json
 import os
 
-client = OpenAI(api_key=OPENAI_KEY)
+client = OpenAI(api_key=OPENAI_KEY, base_url=OPENAI_BASE_URL)
 
 # Load gaming abbreviations from a JSON file
 # The JSON file contains abbreviations for 300+ games, which is now unnecessary but still kept for potential future expansion.
@@ -17,10 +18,20 @@ def load_gaming_abbreviations():
         abbreviations = json.load(f)
     return abbreviations
 
+# Provides relevant subreddit names based on a query, and the query cleaned of the part naming the game / subreddit.
+# Routed locally (app/subreddit_router.py) when the game is recognised with enough confidence; the OpenAI API is
+# only asked for the remaining queries.
+def get_relevant_subreddits_from_ai(query: str, max_subreddits: int = 3, subreddit:str = None) -> list[str]:
+    route = router.route(query, max_subreddits=max_subreddits, subreddit=subreddit)
+    if route["subreddits"] and route["confidence"] >= SUBREDDIT_ROUTER_MIN_CONFIDENCE:
+        print(f"Routed locally ({route['match']}, confidence {route['confidence']:.2f}): {route['subreddits']}")
+        return route["subreddits"], route["cleaned_query"]
+    return get_relevant_subreddits_from_llm(query, max_subreddits=max_subreddits, subreddit=subreddit)
+
+
 # Provides relevant subreddit names based on a query using OpenAI API
 # Created before narrowing scope to 2 games
-# Could be replaced with hard coded subreddits as now only 2 games with 2 subreddits each are used.
-def get_relevant_subreddits_from_ai(query: str, max_subreddits: int = 3, subreddit:str = None) -> list[str]:
+def get_relevant_subreddits_from_llm(query: str, max_subreddits: int = 3, subreddit:str = None) -> list[str]:
 
     abbreviations = load_gaming_abbreviations()
     query_words = query.split(" ")
@@ -0,0 +1,132 @@
+import difflib
+import json
+import os
+import re
+
+from app.game_matcher import matcher as game_matcher
+
+# Local subreddit routing: maps a query to the subreddits of the games it mentions, without an LLM round trip.
+# Games and their subreddits come from data/subreddit_index.json (maintained by hand). Each game is recognised by:
+#   - its name, aliases and abbreviations, found by the game matcher (app/game_matcher.py)
+#   - close misspellings of names and aliases (fuzzy matching), with a lower confidence
+# An explicit "r/<subreddit>" in the query is routed to that subreddit.
+# The matched words are removed from the query, which is then searched inside the subreddits.
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+# Minimum similarity (difflib ratio) for a misspelled name to count as a match; the match confidence is the ratio
+FUZZY_MIN_RATIO = 0.85
+
+# Names shorter than this are only matched exactly
+FUZZY_MIN_LENGTH = 8
+
+DANGLING_WORDS = {"in", "for", "of", "on", "from", "about", "the", "and", "vs", "or"}
+
+SUBREDDIT_PATTERN = re.compile(r"(?:^|\s)/?r/([A-Za-z0-9_]{2,21})\b")
+TOKEN_PATTERN = re.compile(r"\S+")
+
+
+def normalize(text: str) -> str:
+    return " ".join(re.sub(r"[^a-z0-9 ]+", " ", text.lower().replace("'", "").replace("’", "")).split())
+
+
+class SubredditRouter:
+
+    def __init__(self, index_path: str = os.path.join(DATA_DIR, "subreddit_index.json")):
+        with open(index_path, "r") as f:
+            self.games = json.load(f)
+
+        self.by_abbreviation = {game["abbreviation"]: game for game in self.games}
+        self.names = {}           # normalized name or alias -> game (for fuzzy matching)
+        for game in self.games:
+            for name in [game["game"]] + game.get("aliases", []):
+                self.names[normalize(name)] = game
+
+        self.max_name_words = max(len(name.split()) for name in self.names)
+        self.fuzzy_names = [name for name in self.names if len(name) >= FUZZY_MIN_LENGTH]
+
+    # Games of the index named in the text: (matches, tokens that are not part of a match), like scan()
+    def exact_matches(self, text: str) -> tuple[list, list]:
+        found = [match for match in game_matcher.find(text) if match.game in self.by_abbreviation]
+        tokens = list(TOKEN_PATTERN.finditer(text))
+
+        def covers(match, token) -> bool:
+            return token.start() < match.end and match.start < token.end()
+
+        matches = [(self.by_abbreviation[match.game], sum(covers(match, token) for token in tokens), 1.0, "exact") for match in found]
+        kept = [token.group() for token in tokens if not any(covers(match, token) for match in found)]
+        return matches, kept
+
+    # Closest misspelled name or alias starting at tokens[start]: (game, n, confidence, kind) or None
+    def fuzzy_match_at(self, tokens: list[str], normalized: list[str], start: int):
+        best = None
+        for n in range(min(self.max_name_words + 1, len(normalized) - start), 0, -1):
+            phrase = " ".join(normalized[start:start + n])
+            if len(phrase) < FUZZY_MIN_LENGTH:
+                continue
+            for name in self.fuzzy_names:
+                if abs(len(name) - len(phrase)) > 3:
+                    continue
+                ratio = difflib.SequenceMatcher(None, phrase, name).ratio()
+                if ratio >= FUZZY_MIN_RATIO and (best is None or ratio > best[2]):
+                    best = (self.names[name], n, ratio, "fuzzy")
+        return best
+
+    # Walk the query left to right: (matches, tokens that are not part of a match)
+    def scan(self, tokens: list[str], normalized: list[str], match_fn) -> tuple[list, list]:
+        matches, kept = [], []
+        i = 0
+        while i < len(tokens):
+            match = match_fn(tokens, normalized, i)
+            if match:
+                matches.append(match)
+                i += match[1]
+            else:
+                kept.append(tokens[i])
+                i += 1
+        return matches, kept
+
+    # {"subreddits", "cleaned_query", "confidence", "games", "match"}. Confidence 0 when no game was recognised.
+    def route(self, query: str, max_subreddits: int = 3, subreddit: str = None) -> dict:
+        explicit = [subreddit] if subreddit else SUBREDDIT_PATTERN.findall(query)
+        remaining = SUBREDDIT_PATTERN.sub(" ", query)
+
+        matches, kept = self.exact_matches(remaining)
+        if not matches and not explicit:   # Fuzzy matching only when nothing matched exactly
+            tokens = TOKEN_PATTERN.findall(remaining)
+            normalized = [normalize(token) for token in tokens]
+            matches, kept = self.scan(tokens, normalized, self.fuzzy_match_at)
+
+        games = list({id(game): game for game, _, _, _ in matches}.values())
+        subreddits = list(explicit)
+        # Interleave the games' subreddits (each game's main subreddit first), without repeats.
+        # A subreddit given by the caller is used alone.
+        for position in range(0 if subreddit else max((len(game["subreddits"]) for game in games), default=0)):
+            for game in games:
+                if position < len(game["subreddits"]) and game["subreddits"][position].lower() not in {s.lower() for s in subreddits}:
+                    subreddits.append(game["subreddits"][position])
+
+        if explicit:
+            confidence, kind = 1.0, "explicit"
+        elif matches:
+            confidence = min(match_confidence for _, _, match_confidence, _ in matches)
+            kind = "fuzzy" if any(match_kind == "fuzzy" for _, _, _, match_kind in matches) else "exact"
+        else:
+            confidence, kind = 0.0, None
+
+        # Connecting words left dangling by the removal ("best bow in <game>" -> "best bow")
+        while kept and normalize(kept[-1]) in DANGLING_WORDS:
+            kept.pop()
+        while kept and normalize(kept[0]) in DANGLING_WORDS:
+            kept.pop(0)
+        cleaned_query = " ".join(kept) or query.strip()
+        return {
+            "subreddits": subreddits[:max_subreddits],
+            "cleaned_query": cleaned_query,
+            "confidence": confidence,
+            "games": [game["abbreviation"] for game in games],
+            "match": kind,
+        }
+
+
+router = SubredditRouter()
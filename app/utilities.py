@@ -3,9 +3,12 @@ import html
 #from transformers import AutoTokenizer, AutoModelForSequenceClassification, pipeline
 from openai import OpenAI
 
-from app.config import OPENAI_KEY
+from app.config import OPENAI_KEY, OPENAI_BASE_URL
+from app.context_packer import format_posts_for_prompt
+from app.post_digests import format_digests_for_prompt
+from app.game_matcher import matcher as game_matcher
 
-client = OpenAI(api_key=OPENAI_KEY)
+client = OpenAI(api_key=OPENAI_KEY, base_url=OPENAI_BASE_URL)
 
 # Format post content for better HTML display, especially Reddit tables
 def enhance_post_content_for_html(content) -> str:
@@ -215,38 +218,18 @@ def markdown_to_html(text) -> str:
     return text
     
 # Generates a comprehensive answer to the user's query based on all posts using OpenAI
-def post_summary_generation(posts, query) -> str:
+# With use_digests, the answer is built from each post's precomputed digest instead of its raw content and comments.
+def post_summary_generation(posts, query, use_digests: bool = False) -> str:
     try:
-        # Build structured content from all posts
-        all_posts_content = []
-        
-        for i, post in enumerate(posts, 1):
-            post_group = f"POST {i}:\n"
-            post_group += f"Title: {post.get('title', 'No title')}\n"
-            
-            content = post.get('content', '').strip()
-            if content:
-                post_group += f"Content: {content}\n"
-            else:
-                post_group += "Content: No content available\n"
-            
-            comments = post.get('comments', [])
-            if comments:
-                post_group += "Comments:\n"
-                for j, comment in enumerate(comments[:5], 1):  # Limit to top 5 comments per post
-                    post_group += f"  {j}. {comment.strip()}\n"
-            else:
-                post_group += "Comments: No comments available\n"
-            
-            post_group += "\n" + "-"*50 + "\n\n"
-            all_posts_content.append(post_group)
-        
-        # Combine all posts into single content block
-        combined_content = "".join(all_posts_content)
-        
         # Create the prompt
         prompt = f"User Query: '{query}'\n\n"
-        prompt += "Below are Reddit posts with their titles, content, and comments:\n\n"
+        if use_digests:
+            combined_content = format_digests_for_prompt(posts)
+            prompt += "Below are digests of Reddit posts, each summarizing the post's content and its top comments:\n\n"
+        else:
+            # Build structured content from all posts (titles, content and up to 5 comments each)
+            combined_content = format_posts_for_prompt(posts)
+            prompt += "Below are Reddit posts with their titles, content, and comments:\n\n"
         prompt += combined_content
         prompt += "Based on ALL the information above from these Reddit posts, provide a comprehensive answer to the user's query. "
         prompt += "Include relevant details from titles, content, and comments. "
@@ -289,20 +272,9 @@ def post_summary_generation(posts, query) -> str:
     
 
 # Detect which game the query is about based on phrases in the query, returns the abbreviation of the game.
+# The first supported game mentioned wins (see app/game_matcher.py).
 def detect_game_from_query(query: str) -> str:
-
-    query_lower = query.lower()
-    
-    # if term (right) is in the query, return the game abbreviation (left)
-    game_detection = {
-        'BOTW': ['botw', 'breath of the wild'],
-        'TOTK': ['totk', 'tears of the kingdom'],
-    }
-    
-    for game_abbrev, terms in game_detection.items():
-        for term in terms:
-            if term in query_lower:
-                print(f"Detected game {game_abbrev} from query term: {term}")
-                return game_abbrev
-    
-    return None
\ No newline at end of file
+    game = game_matcher.analyze(query).game
+    if game:
+        print(f"Detected game {game} from query")
+    return game
\ No newline at end of file